@@ -0,0 +1,178 @@
+"""
+Parser for the free-text eligibility criteria of ClinicalTrials.gov studies.
+
+The text is turned once per study version into a compact tree that is stored
+with the cached study record:
+
+    [[kind, title, [[depth, text], ...]], ...]
+
+one entry per section, where kind is INCLUSION or EXCLUSION, title is the
+section header when it is not a plain "Inclusion/Exclusion Criteria" (e.g.
+"Key Inclusion Criteria for Part B") and the items are the criteria in order
+with their nesting depth (0 for top-level bullets, 1 for sub-bullets, ...).
+
+Headers are recognized in their common variants ("Key Inclusion Criteria",
+"INCLUSION CRITERIA FOR COHORT A:", "Exclusion:"), bullets by their marker
+(*, -, •, 1., 1), (a), ii., ...) and indentation. Text before the first header,
+or all of it when there is none, counts as inclusion criteria. A plain line
+ending with a colon ("Patients must have:") takes the bullets below it as
+sub-items.
+
+The endpoints render slices of the tree with render(), numbering nested
+items hierarchically (1., 1.1., 1.1.1.).
+"""
+import re
+
+INCLUSION = "i"
+EXCLUSION = "e"
+
+# Header of a criteria section; group "after" holds text following the colon
+_HEADER = re.compile(
+    r"^[\s*#_>-]*"
+    r"(?P<title>(?:(?:key|main|major|general|additional|specific|other|further|study|trial)\s+)*"
+    r"(?P<kind>inclusion|exclusion)(?:\s+criteria|\s+criterion)?(?P<qualifier>[^:]{0,60}))"
+    r"(?P<colon>:)?\s*(?P<after>.*)$",
+    re.IGNORECASE,
+)
+_PLAIN_TITLE = re.compile(r"^(?:inclusion|exclusion)(?:\s+criteria)?$", re.IGNORECASE)
+# Header lines that do not start a section of their own
+_GENERIC_HEADER = re.compile(r"^[\s*#_>-]*(?:eligibility\s+)?criteria\s*:?\s*$", re.IGNORECASE)
+_BULLET = re.compile(
+    r"^(?P<indent>[ \t]*)"
+    r"(?P<marker>[*+•·▪◦‣⁃-]|o(?=\s)|\(?\d{1,2}[.)](?!\d)|\(?[a-z]{1,4}[.)])"
+    r"\s+(?P<text>\S.*)$",
+    re.IGNORECASE,
+)
+_ROMAN = re.compile(r"^(?:i{1,3}|iv|vi{0,3}|ix|x)$", re.IGNORECASE)
+_EMPHASIS = re.compile(r"\*\*|__")
+
+
+def _marker_class(marker, indent, stack):
+    """Classify a bullet marker so siblings can be told from sub-bullets"""
+    bare = marker.strip("().")
+    if bare.isdigit():
+        return "number"
+    if bare.isalpha() and len(marker) > 1:
+        # "i." is a roman numeral unless it continues an a., b., ... list at this indent
+        if _ROMAN.match(bare) and (indent, "alpha") not in stack and (len(bare) > 1 or bare.lower() == "i"):
+            return "roman"
+        if len(bare) == 1:
+            return "alpha"
+        return None
+    return marker
+
+
+def _header(line):
+    """Return (kind, title, text after the colon) if the line is a section header"""
+    match = _HEADER.match(_EMPHASIS.sub("", line))
+    if not match:
+        return None
+    title = match.group("title").strip()
+    qualifier = match.group("qualifier").strip()
+    after = match.group("after").strip()
+    # "Exclusion of patients with ..." is a criterion, not a header
+    if not match.group("colon"):
+        if qualifier or after:
+            return None
+    elif qualifier and "criteri" not in title.lower():
+        return None
+    kind = INCLUSION if match.group("kind").lower() == "inclusion" else EXCLUSION
+    return kind, None if _PLAIN_TITLE.match(title) else title, after
+
+
+def parse(text):
+    """
+    Parse eligibility criteria text into the compact section tree
+
+    Returns:
+        List of [kind, title or None, [[depth, text], ...]] sections
+    """
+    sections = []
+    items = None
+    stack = []  # (indent, marker class) of the open bullet levels
+    last_indent = 0
+
+    def open_section(kind, title):
+        nonlocal items, stack
+        items = []
+        stack = []
+        sections.append([kind, title, items])
+
+    for line in (text or "").replace("\r\n", "\n").split("\n"):
+        if not line.strip() or _GENERIC_HEADER.match(line):
+            continue
+        header = _header(line)
+        if header:
+            kind, title, after = header
+            open_section(kind, title)
+            if after:
+                items.append([0, after])
+            continue
+        if items is None:
+            open_section(INCLUSION, None)
+
+        bullet = _BULLET.match(line)
+        marker_class = None
+        if bullet:
+            indent = len(bullet.group("indent").expandtabs(4))
+            marker_class = _marker_class(bullet.group("marker"), indent, stack)
+        if marker_class is None:
+            content = _EMPHASIS.sub("", line).strip()
+            indent = len(line) - len(line.lstrip())
+            if items and stack and indent > last_indent:
+                # Wrapped continuation of the previous bullet
+                items[-1][1] = f"{items[-1][1]} {content}"
+                continue
+            items.append([0, content])
+            # "Patients must have:" introduces the bullets that follow
+            stack = [(-1, "text")] if content.endswith(":") else []
+            last_indent = indent
+            continue
+
+        key = (indent, marker_class)
+        if key in stack:
+            del stack[stack.index(key):]
+        else:
+            while stack and stack[-1][0] > indent:
+                stack.pop()
+        items.append([len(stack), _EMPHASIS.sub("", bullet.group("text")).strip()])
+        stack.append(key)
+        last_indent = indent
+
+    return sections
+
+
+def entries(tree, kind):
+    """
+    Yield (label, depth, text) for the items of all sections of a kind
+
+    label is the hierarchical number of an item ("2.1.") or None for the
+    title of a further section of the same kind.
+    """
+    counters = []
+    first = True
+    for section_kind, title, items in tree or []:
+        if section_kind != kind:
+            continue
+        if title and not first:
+            yield None, 0, title
+        first = False
+        for depth, text in items:
+            del counters[depth + 1:]
+            counters.extend([0] * (depth + 1 - len(counters)))
+            counters[depth] += 1
+            yield ".".join(str(n) for n in counters) + ".", depth, text
+
+
+def has_section(tree, kind):
+    return any(section[0] == kind for section in tree or [])
+
+
+def render(tree, kind):
+    """Numbered criteria strings of a kind, e.g. ["1. Age >= 18", "1.1. ..."]"""
+    return [text if label is None else f"{label} {text}" for label, _, text in entries(tree, kind)]
+
+
+def texts(tree, kind):
+    """Plain criteria texts of a kind, aligned with render()"""
+    return [text for _, _, text in entries(tree, kind)]
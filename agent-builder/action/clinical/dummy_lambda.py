@@ -1,17 +1,115 @@
+import http.client
 import json
 import logging
-import requests
-from typing import Dict, Any, List, Optional
+import os
+import random
+import re
+import time
+import urllib.parse
+from typing import Dict, Any, List, Optional, Tuple
+
+import http_pool
+from http_pool import HTTPStatusError
+from response_packer import pack
+from singleflight import SingleFlight
+import criteria_parser
+from criteria_parser import EXCLUSION, INCLUSION
+from eligibility import CandidateColumns, compile_predicates, rank
+from geo import rank_closest
+from gazetteer import LazyGazetteer
+from study_cache import StudyCache, study_nct_id
+from study_pages import ContinuationError, collect
+from trials_mirror import LazyMirror, UnsupportedQuery, is_page_token
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Print requests version to verify it's imported correctly
-logger.info(f"Requests library version: {requests.__version__}")
-
 # Constants
 BASE_URL = "https://clinicaltrials.gov/api/v2/studies"
 
+# Per-request timeout (seconds) for ClinicalTrials.gov calls
+REQUEST_TIMEOUT = float(os.environ.get("CLINICAL_REQUEST_TIMEOUT", "10"))
+
+# Retries for throttled, failed (5xx) or dropped requests, with exponential backoff
+MAX_RETRIES = 2
+RETRY_BASE_DELAY = 0.5
+MAX_RETRY_DELAY = 5.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Maximum response body size in bytes (Bedrock rejects responses over 25KB)
+MAX_RESPONSE_SIZE = 20 * 1024
+
+# NCT IDs per batched studies request (filter.ids)
+NCT_BATCH_SIZE = 100
+
+# Default search radius for /closest_trials in kilometers
+DEFAULT_MAX_DISTANCE_KM = 500
+
+# Trials returned by /search_trials by default and at most
+DEFAULT_SEARCH_RESULTS = 10
+MAX_SEARCH_RESULTS = 50
+
+# Studies per upstream page when client-side filters drop some of them
+FILTERED_PAGE_SIZE = 50
+
+# Time (seconds) kept back from the Lambda deadline to build the response
+DEADLINE_MARGIN = 1.0
+
+# Trials returned by /match_patient
+MAX_MATCH_RESULTS = 20
+
+# Fields of the per-trial summary returned by /search_trials with include_summary
+SUMMARY_FIELDS = [
+    "protocolSection.statusModule.overallStatus",
+    "protocolSection.designModule.phases",
+    "protocolSection.conditionsModule.conditions",
+    "protocolSection.sponsorCollaboratorsModule.leadSponsor.name",
+    "protocolSection.statusModule.startDateStruct",
+    "protocolSection.statusModule.primaryCompletionDateStruct"
+]
+
+# Bytes of the response body kept free for everything but the trials list
+SEARCH_RESPONSE_RESERVE = 512
+
+# Ways of shortening trial summaries that do not fit, applied in turn:
+# (description, conditions kept, title characters kept, keep dates)
+SUMMARY_TRUNCATION_STEPS = [
+    ("conditions limited to 3 per trial", 3, None, True),
+    ("conditions limited to 1 per trial, titles shortened", 1, 100, True),
+    ("conditions and dates omitted, titles shortened", 0, 60, False),
+]
+
+# Top search hits whose details and criteria are prefetched before /search_trials
+# returns (0 disables), and the time (seconds) and decoded size (bytes) budget of
+# that fetch; the time budget is added to the search latency at most
+PREFETCH_COUNT = int(os.environ.get("CLINICAL_PREFETCH_COUNT", "5"))
+PREFETCH_TIMEOUT = float(os.environ.get("CLINICAL_PREFETCH_TIMEOUT", "0.3"))
+PREFETCH_MAX_BYTES = int(os.environ.get("CLINICAL_PREFETCH_MAX_BYTES", str(256 * 1024)))
+# Skip the prefetch when the search itself used more than this share of the
+# Lambda time budget
+PREFETCH_MAX_SEARCH_SHARE = float(os.environ.get("CLINICAL_PREFETCH_MAX_SEARCH_SHARE", "0.5"))
+
+# Nearest trials returned by /closest_trials
+MAX_CLOSEST_TRIALS = 20
+
+# Offline gazetteer used to geocode user locations; opened on first use
+GAZETTEER_PATH = os.environ.get(
+    "GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.bin")
+)
+gazetteer = LazyGazetteer(GAZETTEER_PATH)
+
+# Optional local mirror of the registry (see trials_mirror.py); queries it can
+# answer never reach ClinicalTrials.gov
+MIRROR_PATH = os.environ.get("CLINICAL_MIRROR_PATH")
+mirror = LazyMirror(MIRROR_PATH)
+
+# Parameters of a plain lookup by NCT ID; studies of such a lookup that the
+# mirror does not have yet are fetched from the API
+ID_LOOKUP_PARAMS = {"format", "fields", "pageSize", "countTotal", "filter.ids"}
+
+# Identical concurrent queries share one ClinicalTrials.gov call
+in_flight = SingleFlight("clinical")
+
 def lambda_handler(event, context):
     """AWS Lambda handler for processing Bedrock agent requests."""
     try:
@@ -33,10 +131,36 @@ def lambda_handler(event, context):
                 lead_sponsor_name=param_dict.get('lead_sponsor_name'),
                 disease_area=param_dict.get('disease_area'),
                 overall_status=param_dict.get('overall_status'),
-                location_country=param_dict.get('location_country')
+                location_country=param_dict.get('location_country'),
+                phase=param_dict.get('phase'),
+                start_date_from=param_dict.get('start_date_from'),
+                start_date_to=param_dict.get('start_date_to'),
+                max_results=param_dict.get('max_results'),
+                page_token=param_dict.get('page_token'),
+                include_summary=str(param_dict.get('include_summary', '')).lower() == 'true',
+                context=context
             )
         elif api_path == '/trial_details':
             result = get_trial_details(nct_id=param_dict.get('nct_id'))
+        elif api_path == '/batch_trial_details':
+            result = get_trial_details_batch(nct_ids=parse_id_list(param_dict.get('nct_ids')))
+        elif api_path == '/closest_trials':
+            result = get_closest_trials(
+                nct_ids=parse_id_list(param_dict.get('nct_ids')),
+                city=param_dict.get('city'),
+                state=param_dict.get('state'),
+                zip_code=param_dict.get('zip_code'),
+                country=param_dict.get('country'),
+                max_distance=param_dict.get('max_distance')
+            )
+        elif api_path == '/match_patient':
+            result = match_patient(
+                nct_ids=parse_id_list(param_dict.get('nct_ids')),
+                age=param_dict.get('age'),
+                sex=param_dict.get('sex'),
+                conditions=parse_text_list(param_dict.get('conditions')),
+                prior_therapies=parse_text_list(param_dict.get('prior_therapies'))
+            )
         elif api_path == '/inclusion_criteria':
             result = get_inclusion_criteria(nct_id=param_dict.get('nct_id'))
         elif api_path == '/exclusion_criteria':
@@ -44,9 +168,14 @@ def lambda_handler(event, context):
         else:
             result = {"error": f"Unsupported API path: {api_path}"}
         
+        # Fit the body into the size budget in a single serialization pass
+        body, truncation = pack(result, MAX_RESPONSE_SIZE)
+        if truncation:
+            logger.info(f"Response truncated to fit {MAX_RESPONSE_SIZE} bytes: {truncation}")
+        
         response_body = {
             'application/json': {
-                'body': result
+                'body': body
             }
         }
         
@@ -64,6 +193,9 @@ def lambda_handler(event, context):
         }
         
         logger.info(f"Response prepared")
+        logger.info(f"Single-flight stats: {json.dumps(in_flight.stats())}")
+        logger.info(f"Study cache stats: {json.dumps(study_cache.stats())}")
+        logger.info(f"HTTP pool stats: {json.dumps(http_pool.pool_stats())}")
         return response
         
     except KeyError as e:
@@ -83,14 +215,37 @@ def search_trials(
     lead_sponsor_name: Optional[str] = None,
     disease_area: Optional[str] = None,
     overall_status: Optional[str] = None,
-    location_country: Optional[str] = None
-) -> List[Dict]:
-    """Search for clinical trials based on criteria."""
+    location_country: Optional[str] = None,
+    phase: Optional[str] = None,
+    start_date_from: Optional[str] = None,
+    start_date_to: Optional[str] = None,
+    max_results: Optional[Any] = None,
+    page_token: Optional[str] = None,
+    include_summary: bool = False,
+    context=None
+) -> Dict:
+    """
+    Search for clinical trials based on criteria.
+    
+    Pages of the studies API are streamed until max_results trials pass the
+    phase and start date filters (applied here, not upstream), the results
+    run out or the Lambda deadline approaches. next_page_token resumes the
+    same search where this call stopped.
+    
+    With include_summary, each trial also carries status, phase, conditions,
+    sponsor and dates from a wider projection of the same requests, shortened
+    as needed to fit the response size limit.
+    """
+    try:
+        limit = min(max(int(max_results), 1), MAX_SEARCH_RESULTS) if max_results not in (None, "") else DEFAULT_SEARCH_RESULTS
+    except (TypeError, ValueError):
+        limit = DEFAULT_SEARCH_RESULTS
+    
     fields = [
         "protocolSection.identificationModule.nctId",
         "protocolSection.identificationModule.briefTitle",
     ]
-    params = {"format": "json", "fields": ",".join(fields), "pageSize": 10}
+    params = {"format": "json"}
     
     if disease_area:
         params["query.cond"] = disease_area.replace(" ", "+")
@@ -101,12 +256,43 @@ def search_trials(
     if overall_status:
         params["filter.overallStatus"] = overall_status.upper()
     
-    logger.info(f"Searching trials with params: {params}")
-    response = requests.get(BASE_URL, params=params)
-    data = response.json()
+    filters = {}
+    if phase:
+        filters["phase"] = normalize_phase(phase)
+        fields.append("protocolSection.designModule.phases")
+    if start_date_from or start_date_to:
+        filters["start_date"] = [start_date_from or None, start_date_to or None]
+        fields.append("protocolSection.statusModule.startDateStruct")
+    if include_summary:
+        fields.extend(SUMMARY_FIELDS)
+    params["fields"] = ",".join(dict.fromkeys(fields))
+    
+    started = time.monotonic()
+    deadline = None
+    if context is not None:
+        deadline = started + context.get_remaining_time_in_millis() / 1000 - DEADLINE_MARGIN
+    
+    logger.info(f"Searching trials with params: {params}, filters: {filters}")
+    try:
+        studies, next_page_token, stats = collect(
+            fetch_studies,
+            params,
+            limit=limit,
+            page_size=FILTERED_PAGE_SIZE if filters else limit,
+            matches=(lambda study: matches_search_filters(study, filters)) if filters else None,
+            filters=filters,
+            continuation=page_token,
+            deadline=deadline
+        )
+    except ContinuationError as e:
+        logger.warning(f"Rejected page token: {str(e)}")
+        return {"error": str(e)}
     
     trials = []
-    for study in data.get("studies", []):
+    for study in studies:
+        if include_summary:
+            trials.append(build_trial_details(study))
+            continue
         nct_id = get_nested_value(study, ["protocolSection", "identificationModule", "nctId"])
         trial = {
             "nct_id": nct_id,
@@ -115,34 +301,189 @@ def search_trials(
         }
         trials.append(trial)
     
-    logger.info(f"Found {len(trials)} trials")
-    return trials
+    logger.info(f"Found {len(trials)} trials: {stats}")
+    summary_truncation = None
+    if include_summary:
+        trials, summary_truncation = fit_summaries(trials, MAX_RESPONSE_SIZE - SEARCH_RESPONSE_RESERVE)
+        if summary_truncation:
+            logger.info(f"Trial summaries shortened: {summary_truncation}")
+    
+    # The agent usually asks for details and criteria of the top hits next.
+    # Prefetch them now, within a small time budget: a background thread would
+    # be frozen with the container once the handler returns.
+    if PREFETCH_COUNT > 0 and trials:
+        prefetch_top_hits([trial["nct_id"] for trial in trials[:PREFETCH_COUNT]], started, deadline)
+    
+    result = {"trials": trials, "next_page_token": next_page_token}
+    if summary_truncation:
+        result["summary_truncation"] = summary_truncation
+    return result
+
+def prefetch_top_hits(nct_ids: List[str], started: float, deadline: Optional[float]) -> None:
+    """Prefetch studies for the cache, adding at most PREFETCH_TIMEOUT to the search latency."""
+    now = time.monotonic()
+    prefetch_timeout = PREFETCH_TIMEOUT
+    if deadline is not None:
+        if now - started > PREFETCH_MAX_SEARCH_SHARE * (deadline - started):
+            logger.info(f"Skipped prefetch: the search took {now - started:.2f}s of a {deadline - started:.2f}s budget")
+            return
+        prefetch_timeout = min(prefetch_timeout, deadline - now)
+    if prefetch_timeout <= 0:
+        return
+    
+    prefetch_deadline = now + prefetch_timeout
+    prefetched = study_cache.prefetch(
+        nct_ids,
+        fetch_studies=lambda params: fetch_studies_within_budget(params, prefetch_deadline - time.monotonic())
+    )
+    logger.info(f"Prefetched {prefetched} studies, adding {(time.monotonic() - now) * 1000:.0f} ms to the search")
+
+def fit_summaries(trials: List[Dict], budget: int) -> Tuple[List[Dict], Optional[str]]:
+    """Shorten trial summaries step by step until they fit budget bytes; returns them and the step taken."""
+    def size(items):
+        return len(json.dumps(items, separators=(",", ":")))
+    
+    if size(trials) <= budget:
+        return trials, None
+    for description, max_conditions, max_title, keep_dates in SUMMARY_TRUNCATION_STEPS:
+        shortened = []
+        for trial in trials:
+            trial = dict(trial, conditions=(trial.get("conditions") or [])[:max_conditions])
+            title = trial.get("brief_title")
+            if max_title and title and len(title) > max_title:
+                trial["brief_title"] = title[:max_title].rstrip() + "..."
+            if not keep_dates:
+                trial.pop("start_date", None)
+                trial.pop("completion_date", None)
+            shortened.append(trial)
+        if size(shortened) <= budget:
+            break
+    # Anything still over budget is cut by the response packer
+    return shortened, description
+
+def normalize_phase(value: str) -> str:
+    """Normalize a phase such as "2", "Phase 2" or "PHASE_2" to the API form PHASE2."""
+    phase = re.sub(r"[\s_-]+", "", value.upper())
+    return f"PHASE{phase}" if phase.isdigit() else phase
+
+def matches_search_filters(study: Dict, filters: Dict) -> bool:
+    """Apply the client-side search filters to a study."""
+    if "phase" in filters:
+        phases = get_nested_value(study, ["protocolSection", "designModule", "phases"], []) or []
+        if filters["phase"] not in (normalize_phase(p) for p in phases):
+            return False
+    if "start_date" in filters:
+        start_date = get_nested_value(study, ["protocolSection", "statusModule", "startDateStruct", "date"])
+        if not start_date:
+            return False
+        low, high = filters["start_date"]
+        # Dates are ISO strings of varying precision (2024, 2024-05, 2024-05-17);
+        # compare them at the precision both sides have
+        if low and start_date[:len(low)] < low[:len(start_date)]:
+            return False
+        if high and start_date[:len(high)] > high[:len(start_date)]:
+            return False
+    return True
 
 def get_trial_details(nct_id: str) -> Dict:
     """Get detailed information for a specific clinical trial."""
-    fields = [
-        "protocolSection.identificationModule.nctId",
-        "protocolSection.identificationModule.briefTitle",
-        "protocolSection.statusModule.overallStatus",
-        "protocolSection.conditionsModule.conditions",
-        "protocolSection.designModule.phases",
-        "protocolSection.sponsorCollaboratorsModule.leadSponsor",
-        "protocolSection.statusModule.startDateStruct",
-        "protocolSection.statusModule.primaryCompletionDateStruct"
-    ]
-    
-    params = {"format": "json", "fields": ",".join(fields), "query.id": nct_id}
     logger.info(f"Getting trial details for {nct_id}")
-    response = requests.get(BASE_URL, params=params)
-    data = response.json()
+    if not nct_id:
+        return {"error": f"Trial with NCT ID {nct_id} not found"}
+    record = study_cache.get(nct_id)
     
-    if not data.get("studies"):
+    if record is None:
         logger.warning(f"Trial with NCT ID {nct_id} not found")
         return {"error": f"Trial with NCT ID {nct_id} not found"}
+    return record["details"]
+
+def get_trial_details_batch(nct_ids: List[str]) -> Any:
+    """Get detailed information for many trials, in input order, with a marker for each one not found."""
+    if not nct_ids:
+        return {"error": "At least one NCT ID is required"}
+    logger.info(f"Getting trial details for {len(nct_ids)} trials")
+    records = study_cache.get_many(nct_ids)
+    
+    results = []
+    for nct_id in nct_ids:
+        record = records.get(nct_id.upper()) if nct_id else None
+        if record is None:
+            results.append({"nct_id": nct_id, "error": f"Trial with NCT ID {nct_id} not found"})
+        else:
+            results.append(record["details"])
+    logger.info(f"Found {len(records)} of {len(nct_ids)} trials")
+    return results
+
+def get_inclusion_criteria(nct_id: str) -> Dict:
+    """Get inclusion criteria for a clinical trial."""
+    record = study_cache.get(nct_id) if nct_id else None
+    
+    if record is None:
+        return {"error": f"Trial with NCT ID {nct_id} not found"}
+    if record["criteria"] is None:
+        return {"error": "Could not extract inclusion criteria"}
+    return {"inclusion_criteria": criteria_parser.render(record["criteria"], INCLUSION)}
+
+def get_exclusion_criteria(nct_id: str) -> Dict:
+    """Get exclusion criteria for a clinical trial."""
+    record = study_cache.get(nct_id) if nct_id else None
+    
+    if record is None:
+        return {"error": f"Trial with NCT ID {nct_id} not found"}
+    if record["criteria"] is None:
+        return {"error": "Could not extract exclusion criteria"}
+    if not criteria_parser.has_section(record["criteria"], EXCLUSION):
+        return {"error": "No exclusion criteria found"}
+    return {"exclusion_criteria": criteria_parser.render(record["criteria"], EXCLUSION)}
+
+def match_patient(
+    nct_ids: List[str],
+    age: Optional[Any] = None,
+    sex: Optional[str] = None,
+    conditions: Optional[List[str]] = None,
+    prior_therapies: Optional[List[str]] = None
+) -> Dict:
+    """Score how well a patient fits each trial's eligibility criteria and rank the trials."""
+    if not nct_ids:
+        return {"error": "At least one NCT ID is required"}
+    try:
+        age_years = float(age) if age not in (None, "") else None
+    except (TypeError, ValueError):
+        return {"error": f"Invalid age: {age}"}
     
-    study = data["studies"][0]
+    records = study_cache.get_many(nct_ids)
+    candidates = [(nct_id, records[nct_id]["predicates"]) for nct_id in nct_ids if nct_id in records]
+    results = rank(CandidateColumns(candidates).match(
+        age=age_years, sex=sex, conditions=conditions or [], therapies=prior_therapies or []
+    ))
+    logger.info(f"Matched patient against {len(candidates)} of {len(nct_ids)} trials")
+    
+    matches = []
+    for result in results[:MAX_MATCH_RESULTS]:
+        record = records[result["nct_id"]]
+        inclusion = criteria_parser.render(record["criteria"], INCLUSION)
+        exclusion = criteria_parser.render(record["criteria"], EXCLUSION)
+        matches.append({
+            "nct_id": result["nct_id"],
+            "brief_title": record["details"]["brief_title"],
+            "likelihood": result["likelihood"],
+            "score": result["score"],
+            "age_ok": result["age_ok"],
+            "sex_ok": result["sex_ok"],
+            "matched_conditions": result["matched_conditions"],
+            "inclusion_matches": [inclusion[i] for i in result["inclusion_matches"]],
+            "exclusion_matches": [exclusion[i] for i in result["exclusion_matches"]]
+        })
+    return {
+        "matches": matches,
+        "not_found": [nct_id for nct_id in nct_ids if nct_id not in records]
+    }
+
+def build_trial_details(study: Dict) -> Dict:
+    """Build the trial details of a study (also the summary of a search hit)."""
+    nct_id = get_nested_value(study, ["protocolSection", "identificationModule", "nctId"])
     return {
-        "nct_id": get_nested_value(study, ["protocolSection", "identificationModule", "nctId"]),
+        "nct_id": nct_id,
         "brief_title": get_nested_value(study, ["protocolSection", "identificationModule", "briefTitle"]),
         "url": f"https://clinicaltrials.gov/study/{nct_id}",
         "status": get_nested_value(study, ["protocolSection", "statusModule", "overallStatus"]),
@@ -153,55 +494,341 @@ def get_trial_details(nct_id: str) -> Dict:
         "completion_date": get_nested_value(study, ["protocolSection", "statusModule", "primaryCompletionDateStruct", "date"])
     }
 
-def get_inclusion_criteria(nct_id: str) -> Dict:
-    """Get inclusion criteria for a clinical trial."""
-    params = {"format": "json", "fields": "protocolSection.eligibilityModule.eligibilityCriteria", "query.id": nct_id}
+def build_study_record(study: Dict) -> Dict:
+    """
+    Build the cached record of a study: its details, the parsed criteria tree
+    (see criteria_parser.py) that both criteria endpoints render from, and the
+    eligibility predicates compiled from that tree.
+    """
+    text = get_nested_value(study, ["protocolSection", "eligibilityModule", "eligibilityCriteria"])
+    criteria = criteria_parser.parse(text) if isinstance(text, str) else None
+    predicates = compile_predicates(
+        get_nested_value(study, ["protocolSection", "eligibilityModule"]),
+        get_nested_value(study, ["protocolSection", "conditionsModule"]),
+        criteria_parser.texts(criteria, INCLUSION),
+        criteria_parser.texts(criteria, EXCLUSION)
+    )
+    return {
+        "details": build_trial_details(study),
+        "criteria": criteria,
+        "predicates": predicates
+    }
+
+def get_closest_trials(
+    nct_ids: List[str],
+    city: Optional[str] = None,
+    state: Optional[str] = None,
+    zip_code: Optional[str] = None,
+    country: Optional[str] = None,
+    max_distance: Optional[Any] = None
+) -> Any:
+    """Rank trials by the distance from the user to their closest site."""
+    if not nct_ids:
+        return {"error": "At least one NCT ID is required"}
+    try:
+        max_distance_km = float(max_distance) if max_distance not in (None, "") else DEFAULT_MAX_DISTANCE_KM
+    except (TypeError, ValueError):
+        max_distance_km = DEFAULT_MAX_DISTANCE_KM
     
-    response = requests.get(BASE_URL, params=params)
-    data = response.json()
+    locations_by_trial = fetch_study_locations(nct_ids)
+    origin = resolve_user_location(city, state, zip_code, country, locations_by_trial)
+    if origin is None:
+        return {"error": "Could not determine coordinates for the given location"}
     
-    if not data.get("studies"):
-        return {"error": f"Trial with NCT ID {nct_id} not found"}
+    sites = (
+        (nct_id, location, location["geoPoint"]["lat"], location["geoPoint"]["lon"])
+        for nct_id, locations in locations_by_trial.items()
+        for location in locations
+        if has_geo_point(location)
+    )
+    ranked = rank_closest(sites, origin[0], origin[1], max_distance_km)
+    logger.info(f"Ranked {len(ranked)} of {len(nct_ids)} trials within {max_distance_km} km of {origin}")
     
-    try:
-        eligibility_criteria = data["studies"][0]["protocolSection"]["eligibilityModule"]["eligibilityCriteria"]
-        parts = eligibility_criteria.split("Exclusion Criteria:", 1)
-        inclusion_text = parts[0].replace("Inclusion Criteria:", "").strip()
-        
-        # Format as numbered list
-        inclusions = [item.strip() for item in inclusion_text.split('\n') if item.strip()]
-        formatted = [f"{i+1}. {item}" for i, item in enumerate(inclusions)]
-        
-        return {"inclusion_criteria": formatted}
-    except Exception as e:
-        logger.error(f"Error processing inclusion criteria: {str(e)}")
-        return {"error": "Could not extract inclusion criteria"}
+    if not ranked:
+        return {"error": f"No trials found within {max_distance_km:g} km"}
+    return [
+        {
+            "nct_id": nct_id,
+            "distance_km": round(distance, 1),
+            "closest_location": format_location(location)
+        }
+        for nct_id, location, distance in ranked[:MAX_CLOSEST_TRIALS]
+    ]
 
-def get_exclusion_criteria(nct_id: str) -> Dict:
-    """Get exclusion criteria for a clinical trial."""
-    params = {"format": "json", "fields": "protocolSection.eligibilityModule.eligibilityCriteria", "query.id": nct_id}
+def fetch_study_locations(nct_ids: List[str]) -> Dict[str, List[Dict]]:
+    """Fetch the site list of many trials, NCT_BATCH_SIZE trials per request."""
+    fields = [
+        "protocolSection.identificationModule.nctId",
+        "protocolSection.contactsLocationsModule.locations"
+    ]
+    locations_by_trial = {}
+    for start in range(0, len(nct_ids), NCT_BATCH_SIZE):
+        chunk = nct_ids[start:start + NCT_BATCH_SIZE]
+        params = {
+            "format": "json",
+            "fields": ",".join(fields),
+            "filter.ids": ",".join(chunk),
+            "pageSize": len(chunk)
+        }
+        data = fetch_studies(params)
+        for study in data.get("studies", []):
+            nct_id = get_nested_value(study, ["protocolSection", "identificationModule", "nctId"])
+            locations_by_trial[nct_id] = get_nested_value(
+                study, ["protocolSection", "contactsLocationsModule", "locations"], []
+            )
+    return locations_by_trial
+
+def has_geo_point(location: Dict) -> bool:
+    """Check that a site has usable coordinates."""
+    geo_point = location.get("geoPoint") or {}
+    return isinstance(geo_point.get("lat"), (int, float)) and isinstance(geo_point.get("lon"), (int, float))
+
+def resolve_user_location(
+    city: Optional[str],
+    state: Optional[str],
+    zip_code: Optional[str],
+    country: Optional[str],
+    locations_by_trial: Dict[str, List[Dict]]
+) -> Optional[Tuple[float, float]]:
+    """
+    Geocode the user's location
     
-    response = requests.get(BASE_URL, params=params)
-    data = response.json()
+    Uses the offline gazetteer when it is deployed and falls back to the
+    coordinates of trial sites in the same place.
+    """
+    places = gazetteer.get()
+    if places is not None:
+        place = places.geocode(city=city, state=state, zip_code=zip_code, country=country)
+        if place is not None:
+            return place["lat"], place["lon"]
     
-    if not data.get("studies"):
-        return {"error": f"Trial with NCT ID {nct_id} not found"}
+    def norm(value):
+        return (value or "").strip().lower()
     
-    try:
-        eligibility_criteria = data["studies"][0]["protocolSection"]["eligibilityModule"]["eligibilityCriteria"]
-        if "Exclusion Criteria:" in eligibility_criteria:
-            exclusion_text = eligibility_criteria.split("Exclusion Criteria:", 1)[1].strip()
-            
-            # Format as numbered list
-            exclusions = [item.strip() for item in exclusion_text.split('\n') if item.strip()]
-            formatted = [f"{i+1}. {item}" for i, item in enumerate(exclusions)]
-            
-            return {"exclusion_criteria": formatted}
-        else:
-            return {"error": "No exclusion criteria found"}
-    except Exception as e:
-        logger.error(f"Error processing exclusion criteria: {str(e)}")
-        return {"error": "Could not extract exclusion criteria"}
+    city, state, zip_code, country = norm(city), norm(state), norm(zip_code), norm(country)
+    sites = [
+        location
+        for locations in locations_by_trial.values()
+        for location in locations
+        if has_geo_point(location)
+    ]
+    
+    # Most specific match first
+    matchers = []
+    if zip_code:
+        matchers.append(lambda site: norm(site.get("zip")) == zip_code and (not country or norm(site.get("country")) == country))
+    if city and state:
+        matchers.append(lambda site: norm(site.get("city")) == city and norm(site.get("state")) == state)
+    if city and country:
+        matchers.append(lambda site: norm(site.get("city")) == city and norm(site.get("country")) == country)
+    if city:
+        matchers.append(lambda site: norm(site.get("city")) == city)
+    
+    for matcher in matchers:
+        matches = [site["geoPoint"] for site in sites if matcher(site)]
+        if matches:
+            return (
+                sum(point["lat"] for point in matches) / len(matches),
+                sum(point["lon"] for point in matches) / len(matches)
+            )
+    return None
+
+def format_location(location: Dict) -> Dict:
+    """Convert a ClinicalTrials.gov site into the Location schema."""
+    return {
+        "facility": location.get("facility"),
+        "status": location.get("status"),
+        "city": location.get("city"),
+        "state": location.get("state"),
+        "zip": location.get("zip"),
+        "country": location.get("country"),
+        "country_code": location.get("countryCode"),
+        "contacts": [
+            {
+                "name": contact.get("name"),
+                "role": contact.get("role"),
+                "phone": contact.get("phone"),
+                "phone_ext": contact.get("phoneExt"),
+                "email": contact.get("email")
+            }
+            for contact in location.get("contacts", [])
+        ],
+        "geo_point": location.get("geoPoint")
+    }
+
+def parse_id_list(value: Any) -> List[str]:
+    """Parse an NCT ID list passed as a JSON array or a comma/space separated string."""
+    if not value:
+        return []
+    if isinstance(value, list):
+        items = value
+    else:
+        text = str(value).strip()
+        try:
+            items = json.loads(text) if text.startswith("[") else None
+        except ValueError:
+            items = None
+        if not isinstance(items, list):
+            items = re.split(r"[\s,\[\]\"']+", text)
+    
+    nct_ids = []
+    for item in items:
+        nct_id = str(item).strip().upper()
+        if nct_id and nct_id not in nct_ids:
+            nct_ids.append(nct_id)
+    return nct_ids
+
+def parse_text_list(value: Any) -> List[str]:
+    """Parse a list of free-text items passed as a JSON array or a comma/semicolon separated string."""
+    if not value:
+        return []
+    if isinstance(value, list):
+        items = value
+    else:
+        text = str(value).strip()
+        try:
+            items = json.loads(text) if text.startswith("[") else None
+        except ValueError:
+            items = None
+        if not isinstance(items, list):
+            items = re.split(r"[,;]", text.strip("[]"))
+    return [str(item).strip().strip("\"'") for item in items if str(item).strip().strip("\"'")]
+
+def fetch_from_mirror(params: Dict[str, Any], fetch_from_api) -> Optional[Dict]:
+    """
+    Answer a studies query from the local mirror, or None if there is none or it cannot.
+    
+    Studies of a plain filter.ids lookup that the mirror does not have yet (it
+    is behind the registry) are fetched with fetch_from_api and added.
+    """
+    local = mirror.get()
+    if local is None:
+        data = None
+    else:
+        try:
+            data = local.studies(params)
+        except UnsupportedQuery as e:
+            logger.info(f"Mirror cannot answer {params}: {str(e)}")
+            data = None
+    if data is None:
+        if is_page_token(params.get("pageToken")):
+            # Only the mirror understands its page tokens
+            raise ContinuationError("Page token is no longer valid, please repeat the search")
+        return None
+    
+    missing = ids_missing_from_mirror(params, data)
+    if missing:
+        logger.info(f"Fetching {len(missing)} studies missing from the mirror")
+        fetched = fetch_from_api(dict(params, **{"filter.ids": ",".join(missing), "pageSize": len(missing)}))
+        data["studies"].extend(fetched.get("studies", []))
+        if "totalCount" in data:
+            data["totalCount"] += len(fetched.get("studies", []))
+    return data
+
+def ids_missing_from_mirror(params: Dict[str, Any], data: Dict) -> List[str]:
+    """NCT IDs of a complete filter.ids lookup that the mirror's answer lacks."""
+    if not params.get("filter.ids") or set(params) - ID_LOOKUP_PARAMS or data.get("nextPageToken"):
+        return []
+    found = {study_nct_id(study).upper() for study in data.get("studies", []) if study_nct_id(study)}
+    requested = dict.fromkeys(i.strip().upper() for i in str(params["filter.ids"]).split(","))
+    return [i for i in requested if i and i not in found]
+
+def fetch_studies(params: Dict[str, Any]) -> Dict:
+    """Query the studies API (or the local mirror), sharing the result with identical in-flight queries."""
+    data = fetch_from_mirror(params, fetch_studies_from_api)
+    if data is not None:
+        return data
+    return fetch_studies_from_api(params)
+
+def fetch_studies_from_api(params: Dict[str, Any]) -> Dict:
+    """Query the studies API, sharing the result with identical in-flight queries."""
+    key = json.dumps(params, sort_keys=True)
+    
+    def fetch():
+        return get_json_with_retries(f"{BASE_URL}?{urllib.parse.urlencode(params)}")
+    
+    data, shared = in_flight.do(key, fetch)
+    if shared:
+        logger.info(f"Reused in-flight response for {key}")
+    return data
+
+def get_json_with_retries(url: str) -> Dict:
+    """GET a URL over the pooled keep-alive connections, retrying transient failures."""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return http_pool.get_json(url, timeout=REQUEST_TIMEOUT)
+        except HTTPStatusError as e:
+            if e.status not in RETRYABLE_STATUS or attempt == MAX_RETRIES:
+                raise
+            retry_after = e.headers.get("retry-after", "")
+            delay = min(float(retry_after), MAX_RETRY_DELAY) if retry_after.isdigit() else RETRY_BASE_DELAY * 2 ** attempt
+            logger.warning(f"ClinicalTrials.gov returned {e.status}, retrying in {delay:.2f}s")
+        except (OSError, http.client.HTTPException) as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = RETRY_BASE_DELAY * 2 ** attempt
+            logger.warning(f"ClinicalTrials.gov request failed ({str(e)}), retrying in {delay:.2f}s")
+        time.sleep(delay * random.uniform(0.8, 1.2))
+
+def fetch_studies_within_budget(params: Dict[str, Any], timeout: float = PREFETCH_TIMEOUT) -> Dict:
+    """
+    Query the studies API for a prefetch: a single attempt that is abandoned
+    after timeout seconds or PREFETCH_MAX_BYTES of decoded body.
+    """
+    deadline = time.monotonic() + timeout
+    data = fetch_from_mirror(params, lambda api_params: read_studies_before(api_params, deadline))
+    if data is not None:
+        return data
+    return read_studies_before(params, deadline)
+
+def read_studies_before(params: Dict[str, Any], deadline: float) -> Dict:
+    """
+    Read a studies API response in one attempt, giving up at the monotonic deadline.
+    
+    The socket timeout is lowered to the time left before every read, so a
+    slow or stalled body cannot hold the caller past the deadline.
+    """
+    timeout = deadline - time.monotonic()
+    if timeout <= 0:
+        raise TimeoutError("No time left for the prefetch")
+    chunks = []
+    size = 0
+    with http_pool.stream("GET", f"{BASE_URL}?{urllib.parse.urlencode(params)}", timeout=timeout) as response:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Prefetch took longer than {timeout:.2f}s")
+            response.set_timeout(remaining)
+            chunk = response.read(64 * 1024)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > PREFETCH_MAX_BYTES:
+                raise ValueError(f"Prefetch response exceeds {PREFETCH_MAX_BYTES} bytes")
+            chunks.append(chunk)
+    return json.loads(b"".join(chunks))
+
+# Study records shared by /trial_details, the criteria endpoints and
+# /match_patient, fetched with one projection covering all of them
+study_cache = StudyCache(
+    fetch_studies,
+    build_study_record,
+    fields=[
+        "protocolSection.identificationModule.nctId",
+        "protocolSection.identificationModule.briefTitle",
+        "protocolSection.statusModule.overallStatus",
+        "protocolSection.conditionsModule",
+        "protocolSection.designModule.phases",
+        "protocolSection.sponsorCollaboratorsModule.leadSponsor",
+        "protocolSection.statusModule.startDateStruct",
+        "protocolSection.statusModule.primaryCompletionDateStruct",
+        "protocolSection.statusModule.lastUpdatePostDateStruct",
+        "protocolSection.eligibilityModule"
+    ],
+    batch_size=NCT_BATCH_SIZE,
+    # Bump whenever build_study_record changes the shape of the record
+    record_version=2
+)
 
 def get_nested_value(obj, path, default=None):
     """Get a value from a nested dictionary using a path of keys."""
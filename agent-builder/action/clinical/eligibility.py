@@ -0,0 +1,213 @@
+"""
+Patient-to-trial eligibility matching.
+
+Each trial's eligibility data is compiled once into structured predicates
+(age range in years, sex, healthy volunteers, and the term sets of every
+condition, keyword, inclusion and exclusion bullet) that are stored with the cached
+study record. Matching a patient lays the predicates of all candidate trials
+out as columns and evaluates each check over a whole column at once (with
+numpy for the numeric columns when it is available), then ranks the trials.
+
+Matching is term based, not clinical judgement: a bullet "matches" a patient
+fact when every word of the fact appears in the bullet. Results say which
+checks passed or failed so the agent can explain and verify them.
+
+A trial is "likely" only if age and sex fit, no exclusion bullet is hit and
+one of the patient's conditions matches the trial's conditions (or, for a
+patient given without conditions, the trial accepts healthy volunteers).
+Trials with partial evidence are "possible", the rest "unlikely".
+"""
+import re
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; list comprehensions are fast enough for a few hundred trials
+    np = None
+
+# Likelihood labels, best first
+LIKELY = "likely"
+POSSIBLE = "possible"
+UNLIKELY = "unlikely"
+
+# Weights of the ranking score
+CONDITION_WEIGHT = 1.0
+INCLUSION_WEIGHT = 0.25
+EXCLUSION_PENALTY = 0.5
+
+_AGE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(year|month|week|day|hour|minute)s?\s*$", re.IGNORECASE)
+_UNIT_YEARS = {"year": 1.0, "month": 1 / 12, "week": 7 / 365.25, "day": 1 / 365.25,
+               "hour": 1 / 8766, "minute": 1 / 525960}
+_WORD = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = frozenset(
+    "a an and any are as at be by for from has have in is of on or the to with without who "
+    "patient patients subject subjects participant participants history prior previous".split()
+)
+
+
+def parse_age(value):
+    """'18 Years' -> 18.0, '6 Months' -> 0.5; None for missing or N/A"""
+    match = _AGE.match(value or "")
+    if not match:
+        return None
+    return float(match.group(1)) * _UNIT_YEARS[match.group(2).lower()]
+
+
+def terms(text):
+    """Normalized content words of a text, with a light plural stemming"""
+    words = set()
+    for word in _WORD.findall((text or "").lower()):
+        if word in _STOP_WORDS:
+            continue
+        if len(word) > 4 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.add(word)
+    return words
+
+
+def compile_predicates(eligibility_module, conditions_module, inclusion, exclusion):
+    """
+    Compile a trial's eligibility data into JSON-serializable predicates
+
+    Args:
+        eligibility_module: protocolSection.eligibilityModule of the study
+        conditions_module: protocolSection.conditionsModule of the study
+        inclusion, exclusion: Lists of criteria bullets (exclusion may be None)
+    """
+    eligibility_module = eligibility_module or {}
+    conditions_module = conditions_module or {}
+    condition_texts = (conditions_module.get("conditions") or []) + (conditions_module.get("keywords") or [])
+    return {
+        "min_age": parse_age(eligibility_module.get("minimumAge")),
+        "max_age": parse_age(eligibility_module.get("maximumAge")),
+        "sex": (eligibility_module.get("sex") or "ALL").upper(),
+        "healthy_volunteers": bool(eligibility_module.get("healthyVolunteers")),
+        "condition_terms": [sorted(terms(text)) for text in condition_texts if terms(text)],
+        "inclusion_terms": [sorted(terms(item)) for item in inclusion or []],
+        "exclusion_terms": [sorted(terms(item)) for item in exclusion or []],
+    }
+
+
+def normalize_sex(value):
+    value = (value or "").strip().upper()
+    if value in ("F", "FEMALE", "WOMAN", "W"):
+        return "FEMALE"
+    if value in ("M", "MALE", "MAN"):
+        return "MALE"
+    return None
+
+
+class CandidateColumns:
+    """Predicates of many trials laid out column by column"""
+
+    def __init__(self, candidates):
+        """
+        Args:
+            candidates: List of (nct_id, predicates)
+        """
+        self.nct_ids = [nct_id for nct_id, _ in candidates]
+        predicates = [p for _, p in candidates]
+        self.sex = [p["sex"] for p in predicates]
+        self.healthy_volunteers = [p["healthy_volunteers"] for p in predicates]
+        self.condition_terms = [[frozenset(t) for t in p["condition_terms"]] for p in predicates]
+        self.inclusion_terms = [[frozenset(t) for t in p["inclusion_terms"]] for p in predicates]
+        self.exclusion_terms = [[frozenset(t) for t in p["exclusion_terms"]] for p in predicates]
+        if np is not None:
+            self.min_age = np.array([p["min_age"] if p["min_age"] is not None else -np.inf for p in predicates])
+            self.max_age = np.array([p["max_age"] if p["max_age"] is not None else np.inf for p in predicates])
+        else:
+            self.min_age = [p["min_age"] for p in predicates]
+            self.max_age = [p["max_age"] for p in predicates]
+
+    def __len__(self):
+        return len(self.nct_ids)
+
+    def age_ok(self, age):
+        if age is None:
+            return [True] * len(self)
+        if np is not None:
+            return ((self.min_age <= age) & (age <= self.max_age)).tolist()
+        return [(low is None or low <= age) and (high is None or age <= high)
+                for low, high in zip(self.min_age, self.max_age)]
+
+    def sex_ok(self, sex):
+        if sex is None:
+            return [True] * len(self)
+        return [trial_sex in ("ALL", sex) for trial_sex in self.sex]
+
+    @staticmethod
+    def _likelihood(demographics_ok, relevant, inclusion_hit, exclusion_hit, has_conditions):
+        """
+        Args:
+            demographics_ok: Age and sex fit the trial
+            relevant: A patient condition matches the trial's, or for a patient
+                without conditions, the trial accepts healthy volunteers
+        """
+        if not demographics_ok:
+            return UNLIKELY
+        if relevant and not exclusion_hit:
+            return LIKELY
+        if relevant or inclusion_hit or not has_conditions:
+            return POSSIBLE
+        return UNLIKELY
+
+    @staticmethod
+    def _bullet_hits(column, facts):
+        """Per trial, the indexes of bullets containing every term of some fact"""
+        return [
+            [index for index, bullet in enumerate(bullets) if any(fact <= bullet for fact in facts)]
+            for bullets in column
+        ]
+
+    def match(self, age=None, sex=None, conditions=(), therapies=()):
+        """
+        Evaluate a patient against every candidate
+
+        Returns:
+            List of per-trial dicts, in candidate order
+        """
+        condition_facts = [(text, frozenset(terms(text))) for text in conditions]
+        condition_facts = [(text, fact) for text, fact in condition_facts if fact]
+        all_facts = [fact for _, fact in condition_facts] + [f for f in (frozenset(terms(t)) for t in therapies) if f]
+
+        age_ok = self.age_ok(age)
+        sex_ok = self.sex_ok(normalize_sex(sex))
+        # A patient condition matches a trial condition that is as or more specific
+        # ("lung cancer" vs. "non-small cell lung cancer") or more general
+        matched_conditions = [
+            [text for text, fact in condition_facts if any(fact <= c or c <= fact for c in trial_conditions)]
+            for trial_conditions in self.condition_terms
+        ]
+        inclusion_hits = self._bullet_hits(self.inclusion_terms, all_facts)
+        exclusion_hits = self._bullet_hits(self.exclusion_terms, all_facts)
+
+        has_conditions = bool(condition_facts)
+        results = []
+        for i in range(len(self)):
+            condition_share = len(matched_conditions[i]) / len(condition_facts) if condition_facts else 0.0
+            score = (CONDITION_WEIGHT * condition_share
+                     + INCLUSION_WEIGHT * min(len(inclusion_hits[i]), 4) / 4
+                     - EXCLUSION_PENALTY * len(exclusion_hits[i]))
+            likelihood = self._likelihood(
+                age_ok[i] and sex_ok[i],
+                bool(matched_conditions[i]) if has_conditions else self.healthy_volunteers[i],
+                bool(inclusion_hits[i]),
+                bool(exclusion_hits[i]),
+                has_conditions
+            )
+            results.append({
+                "nct_id": self.nct_ids[i],
+                "likelihood": likelihood,
+                "score": round(score, 3),
+                "age_ok": age_ok[i],
+                "sex_ok": sex_ok[i],
+                "matched_conditions": matched_conditions[i],
+                "inclusion_matches": inclusion_hits[i],
+                "exclusion_matches": exclusion_hits[i],
+            })
+        return results
+
+
+def rank(results):
+    """Sort match results by likelihood, then score"""
+    order = {LIKELY: 0, POSSIBLE: 1, UNLIKELY: 2}
+    return sorted(results, key=lambda r: (order[r["likelihood"]], -r["score"], r["nct_id"]))
@@ -0,0 +1,310 @@
+"""
+Offline gazetteer for geocoding user locations.
+
+Built from the GeoNames dumps (https://download.geonames.org/export/):
+    cities15000.txt (or cities1000/cities500)   populated places
+    allCountries.txt from export/zip (or e.g. US.txt)   postal codes
+    admin1CodesASCII.txt                         state/province names
+    countryInfo.txt                              country names
+
+into one packed file that is memory-mapped on first use, so importing the
+module costs nothing and a lookup touches only the pages it binary-searches.
+
+File layout (little endian):
+    header   8s magic, uint32 place count, uint32 key count,
+             uint64 offsets of the place table, key table and key offsets
+    places   fixed-size records: float32 lat, float32 lon, uint32 population,
+             2s country code, uint32 offsets of name, admin1 code and admin1
+             name in the string pool
+    strings  NUL-terminated UTF-8 strings
+    keys     "kind:normalized key\\tvalue\\n" sorted; kinds are
+             zip (value: place index), name (value: place index, more
+             populous places first) and country (value: ISO code)
+    offsets  uint64 offset of each key, in key order
+
+City names are normalized (accents stripped, lower-cased, punctuation
+dropped, "saint" -> "st"), so exact and prefix lookups are tolerant of
+spelling differences; misspelled names fall back to shorter prefixes.
+
+Usage:
+    python gazetteer.py gazetteer.bin --cities cities15000.txt --postal US.txt \\
+        --admin1 admin1CodesASCII.txt --countries countryInfo.txt
+"""
+import mmap
+import os
+import re
+import struct
+import threading
+import unicodedata
+
+MAGIC = b"GAZETTE1"
+_HEADER = struct.Struct("<8sIIQQQ")
+_PLACE = struct.Struct("<ffI2sIII")
+_OFFSET = struct.Struct("<Q")
+
+# Shortest prefix tried when a city name has no exact match
+MIN_PREFIX = 4
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_ABBREVIATIONS = {"saint": "st", "sainte": "ste", "mount": "mt", "fort": "ft"}
+
+
+def normalize_name(value):
+    """Fold a place name into its lookup key"""
+    text = unicodedata.normalize("NFKD", value or "").encode("ascii", "ignore").decode("ascii").lower()
+    words = [_ABBREVIATIONS.get(word, word) for word in _NON_WORD.split(text) if word]
+    return " ".join(words)
+
+
+def normalize_postal(value):
+    return re.sub(r"\s+", "", (value or "").upper())
+
+
+class Gazetteer:
+    """Read-only view of a gazetteer file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.place_count, self.key_count, self._places, self._keys, self._key_offsets = \
+            _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a gazetteer file")
+
+    def _string(self, offset):
+        return self._mm[offset:self._mm.find(b"\0", offset)].decode("utf-8")
+
+    def place(self, index):
+        lat, lon, population, country, name, admin1_code, admin1_name = \
+            _PLACE.unpack_from(self._mm, self._places + index * _PLACE.size)
+        return {
+            "name": self._string(name),
+            "admin1_code": self._string(admin1_code),
+            "admin1": self._string(admin1_name),
+            "country_code": country.decode("ascii"),
+            "lat": lat,
+            "lon": lon,
+            "population": population
+        }
+
+    def _key_at(self, index):
+        offset = _OFFSET.unpack_from(self._mm, self._key_offsets + index * _OFFSET.size)[0]
+        end = self._mm.find(b"\n", offset)
+        key, _, value = self._mm[offset:end].partition(b"\t")
+        return key, value.decode("utf-8")
+
+    def _lower_bound(self, key):
+        low, high = 0, self.key_count
+        while low < high:
+            mid = (low + high) // 2
+            if self._key_at(mid)[0] < key:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def _scan(self, key, prefix=False, limit=None):
+        """Values of the keys equal to (or starting with) key, in key order"""
+        values = []
+        index = self._lower_bound(key)
+        while index < self.key_count and (limit is None or len(values) < limit):
+            found, value = self._key_at(index)
+            if found != key and not (prefix and found.startswith(key)):
+                break
+            values.append(value)
+            index += 1
+        return values
+
+    def country_code(self, country):
+        """ISO code for a country name or code, or None"""
+        if not country:
+            return None
+        values = self._scan(f"country:{normalize_name(country)}".encode("utf-8"))
+        return values[0] if values else None
+
+    def postal(self, code, country_code=None):
+        """Places for a postal code, optionally restricted to a country"""
+        places = [self.place(int(v)) for v in self._scan(f"zip:{normalize_postal(code)}".encode("utf-8"))]
+        return [p for p in places if country_code is None or p["country_code"] == country_code]
+
+    def places(self, name, prefix=False, limit=50):
+        """Places named name (or starting with it when prefix is True)"""
+        key = f"name:{normalize_name(name)}".encode("utf-8")
+        return [self.place(int(v)) for v in self._scan(key, prefix=prefix, limit=limit)]
+
+    def geocode(self, city=None, state=None, zip_code=None, country=None):
+        """
+        Resolve a user location to a place
+
+        Postal codes win over city names. City candidates are filtered by
+        state (name or code) and country, and the most populous one is
+        returned. Names without an exact match are looked up by successively
+        shorter prefixes.
+
+        Returns:
+            Place dict with lat/lon, or None
+        """
+        country_code = self.country_code(country)
+        if zip_code:
+            places = self.postal(zip_code, country_code)
+            if places:
+                return places[0]
+        if not city:
+            return None
+
+        def matches(place):
+            if country_code and place["country_code"] != country_code:
+                return False
+            if state:
+                wanted = normalize_name(state)
+                return wanted in (normalize_name(place["admin1"]), normalize_name(place["admin1_code"]))
+            return True
+
+        candidates = [p for p in self.places(city) if matches(p)]
+        name = normalize_name(city)
+        length = len(name)
+        while not candidates and length >= MIN_PREFIX:
+            candidates = [p for p in self.places(name[:length], prefix=True) if matches(p)]
+            length -= 1
+        if not candidates:
+            return None
+        return max(candidates, key=lambda p: p["population"])
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+class LazyGazetteer:
+    """Opens the gazetteer file on first use so cold starts do not pay for it"""
+
+    def __init__(self, path):
+        self.path = path
+        self._gazetteer = None
+        self._missing = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the Gazetteer, or None if the file is not deployed"""
+        if self._gazetteer is None and not self._missing:
+            with self._lock:
+                if self._gazetteer is None and not self._missing:
+                    if os.path.exists(self.path):
+                        self._gazetteer = Gazetteer(self.path)
+                    else:
+                        self._missing = True
+        return self._gazetteer
+
+
+# ----- building -----
+
+def _read_tsv(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            yield line.rstrip("\n").split("\t")
+
+
+def build(path, cities=None, postal=None, admin1=None, countries=None):
+    """
+    Build a gazetteer file from GeoNames dumps
+
+    Returns:
+        Dict with the number of places and keys written
+    """
+    admin1_names = {}
+    if admin1:
+        for row in _read_tsv(admin1):
+            admin1_names[row[0]] = row[1]
+
+    places = []
+    keys = []
+
+    def add_place(name, country, admin1_code, lat, lon, population, admin1_name=None):
+        if admin1_name is None:
+            admin1_name = admin1_names.get(f"{country}.{admin1_code}", "")
+        places.append((float(lat), float(lon), int(population or 0), country, name, admin1_code, admin1_name))
+        return len(places) - 1
+
+    if cities:
+        for row in _read_tsv(cities):
+            index = add_place(row[1], row[8], row[10], row[4], row[5], row[14])
+            for name in {normalize_name(row[1]), normalize_name(row[2])}:
+                if name:
+                    # Within a name, more populous places sort first
+                    keys.append((f"name:{name}", -places[index][2], str(index)))
+
+    if postal:
+        # Several places may share a postal code; keep their mean position
+        grouped = {}
+        for row in _read_tsv(postal):
+            if len(row) < 11 or not row[9] or not row[10]:
+                continue
+            entry = grouped.setdefault((row[0], normalize_postal(row[1])), [row[2], row[4], row[3], 0.0, 0.0, 0])
+            entry[3] += float(row[9])
+            entry[4] += float(row[10])
+            entry[5] += 1
+        for (country, code), (name, admin1_code, admin1_name, lat, lon, count) in grouped.items():
+            index = add_place(name, country, admin1_code, lat / count, lon / count, 0, admin1_name)
+            keys.append((f"zip:{code}", 0, str(index)))
+
+    if countries:
+        for row in _read_tsv(countries):
+            code, iso3, name = row[0], row[1], row[4]
+            for alias in {code, iso3, name}:
+                keys.append((f"country:{normalize_name(alias)}", 0, code))
+        for alias, code in (("usa", "US"), ("united states of america", "US"), ("uk", "GB")):
+            keys.append((f"country:{alias}", 0, code))
+
+    keys = sorted(set(keys))
+
+    # Strings are addressed by absolute file offset; the pool follows the place table
+    places_offset = _HEADER.size
+    strings_offset = places_offset + len(places) * _PLACE.size
+    strings = {}
+    pool = bytearray()
+
+    def intern(value):
+        if value not in strings:
+            strings[value] = strings_offset + len(pool)
+            pool.extend(value.encode("utf-8") + b"\0")
+        return strings[value]
+
+    records = bytearray()
+    for lat, lon, population, country, name, admin1_code, admin1_name in places:
+        records += _PLACE.pack(lat, lon, population, country.encode("ascii")[:2].ljust(2),
+                               intern(name), intern(admin1_code), intern(admin1_name))
+
+    keys_offset = strings_offset + len(pool)
+    key_blob = bytearray()
+    offsets = bytearray()
+    for key, _, value in keys:
+        offsets += _OFFSET.pack(keys_offset + len(key_blob))
+        key_blob += f"{key}\t{value}\n".encode("utf-8")
+    key_offsets_offset = keys_offset + len(key_blob)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(places), len(keys), places_offset, keys_offset, key_offsets_offset))
+        f.write(records)
+        f.write(pool)
+        f.write(key_blob)
+        f.write(offsets)
+    os.replace(tmp_path, path)
+    return {"places": len(places), "keys": len(keys)}
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Build the gazetteer from GeoNames dumps")
+    parser.add_argument("output")
+    parser.add_argument("--cities", help="GeoNames citiesNNNN.txt")
+    parser.add_argument("--postal", help="GeoNames postal code dump (export/zip)")
+    parser.add_argument("--admin1", help="GeoNames admin1CodesASCII.txt")
+    parser.add_argument("--countries", help="GeoNames countryInfo.txt")
+    args = parser.parse_args()
+    print(json.dumps(build(args.output, args.cities, args.postal, args.admin1, args.countries)))
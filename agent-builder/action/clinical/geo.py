@@ -0,0 +1,150 @@
+"""
+Distance ranking of trial sites around a user location.
+
+All sites of all requested trials are put into a lat/lon grid so a radius
+query only measures the sites in the cells overlapping the search circle.
+Distances are great-circle (haversine) distances, computed over all candidate
+sites at once with numpy when it is available (e.g. from a layer) and with a
+plain loop otherwise.
+"""
+import math
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; the pure-Python path is fast enough for small batches
+    np = None
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Grid cell size in degrees; ~110 km of latitude per cell
+DEFAULT_CELL_DEGREES = 1.0
+
+# Kilometers per degree of latitude
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def normalize_lon(lon):
+    """Map a longitude into [-180, 180), e.g. 180 -> -180 and 190 -> -170"""
+    return (lon + 180.0) % 360.0 - 180.0
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Distances in km from (lat, lon) to each point of the lats/lons sequences"""
+    if np is not None:
+        lat1 = np.radians(lat)
+        lat2 = np.radians(np.asarray(lats, dtype=float))
+        dlat = lat2 - lat1
+        dlon = np.radians(np.asarray(lons, dtype=float) - lon)
+        a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+        return (2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))).tolist()
+
+    lat1 = math.radians(lat)
+    cos_lat1 = math.cos(lat1)
+    distances = []
+    for lat2, lon2 in zip(lats, lons):
+        lat2 = math.radians(lat2)
+        a = math.sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * math.cos(lat2) * math.sin(math.radians(lon2 - lon) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0))))
+    return distances
+
+
+class GridIndex:
+    """
+    Buckets points into lat/lon cells for radius queries
+
+    Cells are keyed by the longitude normalized to [-180, 180), the range the
+    query columns wrap around, so a point at lon=180 is found from either side.
+    """
+
+    def __init__(self, cell_degrees=DEFAULT_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.cells = {}
+        self.lats = []
+        self.lons = []
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_degrees)), int(math.floor(lon / self.cell_degrees))
+
+    def add(self, lat, lon):
+        """Add a point and return its position"""
+        position = len(self.lats)
+        self.lats.append(lat)
+        self.lons.append(lon)
+        self.cells.setdefault(self._cell(lat, normalize_lon(lon)), []).append(position)
+        return position
+
+    def extend(self, lats, lons):
+        """Add many points at once; positions continue from the current size"""
+        start = len(self.lats)
+        self.lats.extend(lats)
+        self.lons.extend(lons)
+        cells = self.cells
+        size = self.cell_degrees
+        floor = math.floor
+        for position, (lat, lon) in enumerate(zip(lats, lons), start):
+            key = (floor(lat / size), floor(((lon + 180.0) % 360.0 - 180.0) / size))
+            bucket = cells.get(key)
+            if bucket is None:
+                cells[key] = [position]
+            else:
+                bucket.append(position)
+
+    def candidates(self, lat, lon, radius_km):
+        """Positions of the points in cells overlapping the circle around (lat, lon)"""
+        if radius_km is None:
+            return list(range(len(self.lats)))
+        lat_span = radius_km / KM_PER_DEGREE
+        low_lat, high_lat = lat - lat_span, lat + lat_span
+        first_row, last_row = self._cell(low_lat, 0)[0], self._cell(high_lat, 0)[0]
+
+        # The longitude span is widest at the latitude closest to a pole
+        cos_lat = math.cos(math.radians(min(90.0, max(abs(low_lat), abs(high_lat)))))
+        lon_span = radius_km / (KM_PER_DEGREE * cos_lat) if cos_lat > 1e-6 else 360
+        first_col = self._cell(0, lon - lon_span)[1]
+        last_col = self._cell(0, lon + lon_span)[1]
+        columns_per_turn = int(round(360 / self.cell_degrees))
+        if last_col - first_col + 1 >= columns_per_turn:
+            # The circle covers every longitude
+            return [p for (row, _), positions in self.cells.items() if first_row <= row <= last_row for p in positions]
+        min_col = self._cell(0, -180)[1]
+        positions = []
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                # Wrap columns across the antimeridian
+                wrapped = (col - min_col) % columns_per_turn + min_col
+                positions.extend(self.cells.get((row, wrapped), ()))
+        return positions
+
+    def within(self, lat, lon, radius_km=None):
+        """Return [(position, distance_km)] of the points within radius_km, nearest first"""
+        positions = self.candidates(lat, lon, radius_km)
+        if not positions:
+            return []
+        distances = haversine_km(lat, lon, [self.lats[p] for p in positions], [self.lons[p] for p in positions])
+        hits = [(p, d) for p, d in zip(positions, distances) if radius_km is None or d <= radius_km]
+        hits.sort(key=lambda hit: hit[1])
+        return hits
+
+
+def rank_closest(sites, lat, lon, max_distance_km=None):
+    """
+    Rank groups of sites by their closest member
+
+    Args:
+        sites: Iterable of (group, site, site_lat, site_lon), e.g. group=NCT ID
+        lat, lon: Origin
+        max_distance_km: Ignore sites farther than this
+
+    Returns:
+        List of (group, site, distance_km) with one entry per group, nearest first
+    """
+    sites = list(sites)
+    index = GridIndex()
+    index.extend([site[2] for site in sites], [site[3] for site in sites])
+
+    closest = {}
+    for position, distance in index.within(lat, lon, max_distance_km):
+        group, site = sites[position][:2]
+        if group not in closest:
+            closest[group] = (group, site, distance)
+    return list(closest.values())
@@ -0,0 +1,261 @@
+"""
+Per-study cache for the ClinicalTrials.gov actions.
+
+Trial details and the inclusion/exclusion criteria of a study are all served
+from one cached record per NCT ID. A miss fetches a superset field projection
+once (batched with filter.ids for many IDs) and the caller's build_record turns
+the study into the record, parsing the eligibility criteria a single time.
+
+Records are versioned by the study's lastUpdatePostDate. Once a record is
+past its fresh TTL it is still served, and revalidated in the background by
+asking ClinicalTrials.gov for the lastUpdatePostDate alone: unchanged studies
+only get their TTL renewed, changed ones are fetched and rebuilt.
+
+Studies can also be prefetched (e.g. the top hits of a search, which the
+agent usually asks about next). A prefetched record counts as a hit when it
+is looked up within its fresh TTL, and as wasted otherwise.
+"""
+import logging
+import os
+import threading
+import time
+
+from response_cache import MISS, STALE, TieredCache
+
+logger = logging.getLogger()
+
+# Seconds a cached study is served without revalidation, and how much longer
+# it may be served while it is revalidated
+STUDY_CACHE_TTL = int(os.environ.get("STUDY_CACHE_TTL", "3600"))
+STUDY_CACHE_STALE_TTL = int(os.environ.get("STUDY_CACHE_STALE_TTL", str(7 * 24 * 3600)))
+
+# NCT IDs per filter.ids request
+DEFAULT_BATCH_SIZE = 100
+
+NCT_ID_FIELD = "protocolSection.identificationModule.nctId"
+VERSION_FIELD = "protocolSection.statusModule.lastUpdatePostDateStruct"
+
+
+def study_version(study):
+    """lastUpdatePostDate of a study, or None"""
+    status = study.get("protocolSection", {}).get("statusModule", {})
+    return (status.get("lastUpdatePostDateStruct") or {}).get("date")
+
+
+def study_nct_id(study):
+    return study.get("protocolSection", {}).get("identificationModule", {}).get("nctId")
+
+
+class StudyCache:
+    """NCT ID -> study record, fetched with one projection and versioned by lastUpdatePostDate"""
+
+    def __init__(self, fetch_studies, build_record, fields, batch_size=DEFAULT_BATCH_SIZE,
+                 ttl=STUDY_CACHE_TTL, stale_ttl=STUDY_CACHE_STALE_TTL, cache=None, record_version=1):
+        """
+        Args:
+            fetch_studies: Callable taking /studies query params and returning the response JSON
+            build_record: Callable turning a study into a JSON-serializable record
+            fields: Field projection requested on a miss; the NCT ID and version
+                fields are added if missing
+            batch_size: NCT IDs per request
+            ttl, stale_ttl: Fresh and extra stale seconds of a cached record
+            cache: TieredCache to store records in
+            record_version: Version of the record format; records cached by
+                another version are never returned
+        """
+        self.fetch_studies = fetch_studies
+        self.build_record = build_record
+        self.fields = list(dict.fromkeys(list(fields) + [NCT_ID_FIELD, VERSION_FIELD]))
+        self.batch_size = batch_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.cache = cache or TieredCache("clinical-studies")
+        self.record_version = record_version
+        self._revalidating = set()
+        # Prefetched NCT ID not looked up yet -> monotonic time it counts as wasted
+        self._unused = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "fetched": 0,
+            "not_found": 0,
+            "revalidated": 0,
+            "unchanged": 0,
+            "changed": 0,
+            "revalidation_errors": 0,
+            "prefetched": 0,
+            "prefetch_hits": 0,
+            "prefetch_wasted": 0,
+            "prefetch_errors": 0,
+        }
+
+    def _key(self, nct_id):
+        return f"study:v{self.record_version}:{nct_id.upper()}"
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _query(self, nct_ids, fields, fetch_studies=None):
+        """Yield the studies for nct_ids, batch_size IDs per request"""
+        fetch_studies = fetch_studies or self.fetch_studies
+        for start in range(0, len(nct_ids), self.batch_size):
+            chunk = nct_ids[start:start + self.batch_size]
+            data = fetch_studies({
+                "format": "json",
+                "fields": ",".join(fields),
+                "filter.ids": ",".join(chunk),
+                "pageSize": len(chunk)
+            })
+            yield from data.get("studies", [])
+
+    def _fetch(self, nct_ids, fetch_studies=None):
+        records = {}
+        for study in self._query(nct_ids, self.fields, fetch_studies):
+            nct_id = study_nct_id(study)
+            if not nct_id:
+                continue
+            record = self.build_record(study)
+            record["version"] = study_version(study)
+            self.cache.set(self._key(nct_id), record, self.ttl, self.stale_ttl)
+            records[nct_id.upper()] = record
+        self._count("fetched", len(records))
+        self._count("not_found", len(nct_ids) - len(records))
+        return records
+
+    def get_many(self, nct_ids):
+        """
+        Look up many studies, fetching the missing ones in as few requests as possible
+
+        Returns:
+            Dict of upper-cased NCT ID -> record; IDs that do not exist, and
+            empty ones, are absent
+        """
+        records = {}
+        missing = []
+        stale = {}
+        nct_ids = list(dict.fromkeys(n.upper() for n in nct_ids if n))
+        for nct_id in nct_ids:
+            record, status = self.cache.get(self._key(nct_id))
+            if status == MISS:
+                missing.append(nct_id)
+                continue
+            records[nct_id] = record
+            if status == STALE:
+                stale[nct_id] = record
+        self._count_prefetch_hits(records)
+        if missing:
+            records.update(self._fetch(missing))
+        if stale:
+            self._revalidate_in_background(stale)
+        return records
+
+    def get(self, nct_id):
+        """Return the record of one study, or None if it does not exist"""
+        if not nct_id:
+            return None
+        return self.get_many([nct_id]).get(nct_id.upper())
+
+    def revalidate(self, records):
+        """
+        Compare cached records with the current lastUpdatePostDate of their studies
+
+        Unchanged records get a new TTL, changed or vanished studies are fetched again.
+        """
+        nct_ids = list(records)
+        current = {
+            study_nct_id(study).upper(): study_version(study)
+            for study in self._query(nct_ids, [NCT_ID_FIELD, VERSION_FIELD])
+            if study_nct_id(study)
+        }
+        changed = []
+        for nct_id in nct_ids:
+            version = current.get(nct_id)
+            if version is not None and version == records[nct_id].get("version"):
+                self.cache.set(self._key(nct_id), records[nct_id], self.ttl, self.stale_ttl)
+            else:
+                changed.append(nct_id)
+        self._count("revalidated", len(nct_ids))
+        self._count("unchanged", len(nct_ids) - len(changed))
+        self._count("changed", len(changed))
+        if changed:
+            self._fetch(changed)
+
+    def _revalidate_in_background(self, records):
+        with self._lock:
+            records = {k: v for k, v in records.items() if k not in self._revalidating}
+            self._revalidating.update(records)
+        if not records:
+            return
+
+        def run():
+            try:
+                self.revalidate(records)
+            except Exception as e:
+                logger.warning(f"Study revalidation failed for {list(records)}: {str(e)}")
+                self._count("revalidation_errors")
+            finally:
+                with self._lock:
+                    self._revalidating.difference_update(records)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def prefetch(self, nct_ids, fetch_studies=None):
+        """
+        Fetch the studies not cached yet, in one request per batch
+
+        Runs in the caller's thread: Lambda freezes the process once the
+        handler returns, so work left to a background thread would only
+        resume on the next invocation. Failures are logged and counted, not
+        raised.
+
+        Args:
+            nct_ids: NCT IDs likely to be looked up soon
+            fetch_studies: Callable used instead of the cache's own, e.g. one
+                enforcing a time and size budget
+
+        Returns:
+            Number of studies prefetched
+        """
+        wanted = [
+            nct_id for nct_id in dict.fromkeys(n.upper() for n in nct_ids if n)
+            if not self.cache.contains(self._key(nct_id))
+        ]
+        if not wanted:
+            return 0
+        try:
+            records = self._fetch(wanted, fetch_studies)
+        except Exception as e:
+            logger.info(f"Study prefetch failed for {wanted}: {str(e)}")
+            self._count("prefetch_errors")
+            return 0
+        wasted_after = time.monotonic() + self.ttl
+        with self._lock:
+            self._stats["prefetched"] += len(records)
+            self._unused.update((nct_id, wasted_after) for nct_id in records)
+        return len(records)
+
+    def _count_prefetch_hits(self, nct_ids):
+        with self._lock:
+            for nct_id in nct_ids:
+                if self._unused.pop(nct_id, None) is not None:
+                    self._stats["prefetch_hits"] += 1
+
+    def _sweep_unused(self):
+        """Count prefetched records that were not looked up within their TTL as wasted"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [nct_id for nct_id, wasted_after in self._unused.items() if wasted_after <= now]
+            for nct_id in expired:
+                del self._unused[nct_id]
+            self._stats["prefetch_wasted"] += len(expired)
+
+    def stats(self):
+        """Return a snapshot of the study counters and the underlying cache"""
+        self._sweep_unused()
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["prefetch_pending"] = len(self._unused)
+        settled = snapshot["prefetch_hits"] + snapshot["prefetch_wasted"]
+        snapshot["prefetch_hit_rate"] = round(snapshot["prefetch_hits"] / settled, 3) if settled else None
+        snapshot["cache"] = self.cache.stats()
+        return snapshot
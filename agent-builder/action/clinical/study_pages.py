@@ -0,0 +1,159 @@
+"""
+Lazy paging over the ClinicalTrials.gov v2 studies API.
+
+Pages are requested one at a time by following nextPageToken, and only when
+the matches collected so far are not enough. Client-side filters (e.g. phase
+or start date, which the plain query parameters cannot express) are applied
+to each study as it streams past. Collection stops at the requested number of
+matches, at the end of the results, after MAX_SCAN_PAGES pages, or when the
+next page would not arrive before the deadline.
+
+Wherever it stops early, the caller gets a continuation token recording the
+upstream page and the position inside it, so the next call resumes exactly
+where this one left off instead of scanning from the first page again.
+Tokens are tied to the query they came from.
+"""
+import base64
+import hashlib
+import json
+import time
+
+# Pages fetched per call before handing back a continuation token
+MAX_SCAN_PAGES = 10
+
+_TOKEN_VERSION = 1
+
+
+class ContinuationError(ValueError):
+    """Raised for continuation tokens that are malformed or belong to another query"""
+
+
+# Parameters that shape the returned studies but not which studies match
+_PROJECTION_PARAMS = {"fields"}
+
+
+def query_fingerprint(params, filters=None):
+    """
+    Short digest identifying a query and its client-side filters
+
+    The field projection is left out, so a token stays valid when the caller
+    asks for more or fewer fields of the same results.
+    """
+    query = {name: value for name, value in params.items() if name not in _PROJECTION_PARAMS}
+    text = json.dumps([query, filters], sort_keys=True, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+def encode_token(page_token, offset, page_size, fingerprint):
+    state = {"v": _TOKEN_VERSION, "p": page_token, "o": offset, "s": page_size, "q": fingerprint}
+    raw = json.dumps(state, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_token(token, fingerprint):
+    """
+    Decode a continuation token
+
+    Returns:
+        Tuple of (upstream page token or None, offset in that page, page size)
+
+    Raises:
+        ContinuationError: If the token is malformed or was issued for another query
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        state = json.loads(raw)
+        page_token, offset, page_size = state["p"], int(state["o"]), int(state["s"])
+        version, token_fingerprint = state["v"], state["q"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ContinuationError(f"Invalid continuation token: {str(e)}")
+    if version != _TOKEN_VERSION or token_fingerprint != fingerprint:
+        raise ContinuationError("Continuation token does not belong to this query")
+    return page_token, offset, page_size
+
+
+def iter_pages(fetch_studies, params, page_size, page_token=None):
+    """
+    Yield (page_token, studies, next_page_token) for each page, fetching lazily
+
+    Args:
+        fetch_studies: Callable taking /studies query params and returning the response JSON
+        params: Query parameters without paging
+        page_size: Studies per page
+        page_token: Upstream token of the first page to fetch (None for the first page)
+    """
+    while True:
+        page_params = dict(params, pageSize=page_size)
+        if page_token:
+            page_params["pageToken"] = page_token
+        data = fetch_studies(page_params)
+        next_page_token = data.get("nextPageToken")
+        yield page_token, data.get("studies", []), next_page_token
+        if not next_page_token:
+            return
+        page_token = next_page_token
+
+
+def collect(fetch_studies, params, limit, page_size, matches=None, filters=None,
+            continuation=None, deadline=None, max_pages=MAX_SCAN_PAGES):
+    """
+    Collect up to limit matching studies, streaming pages until enough are found
+
+    Args:
+        fetch_studies: Callable taking /studies query params and returning the response JSON
+        params: Query parameters without paging
+        limit: Number of matches wanted
+        page_size: Studies per upstream page for a new query (a continuation keeps its own)
+        matches: Optional predicate applied to each study
+        filters: JSON-serializable description of matches, part of the query identity
+        continuation: Token returned by a previous call for the same query
+        deadline: time.monotonic() value by which paging must have stopped
+        max_pages: Pages fetched at most before returning a continuation token
+
+    Returns:
+        Tuple of (studies, continuation token or None, stats dict)
+
+    Raises:
+        ContinuationError: If continuation is invalid for this query
+    """
+    fingerprint = query_fingerprint(params, filters)
+    page_token, skip = None, 0
+    if continuation:
+        page_token, skip, page_size = decode_token(continuation, fingerprint)
+
+    collected = []
+    stats = {"pages": 0, "scanned": 0, "stopped": "exhausted"}
+    slowest = 0.0
+    pages = iter_pages(fetch_studies, params, page_size, page_token)
+    while True:
+        started = time.monotonic()
+        try:
+            page_token, studies, next_page_token = next(pages)
+        except StopIteration:
+            return collected, None, stats
+        slowest = max(slowest, time.monotonic() - started)
+        stats["pages"] += 1
+
+        for offset in range(skip, len(studies)):
+            stats["scanned"] += 1
+            if matches is not None and not matches(studies[offset]):
+                continue
+            collected.append(studies[offset])
+            if len(collected) >= limit:
+                stats["stopped"] = "limit"
+                if offset + 1 < len(studies):
+                    return collected, encode_token(page_token, offset + 1, page_size, fingerprint), stats
+                if next_page_token:
+                    return collected, encode_token(next_page_token, 0, page_size, fingerprint), stats
+                return collected, None, stats
+        skip = 0
+
+        if not next_page_token:
+            return collected, None, stats
+        if stats["pages"] >= max_pages:
+            stats["stopped"] = "max_pages"
+            return collected, encode_token(next_page_token, 0, page_size, fingerprint), stats
+        # Stop if the next page would likely finish past the deadline
+        if deadline is not None and time.monotonic() + slowest >= deadline:
+            stats["stopped"] = "deadline"
+            return collected, encode_token(next_page_token, 0, page_size, fingerprint), stats
@@ -0,0 +1,395 @@
+"""
+Local mirror of the ClinicalTrials.gov registry with a full-text index.
+
+The full registry is published as a bulk download (the JSON format of the
+"Download" page on clinicaltrials.gov, a zip with one study per file). It is
+ingested into a SQLite database:
+
+  studies       one row per study: NCT ID, overall status, lastUpdatePostDate,
+                the searchable texts and the study JSON
+  studies_text  FTS5 index (porter stemming) over conditions and keywords,
+                titles, lead sponsor and site locations
+
+The studies API parameters the actions use are translated into indexed
+queries:
+
+  query.cond            conditions, keywords and titles
+  query.lead            lead sponsor
+  query.locn            facility, city, state and country of the sites
+  query.id, filter.ids  NCT IDs
+  filter.overallStatus  overall status (comma-separated)
+
+and answered in the v2 response shape ({"studies", "nextPageToken",
+"totalCount"}) with the requested `fields` projection, so callers cannot tell
+the mirror from the API. Text searches are ranked by relevance (FTS5 bm25),
+as the API ranks them; plain ID and status lookups are sorted by NCT ID. Queries using other parameters raise
+UnsupportedQuery and should go to the API. The mirror's page tokens carry
+PAGE_TOKEN_PREFIX so they are never mistaken for, or sent as, API tokens.
+
+After the bulk load the mirror is kept current incrementally: sync() asks the
+API only for studies whose LastUpdatePostDate is on or after the newest one
+already mirrored and upserts them.
+
+Usage:
+    python trials_mirror.py trials.db --bulk ctg-studies.json.zip   # initial load
+    python trials_mirror.py trials.db                               # incremental sync
+"""
+import functools
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+import zipfile
+
+import http_pool
+from projection import Projection
+
+logger = logging.getLogger()
+
+API_URL = "https://clinicaltrials.gov/api/v2/studies"
+
+# Studies per API page during sync (the API maximum)
+SYNC_PAGE_SIZE = 1000
+
+# Studies upserted per transaction
+INSERT_BATCH = 500
+
+# Page size when the query does not set one (the API default)
+DEFAULT_PAGE_SIZE = 10
+
+# Query parameters the mirror can answer; anything else goes to the API
+SUPPORTED_PARAMS = {
+    "format", "fields", "pageSize", "pageToken", "countTotal",
+    "query.cond", "query.lead", "query.locn", "query.id", "filter.ids", "filter.overallStatus",
+}
+
+# Marks the page tokens issued by the mirror
+PAGE_TOKEN_PREFIX = "mirror:"
+
+# FTS columns searched per query parameter
+TEXT_COLUMNS = {
+    "query.cond": "{conditions title}",
+    "query.lead": "{sponsor}",
+    "query.locn": "{locations}",
+}
+
+_WORD = re.compile(r"\w+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS studies (
+    id INTEGER PRIMARY KEY,
+    nct_id TEXT NOT NULL UNIQUE,
+    overall_status TEXT,
+    last_update TEXT,
+    conditions TEXT,
+    title TEXT,
+    sponsor TEXT,
+    locations TEXT,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS studies_status ON studies(overall_status);
+CREATE INDEX IF NOT EXISTS studies_last_update ON studies(last_update);
+CREATE VIRTUAL TABLE IF NOT EXISTS studies_text USING fts5(
+    conditions, title, sponsor, locations,
+    content='studies', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS studies_ai AFTER INSERT ON studies BEGIN
+    INSERT INTO studies_text(rowid, conditions, title, sponsor, locations)
+    VALUES (new.id, new.conditions, new.title, new.sponsor, new.locations);
+END;
+CREATE TRIGGER IF NOT EXISTS studies_ad AFTER DELETE ON studies BEGIN
+    INSERT INTO studies_text(studies_text, rowid, conditions, title, sponsor, locations)
+    VALUES ('delete', old.id, old.conditions, old.title, old.sponsor, old.locations);
+END;
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class UnsupportedQuery(ValueError):
+    """Raised for queries the mirror cannot answer faithfully"""
+
+
+def is_page_token(token):
+    """Whether a page token was issued by the mirror"""
+    return str(token or "").startswith(PAGE_TOKEN_PREFIX)
+
+
+@functools.lru_cache(maxsize=64)
+def _projection(fields):
+    return Projection(fields.split(",")) if fields else None
+
+
+def _section(study, *path):
+    value = study
+    for key in path:
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def study_row(study):
+    """Columns of the studies table for a study"""
+    protocol = study.get("protocolSection", {})
+    identification = protocol.get("identificationModule", {})
+    conditions = protocol.get("conditionsModule", {})
+    locations = _section(protocol, "contactsLocationsModule", "locations") or []
+    sites = " ; ".join(
+        " ".join(str(site.get(key)) for key in ("facility", "city", "state", "country") if site.get(key))
+        for site in locations
+    )
+    return (
+        identification.get("nctId"),
+        _section(protocol, "statusModule", "overallStatus"),
+        _section(protocol, "statusModule", "lastUpdatePostDateStruct", "date"),
+        " ; ".join((conditions.get("conditions") or []) + (conditions.get("keywords") or [])),
+        " ; ".join(t for t in (identification.get("briefTitle"), identification.get("officialTitle"),
+                               identification.get("acronym")) if t),
+        _section(protocol, "sponsorCollaboratorsModule", "leadSponsor", "name"),
+        sites,
+        json.dumps(study, separators=(",", ":")),
+    )
+
+
+def _match_expression(column, text):
+    """FTS5 expression requiring every word of text in the given columns"""
+    words = _WORD.findall(text.replace("+", " "))
+    if not words:
+        raise UnsupportedQuery(f"No searchable words in {text!r}")
+    return f"{column} : (" + " AND ".join('"' + w.replace('"', '""') + '"' for w in words) + ")"
+
+
+def _split_list(value):
+    return [item.strip() for item in re.split(r"[,|]", value) if item.strip()]
+
+
+class TrialsMirror:
+    """Read/write access to the mirror database"""
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self._local = threading.local()
+        if not readonly:
+            with self._connect() as conn:
+                conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.readonly:
+                conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            else:
+                conn = sqlite3.connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def state(self):
+        rows = self._connect().execute("SELECT key, value FROM state").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    # ----- queries -----
+
+    def studies(self, params):
+        """
+        Answer a studies API query from the mirror
+
+        Queries with query.cond, query.lead or query.locn return the best
+        full-text matches first (bm25, ties broken by NCT ID), like the API's
+        relevance ranking; other queries return studies in NCT ID order.
+
+        Args:
+            params: Query parameters as passed to the studies API
+
+        Returns:
+            Response in the v2 shape: {"studies": [...], "nextPageToken"?, "totalCount"?}
+
+        Raises:
+            UnsupportedQuery: If the query uses parameters the mirror does not handle
+        """
+        unsupported = set(params) - SUPPORTED_PARAMS
+        if unsupported:
+            raise UnsupportedQuery(f"Unsupported parameters: {sorted(unsupported)}")
+
+        conditions = []
+        args = []
+        joins = ""
+        order = "s.nct_id"
+        match = [
+            _match_expression(column, str(params[name]))
+            for name, column in TEXT_COLUMNS.items() if params.get(name)
+        ]
+        if match:
+            joins = "JOIN studies_text ON studies_text.rowid = s.id"
+            order = "bm25(studies_text), s.nct_id"
+            conditions.append("studies_text MATCH ?")
+            args.append(" AND ".join(match))
+        for name in ("query.id", "filter.ids"):
+            if params.get(name):
+                ids = [i.upper() for i in _split_list(str(params[name]))]
+                conditions.append(f"s.nct_id IN ({','.join('?' * len(ids))})")
+                args.extend(ids)
+        if params.get("filter.overallStatus"):
+            statuses = [s.upper() for s in _split_list(str(params["filter.overallStatus"]))]
+            conditions.append(f"s.overall_status IN ({','.join('?' * len(statuses))})")
+            args.extend(statuses)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        page_token = params.get("pageToken")
+        if page_token and not is_page_token(page_token):
+            raise UnsupportedQuery(f"Not a mirror page token: {page_token!r}")
+        try:
+            page_size = int(params.get("pageSize") or DEFAULT_PAGE_SIZE)
+            offset = int(page_token[len(PAGE_TOKEN_PREFIX):]) if page_token else 0
+        except ValueError:
+            raise UnsupportedQuery(f"Malformed mirror page token: {page_token!r}")
+
+        conn = self._connect()
+        rows = conn.execute(
+            f"SELECT s.doc FROM studies s {joins} {where} ORDER BY {order} LIMIT ? OFFSET ?",
+            args + [page_size + 1, offset]
+        ).fetchall()
+
+        project = _projection(params.get("fields") or "")
+        studies = []
+        for (doc,) in rows[:page_size]:
+            study = json.loads(doc)
+            studies.append(project(study) if project else study)
+        data = {"studies": studies}
+        if len(rows) > page_size:
+            data["nextPageToken"] = f"{PAGE_TOKEN_PREFIX}{offset + page_size}"
+        if str(params.get("countTotal", "")).lower() == "true":
+            data["totalCount"] = conn.execute(f"SELECT COUNT(*) FROM studies s {joins} {where}", args).fetchone()[0]
+        return data
+
+    # ----- ingestion -----
+
+    def upsert(self, studies):
+        """Insert or replace studies; returns how many were written"""
+        conn = self._connect()
+        count = 0
+        batch = []
+        for study in studies:
+            row = study_row(study)
+            if not row[0]:
+                continue
+            batch.append(row)
+            if len(batch) >= INSERT_BATCH:
+                count += self._write(conn, batch)
+                batch = []
+        count += self._write(conn, batch)
+        return count
+
+    def _write(self, conn, rows):
+        if not rows:
+            return 0
+        with conn:
+            # DELETE + INSERT (rather than REPLACE) so the FTS delete trigger runs
+            conn.executemany("DELETE FROM studies WHERE nct_id = ?", [(row[0],) for row in rows])
+            conn.executemany(
+                "INSERT INTO studies(nct_id, overall_status, last_update, conditions, title, sponsor, locations, doc)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        return len(rows)
+
+    def _set_state(self, **values):
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO state(key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in values.items()]
+            )
+
+    def load_bulk(self, path):
+        """
+        Load a full-registry JSON zip
+
+        Members may hold one study, a list of studies or a {"studies": [...]} page.
+
+        Returns:
+            Number of studies loaded
+        """
+        def iter_studies():
+            with zipfile.ZipFile(path) as archive:
+                for name in archive.namelist():
+                    if not name.endswith(".json"):
+                        continue
+                    with archive.open(name) as member:
+                        data = json.load(member)
+                    if isinstance(data, dict) and "studies" in data:
+                        data = data["studies"]
+                    yield from (data if isinstance(data, list) else [data])
+
+        count = self.upsert(iter_studies())
+        self._set_state(bulk_loaded_at=time.time())
+        logger.info(f"Loaded {count} studies from {path}")
+        return count
+
+    def latest_update(self):
+        return self._connect().execute("SELECT MAX(last_update) FROM studies").fetchone()[0]
+
+    def sync(self, api_url=API_URL, since=None):
+        """
+        Fetch the studies updated on or after the newest mirrored lastUpdatePostDate
+
+        Returns:
+            Dict with the date synced from and the number of studies updated
+        """
+        since = since or self.latest_update()
+        params = {"format": "json", "pageSize": SYNC_PAGE_SIZE}
+        if since:
+            params["filter.advanced"] = f"AREA[LastUpdatePostDate]RANGE[{since},MAX]"
+        updated = 0
+        page_token = None
+        while True:
+            page_params = dict(params, pageToken=page_token) if page_token else params
+            data = http_pool.get_json(f"{api_url}?{urllib.parse.urlencode(page_params)}", timeout=120)
+            updated += self.upsert(data.get("studies", []))
+            page_token = data.get("nextPageToken")
+            if not page_token:
+                break
+        self._set_state(synced_at=time.time(), synced_since=since)
+        summary = {"since": since, "updated": updated}
+        logger.info(f"Synced trials mirror: {summary}")
+        return summary
+
+
+class LazyMirror:
+    """Opens a read-only mirror on first use, or never if the file is missing"""
+
+    def __init__(self, path):
+        self.path = path
+        self._mirror = None
+        self._checked = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        if not self._checked:
+            with self._lock:
+                if not self._checked:
+                    if self.path and os.path.exists(self.path):
+                        self._mirror = TrialsMirror(self.path, readonly=True)
+                        logger.info(f"Using trials mirror {self.path}")
+                    self._checked = True
+        return self._mirror
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build or update the ClinicalTrials.gov mirror")
+    parser.add_argument("database")
+    parser.add_argument("--bulk", help="full-registry JSON zip to load before syncing")
+    parser.add_argument("--no-sync", action="store_true", help="skip the incremental sync")
+    args = parser.parse_args()
+    mirror = TrialsMirror(args.database)
+    if args.bulk:
+        mirror.load_bulk(args.bulk)
+    if not args.no_sync:
+        mirror.sync()
@@ -0,0 +1,409 @@
+"""
+Keep-alive HTTPS connection pool shared by the action group Lambdas.
+
+Lambda containers are reused between invocations, so a module-level pool lets
+warm invocations skip DNS + TCP + TLS setup. Connections are kept per host,
+handed out one request at a time and returned once the response body has been
+fully read.
+"""
+import gzip
+import http.client
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+import zlib
+
+logger = logging.getLogger()
+
+# Default per-request timeout in seconds
+DEFAULT_TIMEOUT = float(os.environ.get("HTTP_POOL_TIMEOUT", "10"))
+
+# Maximum number of idle connections kept per host
+MAX_IDLE_PER_HOST = int(os.environ.get("HTTP_POOL_MAX_IDLE_PER_HOST", "4"))
+
+# Idle connections older than this (seconds) are discarded instead of reused;
+# most servers drop keep-alive connections after about a minute
+IDLE_TTL = float(os.environ.get("HTTP_POOL_IDLE_TTL", "50"))
+
+USER_AGENT = "knewly-bedrock-agent/1.0"
+
+# Errors raised when a reused keep-alive connection was closed by the server
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+
+class HTTPStatusError(Exception):
+    """Raised for responses with a 4xx/5xx status code"""
+
+    def __init__(self, status, reason, headers, body):
+        super().__init__(f"HTTP Error {status}: {reason}")
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+
+class PooledResponse:
+    """A fully read HTTP response"""
+
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def text(self, encoding="utf-8"):
+        return self.body.decode(encoding)
+
+    def json(self):
+        return json.loads(self.body)
+
+
+def decode_body(body, content_encoding):
+    """Decompress a response body according to its Content-Encoding header"""
+    encoding = (content_encoding or "").strip().lower()
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            # Some servers send raw deflate streams without the zlib header
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+class StreamingResponse:
+    """File-like response body that is decompressed as it is read"""
+
+    # Unread bodies smaller than this are drained on close so the
+    # connection can go back to the pool
+    DRAIN_LIMIT = 64 * 1024
+
+    def __init__(self, pool, key, conn, response):
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = {k.lower(): v for k, v in response.getheaders()}
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self._pending = b""
+        self._closed = False
+        self.raw_bytes = 0
+        self.decoded_bytes = 0
+
+        encoding = self.headers.get("content-encoding", "").strip().lower()
+        if encoding == "gzip":
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == "deflate":
+            self._decompressor = zlib.decompressobj()
+        else:
+            self._decompressor = None
+
+    def read(self, size=-1):
+        """Read up to size decoded bytes; an empty result means end of body"""
+        if size is None or size < 0:
+            chunks = [self._pending]
+            self._pending = b""
+            while True:
+                chunk = self._read_chunk(64 * 1024)
+                if not chunk:
+                    return b"".join(chunks)
+                chunks.append(chunk)
+
+        while not self._pending:
+            chunk = self._read_chunk(size)
+            if not chunk:
+                return b""
+            self._pending = chunk
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def set_timeout(self, timeout):
+        """Set the socket timeout for the reads that follow, e.g. to the time left before a deadline"""
+        if self._conn.sock is not None:
+            self._conn.sock.settimeout(timeout)
+
+    def _read_chunk(self, size):
+        """Read and decode the next chunk with at most one socket read, so the socket timeout bounds each call"""
+        while True:
+            raw = self._response.read1(size)
+            if not raw:
+                if self._decompressor is not None:
+                    tail = self._decompressor.flush()
+                    self._decompressor = None
+                    self.decoded_bytes += len(tail)
+                    return tail
+                return b""
+            self.raw_bytes += len(raw)
+            data = self._decompressor.decompress(raw) if self._decompressor is not None else raw
+            if data:
+                self.decoded_bytes += len(data)
+                return data
+
+    def close(self):
+        """Release the connection, draining small unread bodies first"""
+        if self._closed:
+            return
+        self._closed = True
+        response = self._response
+        remaining = response.length
+        if not response.isclosed() and remaining is not None and remaining <= self.DRAIN_LIMIT:
+            try:
+                self.raw_bytes += len(response.read())
+            except Exception:
+                self._conn.close()
+        self._pool._finish_stream(self._key, self._conn, response, self.raw_bytes, self.decoded_bytes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """Thread-safe pool of keep-alive HTTP(S) connections keyed by host"""
+
+    def __init__(self, max_idle_per_host=MAX_IDLE_PER_HOST, timeout=DEFAULT_TIMEOUT, idle_ttl=IDLE_TTL):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self.idle_ttl = idle_ttl
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "connections_opened": 0,
+            "connections_reused": 0,
+            "stale_retries": 0,
+            "handshake_ms_total": 0.0,
+            "handshake_ms_last": 0.0,
+            "bytes_on_wire": 0,
+            "bytes_decoded": 0,
+            "streams_abandoned": 0,
+        }
+
+    def _acquire(self, key, timeout):
+        """Return an idle connection for the host, or open a new one"""
+        scheme, host, port = key
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                conn, last_used = idle.pop()
+                if now - last_used <= self.idle_ttl and conn.sock is not None:
+                    self._stats["connections_reused"] += 1
+                    conn.timeout = timeout
+                    conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=timeout)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+
+        # Connect eagerly so the DNS + TCP + TLS cost can be measured
+        start = time.perf_counter()
+        conn.connect()
+        handshake_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self._stats["connections_opened"] += 1
+            self._stats["handshake_ms_total"] += handshake_ms
+            self._stats["handshake_ms_last"] = handshake_ms
+        return conn, False
+
+    def _release(self, key, conn):
+        """Return a connection to the idle list, closing it if the pool is full"""
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def _prepare(self, url, headers):
+        """Split a URL into the pool key and request target, and build headers"""
+        parsed = urllib.parse.urlsplit(url)
+        scheme = parsed.scheme.lower()
+        port = parsed.port or (443 if scheme == "https" else 80)
+        key = (scheme, parsed.hostname, port)
+        target = parsed.path or "/"
+        if parsed.query:
+            target = f"{target}?{parsed.query}"
+
+        request_headers = {
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+            "User-Agent": USER_AGENT,
+        }
+        if headers:
+            request_headers.update(headers)
+        return key, target, request_headers
+
+    def _send(self, key, method, target, body, headers, timeout):
+        """Send a request and return the connection with its unread response"""
+        with self._lock:
+            self._stats["requests"] += 1
+
+        conn, reused = self._acquire(key, timeout)
+        try:
+            conn.request(method, target, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except STALE_CONNECTION_ERRORS:
+            conn.close()
+            if not reused:
+                raise
+        except Exception:
+            conn.close()
+            raise
+
+        # The server closed the idle connection; retry once on a fresh one
+        logger.info(f"Stale pooled connection to {key[1]}, reconnecting")
+        with self._lock:
+            self._stats["stale_retries"] += 1
+        conn, _ = self._acquire_fresh(key, timeout)
+        try:
+            conn.request(method, target, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        """
+        Send a request over a pooled connection and read the full response
+
+        Args:
+            method: HTTP method
+            url: Absolute http(s) URL
+            body: Optional request body (bytes or str)
+            headers: Optional extra request headers
+            timeout: Per-request socket timeout in seconds
+
+        Returns:
+            PooledResponse with the decompressed body
+
+        Raises:
+            HTTPStatusError: For 4xx/5xx responses
+        """
+        key, target, request_headers = self._prepare(url, headers)
+        timeout = self.timeout if timeout is None else timeout
+
+        conn, response = self._send(key, method, target, body, request_headers, timeout)
+        try:
+            raw = response.read()
+        except Exception:
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+
+        body_bytes = decode_body(raw, response.getheader("Content-Encoding"))
+        with self._lock:
+            self._stats["bytes_on_wire"] += len(raw)
+            self._stats["bytes_decoded"] += len(body_bytes)
+
+        response_headers = {k.lower(): v for k, v in response.getheaders()}
+        if response.status >= 400:
+            raise HTTPStatusError(response.status, response.reason, response_headers, body_bytes)
+        return PooledResponse(response.status, response.reason, response_headers, body_bytes)
+
+    def stream(self, method, url, body=None, headers=None, timeout=None):
+        """
+        Send a request and return the body as an incrementally decoded stream
+
+        The caller must close the returned StreamingResponse (or use it as a
+        context manager). The connection goes back to the pool only if the
+        body was fully consumed.
+
+        Raises:
+            HTTPStatusError: For 4xx/5xx responses
+        """
+        key, target, request_headers = self._prepare(url, headers)
+        timeout = self.timeout if timeout is None else timeout
+
+        conn, response = self._send(key, method, target, body, request_headers, timeout)
+        stream = StreamingResponse(self, key, conn, response)
+        if response.status >= 400:
+            body_bytes = stream.read()
+            stream.close()
+            raise HTTPStatusError(response.status, response.reason, stream.headers, body_bytes)
+        return stream
+
+    def _finish_stream(self, key, conn, response, raw_bytes, decoded_bytes):
+        """Return a streamed connection to the pool, or close it if unread data remains"""
+        if response.isclosed() and not response.will_close:
+            self._release(key, conn)
+            abandoned = 0
+        else:
+            conn.close()
+            abandoned = 0 if response.isclosed() else 1
+        with self._lock:
+            self._stats["bytes_on_wire"] += raw_bytes
+            self._stats["bytes_decoded"] += decoded_bytes
+            self._stats["streams_abandoned"] += abandoned
+
+    def _acquire_fresh(self, key, timeout):
+        """Drop idle connections for the host and open a new one"""
+        with self._lock:
+            for conn, _ in self._idle.pop(key, []):
+                conn.close()
+        return self._acquire(key, timeout)
+
+    def stats(self):
+        """Return a snapshot of connection reuse statistics"""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["idle_connections"] = sum(len(idle) for idle in self._idle.values())
+        opened = snapshot["connections_opened"]
+        snapshot["handshake_ms_avg"] = round(snapshot["handshake_ms_total"] / opened, 2) if opened else 0.0
+        snapshot["handshake_ms_total"] = round(snapshot["handshake_ms_total"], 2)
+        snapshot["handshake_ms_last"] = round(snapshot["handshake_ms_last"], 2)
+        return snapshot
+
+    def close(self):
+        """Close all idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn, _ in connections:
+                conn.close()
+
+
+# Module-level pool reused across warm Lambda invocations
+_default_pool = ConnectionPool()
+
+
+def request(method, url, body=None, headers=None, timeout=None):
+    """Send a request through the shared module-level pool"""
+    return _default_pool.request(method, url, body=body, headers=headers, timeout=timeout)
+
+
+def get_json(url, headers=None, timeout=None):
+    """GET a URL through the shared pool and decode the JSON body"""
+    return _default_pool.request("GET", url, headers=headers, timeout=timeout).json()
+
+
+def stream(method, url, body=None, headers=None, timeout=None):
+    """Open a streaming response through the shared module-level pool"""
+    return _default_pool.stream(method, url, body=body, headers=headers, timeout=timeout)
+
+
+def pool_stats():
+    """Return connection reuse statistics for the shared pool"""
+    return _default_pool.stats()
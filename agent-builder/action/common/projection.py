@@ -0,0 +1,246 @@
+"""
+Declarative response projections shared by the action group Lambdas.
+
+A projection is declared as a list of field paths and compiled once, at import
+time, into a tree of closures that copies only the kept fields into a fresh
+result in a single pass; the input is never mutated.
+
+Path syntax:
+    "receivedate"                       keep a top-level field whole
+    "patient.reaction[:3]"              keep the first 3 elements of an array
+    "patient.drug[:2].medicinalproduct" keep one field of the first 2 elements
+    "patient.*"                         keep the remaining fields of patient whole
+
+`counts` maps an array path (without caps) to a key that is set on the parent
+object with the original array length whenever elements were dropped.
+"""
+import re
+
+_SEGMENT = re.compile(r"^(?P<name>[^\[\]]+)(?:\[(?::(?P<cap>\d+))?\])?$")
+
+
+class Shape:
+    """
+    Projection of a JSON value.
+
+    A value matched by a Shape is kept as follows:
+      - arrays: the Shape is applied to each element; only the first `cap`
+        elements are kept and, when elements were dropped, the original length
+        is stored on the parent object under `count_key`
+      - objects: if `fields` is None the object is kept whole, otherwise only
+        the listed fields are kept (each projected by its own Shape, None
+        meaning keep whole); with `keep_rest` the other fields are kept whole
+      - scalars are kept as-is
+    """
+
+    __slots__ = ("fields", "keep_rest", "cap", "count_key")
+
+    def __init__(self, fields=None, keep_rest=False, cap=None, count_key=None):
+        self.fields = fields
+        self.keep_rest = keep_rest
+        self.cap = cap
+        self.count_key = count_key
+
+
+def _parse_segment(segment, path):
+    match = _SEGMENT.match(segment)
+    if not match:
+        raise ValueError(f"Invalid projection path segment {segment!r} in {path!r}")
+    cap = match.group("cap")
+    return match.group("name"), int(cap) if cap is not None else None
+
+
+def _merge_cap(cap, other):
+    """Element cap of an array kept by two paths: the larger, None meaning all"""
+    if cap is None or other is None:
+        return None
+    return max(cap, other)
+
+
+def build_shape(paths, counts=None):
+    """
+    Build the Shape tree for a list of field paths
+
+    Overlapping paths are merged into their union, in any order: a path that
+    keeps a field whole covers the longer paths below it, and an array keeps
+    as many elements as the most generous path asks for. Where the union has
+    no exact shape (whole elements of a capped array plus one field of all of
+    them), the wider of the two is kept.
+    """
+    root = Shape(fields={})
+    for path in paths:
+        node = root
+        segments = path.split(".")
+        for index, segment in enumerate(segments):
+            name, cap = _parse_segment(segment, path)
+            last = index == len(segments) - 1
+            if name == "*":
+                if not last:
+                    raise ValueError(f"'*' must be the last segment in {path!r}")
+                node.keep_rest = True
+                break
+            if name not in node.fields:
+                if last:
+                    node.fields[name] = None if cap is None else Shape(cap=cap)
+                    break
+                child = node.fields[name] = Shape(fields={}, cap=cap)
+                node = child
+                continue
+            child = node.fields[name]
+            if child is None:
+                # Already kept whole
+                break
+            child.cap = _merge_cap(child.cap, cap)
+            if last:
+                child.fields = None
+                child.keep_rest = False
+            if child.fields is None:
+                if child.cap is None:
+                    node.fields[name] = None
+                break
+            node = child
+
+    for path, count_key in (counts or {}).items():
+        node = root
+        for segment in path.split("."):
+            name, _ = _parse_segment(segment, path)
+            parent, node = node, (node.fields or {}).get(name)
+            if node is None:
+                node = parent.fields[name] = Shape()
+        node.count_key = count_key
+    return root
+
+
+def _compile(shape):
+    """Compile a Shape into project(value, parent); None means keep the value as-is"""
+    if shape is None:
+        return None
+    item = _compile_item(shape)
+    cap = shape.cap
+    count_key = shape.count_key
+    if cap is None and item is None:
+        return None
+
+    def project(value, parent):
+        if isinstance(value, list):
+            kept = value if cap is None else value[:cap]
+            if count_key is not None and parent is not None and len(value) > len(kept):
+                parent[count_key] = len(value)
+            if item is None:
+                return list(kept)
+            return [item(element) for element in kept]
+        if item is None:
+            return value
+        return item(value)
+
+    return project
+
+
+def _compile_item(shape):
+    """Compile the object part of a Shape into item(value)"""
+    if shape.fields is None:
+        return None
+
+    compiled = {}
+    count_keys = []
+    for key, sub in shape.fields.items():
+        compiled[key] = _compile(sub)
+        if sub is not None and sub.count_key:
+            count_keys.append(sub.count_key)
+    fields = tuple(compiled.items())
+    # Annotations from an earlier pass (e.g. the streaming parser) are kept
+    count_keys = tuple(count_keys)
+
+    if shape.keep_rest:
+        def item(value):
+            if not isinstance(value, dict):
+                return value
+            out = {}
+            for key, element in value.items():
+                project = compiled.get(key)
+                out[key] = element if project is None else project(element, out)
+            return out
+        return item
+
+    def item(value):
+        if not isinstance(value, dict):
+            return value
+        out = {}
+        for key, project in fields:
+            if key in value:
+                element = value[key]
+                out[key] = element if project is None else project(element, out)
+        for count_key in count_keys:
+            if count_key in value and count_key not in out:
+                out[count_key] = value[count_key]
+        return out
+    return item
+
+
+class Projection:
+    """A projection declared as field paths, compiled once into a projector"""
+
+    def __init__(self, paths, counts=None):
+        self.paths = tuple(paths)
+        self.shape = build_shape(paths, counts)
+        self.fields = tuple(re.sub(r"\[[^\]]*\]", "", path).replace(".*", "") for path in paths)
+        self._project = _compile(self.shape)
+
+    def __call__(self, value):
+        """Project a single record into a fresh object"""
+        return self._project(value, None)
+
+    def many(self, values, limit=None):
+        """Project the first `limit` records of a list"""
+        project = self._project
+        records = values if limit is None else values[:limit]
+        return [project(value, None) for value in records]
+
+
+def _shallow_size(value):
+    """Cheap size estimate that looks one level deep instead of stringifying"""
+    if isinstance(value, str):
+        return len(value) + 2
+    if isinstance(value, dict):
+        return sum(len(k) + (len(v) if isinstance(v, str) else 8) for k, v in value.items()) + 2
+    if isinstance(value, list):
+        return sum(len(v) if isinstance(v, str) else 8 for v in value) + 2
+    return 4
+
+
+class GenericProjection:
+    """
+    Projection for records without a declared spec
+
+    Keeps the `max_fields` smallest top-level fields, the first
+    `max_nested_keys` keys of nested objects and the first `max_list_items`
+    elements of nested lists.
+    """
+
+    def __init__(self, max_fields=8, max_nested_keys=5, max_list_items=3):
+        self.max_fields = max_fields
+        self.max_nested_keys = max_nested_keys
+        self.max_list_items = max_list_items
+        self.shape = None
+        self.fields = None
+
+    def __call__(self, value):
+        if not isinstance(value, dict):
+            return value
+        keys = value.keys()
+        if len(value) > self.max_fields:
+            keep = set(sorted(keys, key=lambda k: _shallow_size(value[k]))[:self.max_fields])
+            keys = [k for k in value if k in keep]
+        out = {}
+        for key in keys:
+            element = value[key]
+            if isinstance(element, dict) and len(element) > self.max_nested_keys:
+                element = {k: element[k] for k in list(element)[:self.max_nested_keys]}
+            elif isinstance(element, list) and len(element) > self.max_list_items:
+                element = element[:self.max_list_items]
+            out[key] = element
+        return out
+
+    def many(self, values, limit=None):
+        records = values if limit is None else values[:limit]
+        return [self(value) for value in records]
@@ -0,0 +1,313 @@
+"""
+Two-tier TTL response cache for the action group Lambdas.
+
+Tier 1 is an in-process LRU bounded by the total size of the cached payloads.
+Tier 2 is a directory in Lambda's /tmp, which outlives the Python process when
+the runtime is restarted inside the same execution environment. Entries carry
+a fresh TTL plus a stale window: stale entries are served immediately while a
+background thread refreshes them (stale-while-revalidate).
+
+Values are stored as serialized JSON, so every read returns a fresh object that
+callers are free to mutate.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger()
+
+# Defaults, overridable per cache instance
+DEFAULT_MEMORY_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+DEFAULT_DISK_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+DEFAULT_DISK_DIR = os.environ.get("RESPONSE_CACHE_DIR", "/tmp/response-cache")
+
+# Share of the disk budget left in use after a trim, so trims are not
+# repeated on every write once the tier is full
+DISK_TRIM_TARGET = 0.9
+
+# Cache lookup outcomes
+FRESH = "hit"
+STALE = "stale"
+MISS = "miss"
+
+
+class _Entry:
+    __slots__ = ("payload", "expires_at", "stale_until")
+
+    def __init__(self, payload, expires_at, stale_until):
+        self.payload = payload
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+
+
+class TieredCache:
+    """In-memory LRU backed by a /tmp directory, with per-entry TTLs"""
+
+    def __init__(self, name, memory_max_bytes=DEFAULT_MEMORY_MAX_BYTES,
+                 disk_max_bytes=DEFAULT_DISK_MAX_BYTES, disk_dir=DEFAULT_DISK_DIR):
+        self.name = name
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_dir = os.path.join(disk_dir, name) if disk_dir else None
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        # Running size of the disk tier; None until the first write scans it
+        self._disk_bytes = None
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "disk_evictions": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+        }
+        if self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"Disk cache disabled for {name}: {str(e)}")
+                self.disk_dir = None
+
+    # ----- memory tier -----
+
+    def _memory_get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _memory_put(self, key, entry):
+        size = len(entry.payload)
+        if size > self.memory_max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous.payload)
+            self._entries[key] = entry
+            self._memory_bytes += size
+            while self._memory_bytes > self.memory_max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._memory_bytes -= len(evicted.payload)
+                self._stats["evictions"] += 1
+
+    # ----- disk tier -----
+
+    def _disk_path(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.json")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline())
+                if header.get("key") != key:
+                    return None
+                payload = f.read()
+        except (OSError, ValueError):
+            return None
+        return _Entry(payload, header["expires_at"], header["stale_until"])
+
+    def _disk_put(self, key, entry):
+        if not self.disk_dir:
+            return
+        header = json.dumps({
+            "key": key,
+            "expires_at": entry.expires_at,
+            "stale_until": entry.stale_until,
+        }).encode("utf-8")
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(header + b"\n")
+                f.write(entry.payload)
+            # Atomic rename so concurrent readers never see a partial file
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write disk cache entry: {str(e)}")
+            return
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(header) + 1 + len(entry.payload) - replaced
+            over_budget = self._disk_bytes is None or self._disk_bytes > self.disk_max_bytes
+        if over_budget:
+            self._disk_trim()
+
+    def _disk_trim(self):
+        """
+        Recount the tier and, if it is over budget, remove the least recently
+        written files until DISK_TRIM_TARGET of the budget is in use
+        """
+        files = []
+        total = 0
+        try:
+            with os.scandir(self.disk_dir) as it:
+                for item in it:
+                    if not item.name.endswith(".json"):
+                        continue
+                    try:
+                        stat = item.stat()
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, item.path))
+                    total += stat.st_size
+        except OSError as e:
+            logger.warning(f"Could not trim disk cache: {str(e)}")
+            return
+        if total > self.disk_max_bytes:
+            target = self.disk_max_bytes * DISK_TRIM_TARGET
+            files.sort()
+            for _, size, path in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Could not remove disk cache entry: {str(e)}")
+                    continue
+                total -= size
+                with self._lock:
+                    self._stats["disk_evictions"] += 1
+        with self._lock:
+            self._disk_bytes = total
+
+    # ----- public API -----
+
+    def get(self, key):
+        """
+        Look up a key in both tiers
+
+        Returns:
+            Tuple of (value, status) where status is FRESH, STALE or MISS
+        """
+        now = time.time()
+        entry = self._memory_get(key)
+        from_disk = False
+        if entry is None:
+            entry = self._disk_get(key)
+            from_disk = entry is not None
+
+        if entry is None or now >= entry.stale_until:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None, MISS
+
+        if from_disk:
+            # Promote to memory so the next lookup skips the filesystem
+            self._memory_put(key, entry)
+
+        status = FRESH if now < entry.expires_at else STALE
+        with self._lock:
+            self._stats["hits" if status == FRESH else "stale_hits"] += 1
+            if from_disk:
+                self._stats["disk_hits"] += 1
+        return json.loads(entry.payload), status
+
+    def contains(self, key):
+        """Whether a fresh or stale value is cached; unlike get() this is not counted as a lookup"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            entry = self._disk_get(key)
+        return entry is not None and time.time() < entry.stale_until
+
+    def set(self, key, value, ttl, stale_ttl=0):
+        """Store a JSON-serializable value for ttl seconds, servable stale for stale_ttl more"""
+        now = time.time()
+        payload = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        entry = _Entry(payload, now + ttl, now + ttl + stale_ttl)
+        self._memory_put(key, entry)
+        self._disk_put(key, entry)
+
+    def get_or_fetch(self, key, fetch, ttl, stale_ttl=0, cacheable=None):
+        """
+        Return a cached value, calling fetch() on a miss
+
+        Stale entries are returned immediately and refreshed in a background
+        thread. In Lambda that thread may be frozen with the container and
+        finish on the next invocation, which is fine for a cache refresh.
+
+        Args:
+            key: Cache key
+            fetch: Zero-argument callable returning the fresh value
+            ttl: Seconds the value is considered fresh
+            stale_ttl: Extra seconds a stale value may still be served
+            cacheable: Optional predicate deciding whether a fetched value is stored
+
+        Returns:
+            Tuple of (value, status)
+        """
+        value, status = self.get(key)
+        if status == FRESH:
+            return value, status
+        if status == STALE:
+            self._refresh_in_background(key, fetch, ttl, stale_ttl, cacheable)
+            return value, status
+
+        value = fetch()
+        if cacheable is None or cacheable(value):
+            self.set(key, value, ttl, stale_ttl)
+        return value, MISS
+
+    def _refresh_in_background(self, key, fetch, ttl, stale_ttl, cacheable):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self._stats["refreshes"] += 1
+
+        def refresh():
+            try:
+                value = fetch()
+                if cacheable is None or cacheable(value):
+                    self.set(key, value, ttl, stale_ttl)
+            except Exception as e:
+                logger.warning(f"Background refresh failed for {key}: {str(e)}")
+                with self._lock:
+                    self._stats["refresh_errors"] += 1
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def stats(self):
+        """Return a snapshot of the cache counters"""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["memory_entries"] = len(self._entries)
+            snapshot["memory_bytes"] = self._memory_bytes
+        lookups = snapshot["hits"] + snapshot["stale_hits"] + snapshot["misses"]
+        snapshot["hit_rate"] = round((snapshot["hits"] + snapshot["stale_hits"]) / lookups, 4) if lookups else 0.0
+        return snapshot
+
+    def clear(self):
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+        if self.disk_dir:
+            for name in os.listdir(self.disk_dir):
+                try:
+                    os.remove(os.path.join(self.disk_dir, name))
+                except OSError:
+                    pass
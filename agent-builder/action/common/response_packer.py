@@ -0,0 +1,208 @@
+"""
+Size-budgeted JSON packer for action group response bodies.
+
+Bedrock rejects action group responses over 25KB. Instead of serializing a
+response, checking its size and retrying with fewer results, the packer
+encodes every leaf value exactly once, computes subtree sizes from the encoded
+pieces and then emits a document that fits the budget in a single pass:
+
+  - budget is shared between the children of each object/array with max-min
+    fairness, so small fields (ids, dates, meta) are kept whole and only the
+    largest values are cut down
+  - strings that do not fit are cut on an escape boundary and marked
+  - arrays keep a prefix of elements, each with a meaningful share of budget
+  - everything that was cut or dropped is listed in a truncation report
+
+Output is compact, ASCII-escaped JSON, so its length in characters is its
+size in bytes.
+"""
+import json
+
+# Default budget for a response body, leaving headroom under Bedrock's 25KB
+DEFAULT_BUDGET = 20 * 1024
+
+# Smallest share worth emitting for a partially kept value or array element
+MIN_PARTIAL_BYTES = 48
+MIN_ITEM_BYTES = 256
+
+# Bytes reserved for the truncation report, and how many paths it lists
+REPORT_RESERVE = 640
+REPORT_MAX_PATHS = 15
+
+TRUNCATION_MARKER = "... [truncated]"
+
+_STRING, _SCALAR, _OBJECT, _ARRAY = range(4)
+
+
+def _encode(value):
+    """Encode leaves once into a (kind, size, payload) tree"""
+    if isinstance(value, str):
+        encoded = json.dumps(value)
+        return (_STRING, len(encoded), encoded)
+    if isinstance(value, dict):
+        children = [(json.dumps(str(key)), _encode(child)) for key, child in value.items()]
+        size = 2 + sum(len(key) + 1 + node[1] for key, node in children) + max(0, len(children) - 1)
+        return (_OBJECT, size, children)
+    if isinstance(value, (list, tuple)):
+        children = [_encode(child) for child in value]
+        size = 2 + sum(node[1] for node in children) + max(0, len(children) - 1)
+        return (_ARRAY, size, children)
+    encoded = json.dumps(value)
+    return (_SCALAR, len(encoded), encoded)
+
+
+def _emit_full(node):
+    kind, _, payload = node
+    if kind == _OBJECT:
+        return "{" + ",".join(f"{key}:{_emit_full(child)}" for key, child in payload) + "}"
+    if kind == _ARRAY:
+        return "[" + ",".join(_emit_full(child) for child in payload) + "]"
+    return payload
+
+
+def _cut_string(encoded, budget):
+    """Cut an encoded JSON string to at most budget bytes without splitting an escape"""
+    marker = json.dumps(TRUNCATION_MARKER)[1:-1]
+    cut = budget - len(marker) - 1
+    if cut < 1:
+        return None
+    # Back off if the cut lands inside an escape sequence (\n, \", \uXXXX)
+    backslash = encoded.rfind("\\", max(1, cut - 6), cut)
+    if backslash != -1:
+        run = 0
+        while encoded[backslash - run - 1] == "\\":
+            run += 1
+        if run % 2 == 0:
+            length = 6 if encoded[backslash + 1:backslash + 2] == "u" else 2
+            if backslash + length > cut:
+                cut = backslash
+    return encoded[:cut] + marker + '"'
+
+
+class _Packer:
+    def __init__(self):
+        self.truncated = []
+        self.truncated_count = 0
+
+    def _note(self, path):
+        self.truncated_count += 1
+        if len(self.truncated) < REPORT_MAX_PATHS:
+            self.truncated.append(path)
+
+    def emit(self, node, budget, path):
+        """Emit node within budget bytes; returns None if it cannot be kept at all"""
+        kind, size, payload = node
+        if size <= budget:
+            return _emit_full(node)
+        if kind == _STRING:
+            if budget < MIN_PARTIAL_BYTES:
+                return None
+            self._note(path)
+            return _cut_string(payload, budget)
+        if kind == _SCALAR:
+            return None
+        if kind == _OBJECT:
+            return self._emit_object(payload, budget, path)
+        return self._emit_array(payload, budget, path)
+
+    def _allocate(self, needs, overheads, budget):
+        """Max-min fair split of budget; returns the budget per child or None to drop it"""
+        allocations = [None] * len(needs)
+        remaining = budget
+        left = len(needs)
+        for index in sorted(range(len(needs)), key=lambda i: needs[i] + overheads[i]):
+            share = remaining // left if left else 0
+            left -= 1
+            cost = needs[index] + overheads[index]
+            if cost <= share:
+                allocations[index] = needs[index]
+                remaining -= cost
+            elif share - overheads[index] >= MIN_PARTIAL_BYTES:
+                allocations[index] = share - overheads[index]
+                remaining -= share
+        return allocations
+
+    def _emit_object(self, children, budget, path):
+        # Two bytes of braces, and a key, colon and comma per kept child
+        available = budget - 2
+        needs = [node[1] for _, node in children]
+        overheads = [len(key) + 2 for key, _ in children]
+        allocations = self._allocate(needs, overheads, available)
+
+        parts = []
+        for (key, node), allocation in zip(children, allocations):
+            child_path = f"{path}.{json.loads(key)}" if path else json.loads(key)
+            emitted = self.emit(node, allocation, child_path) if allocation is not None else None
+            if emitted is None:
+                self._note(child_path)
+                continue
+            parts.append(f"{key}:{emitted}")
+        return "{" + ",".join(parts) + "}"
+
+    def _emit_array(self, children, budget, path):
+        available = budget - 2
+        # Keep a prefix of elements that each get a meaningful share
+        keep = len(children)
+        total = sum(node[1] + 1 for node in children)
+        if total > available:
+            keep = min(keep, max(1, available // MIN_ITEM_BYTES))
+        needs = [node[1] for node in children[:keep]]
+        allocations = self._allocate(needs, [1] * keep, available)
+
+        # Noted before the elements so the report's path limit cannot hide it
+        if keep < len(children):
+            self._note(f"{path}[{keep}:{len(children)}]")
+        parts = []
+        for index, (node, allocation) in enumerate(zip(children, allocations)):
+            emitted = self.emit(node, allocation, f"{path}[{index}]") if allocation is not None else None
+            if emitted is None:
+                self._note(f"{path}[{index}]")
+                continue
+            parts.append(emitted)
+        return "[" + ",".join(parts) + "]"
+
+
+def pack(payload, budget=DEFAULT_BUDGET, report_key="truncation"):
+    """
+    Serialize payload as JSON that fits within budget bytes
+
+    Args:
+        payload: JSON-serializable response body
+        budget: Maximum size of the output in bytes
+        report_key: Top-level key for the truncation report when payload is an
+            object; list payloads only return the report
+
+    Returns:
+        Tuple of (json_text, report) where report is None if nothing was cut
+    """
+    root = _encode(payload)
+    if root[1] <= budget:
+        return _emit_full(root), None
+
+    embed = report_key is not None and root[0] == _OBJECT
+    packer = _Packer()
+    text = packer.emit(root, budget - (REPORT_RESERVE if embed else 0), "")
+    if text is None:
+        text = "null"
+
+    report = {
+        "budget_bytes": budget,
+        "original_bytes": root[1],
+        "packed_bytes": len(text),
+        "truncated_count": packer.truncated_count,
+        "truncated": packer.truncated,
+    }
+    if embed:
+        encoded_report = json.dumps(report)
+        while len(encoded_report) > REPORT_RESERVE - len(report_key) - 5 and report["truncated"]:
+            report["truncated"].pop()
+            encoded_report = json.dumps(report)
+        separator = "," if text != "{}" else ""
+        text = f"{text[:-1]}{separator}{json.dumps(report_key)}:{encoded_report}}}"
+    return text, report
+
+
+def fit(payload, budget=DEFAULT_BUDGET, report_key="truncation"):
+    """Like pack(), but return the packed value as Python objects"""
+    text, report = pack(payload, budget, report_key)
+    return (payload if report is None else json.loads(text)), report
@@ -0,0 +1,171 @@
+"""
+Lazy, TTL-cached secrets for the action group Lambdas.
+
+Reading secrets at import time makes every cold start import boto3, build a
+session and wait on Secrets Manager before the handler runs, even for secrets
+the invocation never uses. The provider instead fetches a secret the first
+time it is asked for and keeps it in memory (never on disk) for
+SECRET_CACHE_TTL seconds. After that the cached value is still returned while
+a background thread fetches the current one, so warm invocations never wait
+on Secrets Manager; only a value older than SECRET_CACHE_TTL +
+SECRET_CACHE_STALE_TTL is fetched in the foreground.
+
+boto3 is imported and the client created on the first fetch. Secrets set as
+environment variables are returned from there, as before, without touching
+boto3 at all.
+"""
+import logging
+import os
+import threading
+import time
+
+from singleflight import SingleFlight
+
+logger = logging.getLogger()
+
+AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
+
+# Seconds a secret is used without refreshing, and how much longer it may be
+# used while it is refreshed in the background
+SECRET_CACHE_TTL = float(os.environ.get("SECRET_CACHE_TTL", "900"))
+SECRET_CACHE_STALE_TTL = float(os.environ.get("SECRET_CACHE_STALE_TTL", "3600"))
+
+# Optional Secrets Manager endpoint, e.g. a local stand-in for testing
+SECRETS_MANAGER_ENDPOINT = os.environ.get("SECRETS_MANAGER_ENDPOINT") or None
+
+
+def is_env_var_set(env_var):
+    return env_var in os.environ and os.environ[env_var] not in ("", "0", "false", "False")
+
+
+class SecretProvider:
+    """Secrets Manager values fetched on first use and cached in memory with a TTL"""
+
+    def __init__(self, region=AWS_REGION, ttl=SECRET_CACHE_TTL, stale_ttl=SECRET_CACHE_STALE_TTL,
+                 endpoint_url=SECRETS_MANAGER_ENDPOINT, client=None):
+        """
+        Args:
+            region: AWS region of the secrets
+            ttl, stale_ttl: Fresh and extra stale seconds of a cached secret
+            endpoint_url: Optional Secrets Manager endpoint override
+            client: Optional ready-made secretsmanager client
+        """
+        self.region = region
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.endpoint_url = endpoint_url
+        self._client = client
+        # SecretId -> (value, monotonic time fetched)
+        self._values = {}
+        self._refreshing = set()
+        self._env_warned = set()
+        self._lock = threading.Lock()
+        self._client_lock = threading.Lock()
+        self._in_flight = SingleFlight("secrets")
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "fetches": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "env": 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _get_client(self):
+        with self._client_lock:
+            if self._client is None:
+                # Deferred so cold starts that need no secret never import boto3
+                import boto3
+
+                start = time.monotonic()
+                session = boto3.session.Session()
+                self._client = session.client(
+                    service_name="secretsmanager", region_name=self.region, endpoint_url=self.endpoint_url
+                )
+                logger.info(f"Created Secrets Manager client in {(time.monotonic() - start) * 1000:.1f} ms")
+            return self._client
+
+    def _fetch(self, key):
+        """Fetch a secret from Secrets Manager and cache it; identical concurrent fetches share one call"""
+        def fetch():
+            try:
+                response = self._get_client().get_secret_value(SecretId=key)
+            except Exception as e:
+                logger.error(f"could not get secret {key} from secrets manager: {e}")
+                raise
+            value = response["SecretString"]
+            with self._lock:
+                self._values[key] = (value, time.monotonic())
+                self._stats["fetches"] += 1
+            return value
+
+        value, _ = self._in_flight.do(key, fetch)
+        return value
+
+    def _refresh_in_background(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self._stats["refreshes"] += 1
+
+        def refresh():
+            try:
+                self._fetch(key)
+            except Exception as e:
+                logger.warning(f"Background refresh of secret {key} failed: {str(e)}")
+                self._count("refresh_errors")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _cached(self, key):
+        """Return the cached value of a secret if it may still be used, refreshing stale ones"""
+        with self._lock:
+            cached = self._values.get(key)
+        if cached is None:
+            return None
+        value, fetched_at = cached
+        age = time.monotonic() - fetched_at
+        if age < self.ttl:
+            self._count("hits")
+            return value
+        if age < self.ttl + self.stale_ttl:
+            self._count("stale_hits")
+            self._refresh_in_background(key)
+            return value
+        return None
+
+    def get(self, key):
+        """
+        Return a secret from the environment, the cache or Secrets Manager
+
+        Raises:
+            Exception: Whatever the Secrets Manager client raised if the secret
+                is neither set nor cached and cannot be fetched
+        """
+        if is_env_var_set(key):
+            with self._lock:
+                self._stats["env"] += 1
+                warn = key not in self._env_warned
+                self._env_warned.add(key)
+            if warn:
+                logger.warning(f"getting value for {key} from environment var; recommended to use AWS Secrets Manager instead")
+            return os.environ[key]
+        value = self._cached(key)
+        if value is not None:
+            return value
+        return self._fetch(key)
+
+    def stats(self):
+        """Return a snapshot of the secret cache counters"""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["cached"] = len(self._values)
+        return snapshot
@@ -0,0 +1,105 @@
+"""
+Single-flight coalescing of identical upstream calls.
+
+Concurrent callers asking for the same key (e.g. the same OpenFDA URL from two
+fan-out workers, or a foreground miss racing a background cache refresh) share
+one upstream call: the first caller runs it, the others wait for its result.
+Waiters are bounded by a timeout, after which they make their own call rather
+than hang on a slow leader.
+
+Shared results are handed to every caller as the same object, so callers must
+treat them as read-only.
+"""
+import logging
+import os
+import threading
+
+logger = logging.getLogger()
+
+# Seconds a waiter blocks on another caller's in-flight call before making its own
+DEFAULT_WAIT_TIMEOUT = float(os.environ.get("SINGLEFLIGHT_WAIT_TIMEOUT", "30"))
+
+
+class _Call:
+    __slots__ = ("done", "value", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key"""
+
+    def __init__(self, name, wait_timeout=DEFAULT_WAIT_TIMEOUT):
+        self.name = name
+        self.wait_timeout = wait_timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "calls": 0,
+            "leaders": 0,
+            "coalesced": 0,
+            "wait_timeouts": 0,
+            "shared_errors": 0,
+            "max_waiters": 0,
+        }
+
+    def do(self, key, fn, timeout=None):
+        """
+        Call fn(), or wait for an identical in-flight call and share its result
+
+        Args:
+            key: Hashable identity of the call, e.g. the request URL
+            fn: Zero-argument callable making the upstream call
+            timeout: Seconds to wait for an in-flight call (defaults to wait_timeout)
+
+        Returns:
+            Tuple of (value, shared) where shared is True if another caller's
+            result was reused
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["leaders"] += 1
+            else:
+                call.waiters += 1
+                self._stats["coalesced"] += 1
+                self._stats["max_waiters"] = max(self._stats["max_waiters"], call.waiters)
+
+        if leader:
+            try:
+                call.value = fn()
+                return call.value, False
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                call.done.set()
+
+        wait_timeout = self.wait_timeout if timeout is None else timeout
+        if not call.done.wait(wait_timeout):
+            with self._lock:
+                self._stats["wait_timeouts"] += 1
+            logger.warning(f"{self.name}: in-flight call for {key} still running after {wait_timeout}s, calling directly")
+            return fn(), False
+        if call.error is not None:
+            with self._lock:
+                self._stats["shared_errors"] += 1
+            raise call.error
+        return call.value, True
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["in_flight"] = len(self._calls)
+        snapshot["coalesce_rate"] = round(snapshot["coalesced"] / snapshot["calls"], 3) if snapshot["calls"] else 0.0
+        return snapshot
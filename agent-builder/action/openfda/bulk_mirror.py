@@ -0,0 +1,400 @@
+"""
+Local mirror of OpenFDA bulk downloads with a query engine for `search`.
+
+OpenFDA publishes every endpoint as zipped JSON partitions listed in
+https://api.fda.gov/download.json. Each mirrored endpoint is ingested into its
+own SQLite database:
+
+  docs         one row per record (the record JSON) tagged with its partition
+  fields       one row per leaf value, keyed by dotted field path; values up to
+               EXACT_MAX_CHARS are kept verbatim for .exact, range and
+               _exists_ lookups
+  fields_text  FTS5 index over the field values for analyzed term, phrase and
+               prefix matches
+
+Search strings are parsed with search_syntax and translated into compound
+SELECTs over those tables, so a query answers in milliseconds without
+touching the network. Results come back in the {"meta", "results"} shape of
+the live API; records are returned in ingestion order rather than OpenFDA's
+relevance order.
+
+Refresh is incremental: a partition is only downloaded again when its ETag
+changed, and it is replaced inside one transaction so readers never see a
+half-loaded partition.
+
+Usage:
+    python bulk_mirror.py /mnt/openfda-mirror drug/label drug/ndc device/classification device/510k
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+
+import http_pool
+from search_syntax import And, Exists, Not, Or, Range, Term, parse
+from streaming_json import StreamParser
+
+logger = logging.getLogger()
+
+# Index of bulk download partitions per endpoint
+DOWNLOAD_INDEX_URL = "https://api.fda.gov/download.json"
+
+# Longest value kept verbatim for .exact, range and _exists_ lookups
+EXACT_MAX_CHARS = 256
+
+# Records inserted per executemany batch during ingestion
+INSERT_BATCH = 500
+
+# Bulk partitions are large; allow for slow downloads
+DOWNLOAD_TIMEOUT = 300
+
+_DATE_BOUND = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
+_NUMBER = re.compile(r"^-?\d+(\.\d+)?$")
+_WORD = re.compile(r"\w+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    partition TEXT NOT NULL,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS docs_partition ON docs(partition);
+CREATE TABLE IF NOT EXISTS fields (
+    id INTEGER PRIMARY KEY,
+    doc_id INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    exact TEXT,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fields_exact ON fields(field, exact);
+CREATE INDEX IF NOT EXISTS fields_doc ON fields(doc_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS fields_text USING fts5(
+    value, content='fields', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS fields_ai AFTER INSERT ON fields BEGIN
+    INSERT INTO fields_text(rowid, value) VALUES (new.id, new.value);
+END;
+CREATE TRIGGER IF NOT EXISTS fields_ad AFTER DELETE ON fields BEGIN
+    INSERT INTO fields_text(fields_text, rowid, value) VALUES ('delete', old.id, old.value);
+END;
+CREATE TABLE IF NOT EXISTS partitions (
+    file TEXT PRIMARY KEY,
+    etag TEXT,
+    records INTEGER,
+    loaded_at REAL
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def endpoint_name(endpoint_path):
+    """'/drug/label.json' -> 'drug/label'"""
+    return endpoint_path.strip("/").replace(".json", "")
+
+
+def flatten(record, prefix=""):
+    """Yield (dotted field path, leaf value as text) for every leaf of a record"""
+    if isinstance(record, dict):
+        for key, value in record.items():
+            yield from flatten(value, f"{prefix}{key}.")
+    elif isinstance(record, list):
+        for value in record:
+            yield from flatten(value, prefix)
+    elif record is not None:
+        value = record if isinstance(record, str) else json.dumps(record)
+        yield prefix[:-1], value
+
+
+def _fts_phrase(tokens):
+    return '"' + " ".join(token.replace('"', '""') for token in tokens) + '"'
+
+
+class UnsupportedQuery(ValueError):
+    """Raised for searches the mirror cannot answer faithfully"""
+
+
+class _QueryBuilder:
+    """Translates a search AST into a SELECT of matching doc ids"""
+
+    def __init__(self):
+        self.args = []
+
+    def build(self, node):
+        if isinstance(node, Term):
+            return self._term(node)
+        if isinstance(node, Range):
+            return self._range(node)
+        if isinstance(node, Exists):
+            sql = self._exists(node.field)
+            return f"SELECT id AS doc_id FROM docs EXCEPT {sql}" if node.missing else sql
+        if isinstance(node, Not):
+            return f"SELECT id AS doc_id FROM docs EXCEPT {self._wrap(node.child)}"
+        if isinstance(node, And):
+            positives = [child for child in node.children if not isinstance(child, Not)]
+            negatives = [child.child for child in node.children if isinstance(child, Not)]
+            if not positives:
+                positives_sql = "SELECT id AS doc_id FROM docs"
+            else:
+                positives_sql = " INTERSECT ".join(self._wrap(child) for child in positives)
+            parts = [positives_sql] + [self._wrap(child) for child in negatives]
+            return " EXCEPT ".join(parts)
+        if isinstance(node, Or):
+            return " UNION ".join(self._wrap(child) for child in node.children)
+        raise UnsupportedQuery(f"Unsupported search node {type(node).__name__}")
+
+    def _wrap(self, node):
+        return f"SELECT doc_id FROM ({self.build(node)})"
+
+    def _field_filter(self, field):
+        if field is None:
+            return ""
+        self.args.append(field)
+        return " AND f.field = ?"
+
+    def _term(self, term):
+        if term.exact:
+            if term.prefix:
+                self.args.extend([term.base_field, term.value, term.value + "\uffff"])
+                return "SELECT doc_id FROM fields WHERE field = ? AND exact >= ? AND exact < ?"
+            self.args.extend([term.base_field, term.value])
+            return "SELECT doc_id FROM fields WHERE field = ? AND exact = ?"
+
+        tokens = _WORD.findall(term.value.lower())
+        if not tokens:
+            raise UnsupportedQuery(f"No searchable words in {term.value!r}")
+        if term.prefix:
+            # A trailing * marks the last token of the phrase as a prefix
+            match = _fts_phrase(tokens) + "*"
+        elif term.phrase:
+            match = _fts_phrase(tokens)
+        else:
+            # Unquoted multi-word values match any of the words, as upstream
+            match = " OR ".join(_fts_phrase([token]) for token in tokens)
+        self.args.append(match)
+        sql = "SELECT f.doc_id FROM fields_text JOIN fields f ON f.id = fields_text.rowid WHERE fields_text MATCH ?"
+        return sql + self._field_filter(term.field)
+
+    def _range(self, node):
+        field = node.field[:-len(".exact")] if node.field.endswith(".exact") else node.field
+        bounds = [_DATE_BOUND.sub(r"\1\2\3", b) if b is not None else None for b in (node.low, node.high)]
+        numeric = all(b is None or (_NUMBER.match(b) and len(b) != 8) for b in bounds)
+        column = "CAST(exact AS REAL)" if numeric else "exact"
+        sql = "SELECT doc_id FROM fields WHERE field = ?"
+        self.args.append(field)
+        for bound, operator in zip(bounds, (">=", "<=")):
+            if bound is not None:
+                sql += f" AND {column} {operator} ?"
+                self.args.append(float(bound) if numeric else bound)
+        return sql
+
+    def _exists(self, field):
+        # The field itself, or any field nested under it ("/" sorts right after ".")
+        self.args.extend([field, field + ".", field + "/"])
+        return "SELECT doc_id FROM fields WHERE field = ? OR (field > ? AND field < ?)"
+
+
+class BulkMirror:
+    """Read/write access to the mirror database of one endpoint"""
+
+    def __init__(self, path, endpoint, readonly=False):
+        self.path = path
+        self.endpoint = endpoint
+        self.readonly = readonly
+        self._local = threading.local()
+        if not readonly:
+            with self._connect() as conn:
+                conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.readonly:
+                conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            else:
+                conn = sqlite3.connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def state(self):
+        rows = self._connect().execute("SELECT key, value FROM state").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    # ----- queries -----
+
+    def search(self, search=None, limit=1, skip=0):
+        """
+        Answer a search like the live endpoint
+
+        Returns:
+            {"meta": ..., "results": [...]} with meta.results.total set
+
+        Raises:
+            SearchSyntaxError, UnsupportedQuery: If the search cannot be answered
+        """
+        conn = self._connect()
+        if search:
+            builder = _QueryBuilder()
+            matching = builder.build(parse(search))
+            args = builder.args
+            total = conn.execute(f"SELECT COUNT(DISTINCT doc_id) FROM ({matching})", args).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT doc FROM docs WHERE id IN ({matching}) ORDER BY id LIMIT ? OFFSET ?",
+                args + [limit, skip]
+            ).fetchall()
+        else:
+            total = conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+            rows = conn.execute("SELECT doc FROM docs ORDER BY id LIMIT ? OFFSET ?", (limit, skip)).fetchall()
+
+        state = self.state()
+        meta = dict(state.get("meta", {}))
+        meta["results"] = {"skip": skip, "limit": limit, "total": total}
+        meta["source"] = "bulk_mirror"
+        return {"meta": meta, "results": [json.loads(row[0]) for row in rows]}
+
+    # ----- ingestion -----
+
+    def _load_partition(self, file, read):
+        """Replace the records of one partition with those read from a JSON stream"""
+        conn = self._connect()
+        parser = StreamParser(read)
+        count = 0
+        with conn:
+            conn.execute("DELETE FROM fields WHERE doc_id IN (SELECT id FROM docs WHERE partition = ?)", (file,))
+            conn.execute("DELETE FROM docs WHERE partition = ?", (file,))
+            batch = []
+            for record in parser.iter_results():
+                batch.append(record)
+                if len(batch) >= INSERT_BATCH:
+                    count += self._insert(conn, file, batch)
+                    batch = []
+            count += self._insert(conn, file, batch)
+            if parser.meta:
+                conn.execute(
+                    "INSERT OR REPLACE INTO state(key, value) VALUES ('meta', ?)",
+                    (json.dumps({k: v for k, v in parser.meta.items() if k != "results"}),)
+                )
+        return count
+
+    def _insert(self, conn, file, records):
+        for record in records:
+            doc_id = conn.execute(
+                "INSERT INTO docs(partition, doc) VALUES (?, ?)", (file, json.dumps(record))
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO fields(doc_id, field, exact, value) VALUES (?, ?, ?, ?)",
+                [(doc_id, field, value if len(value) <= EXACT_MAX_CHARS else None, value)
+                 for field, value in flatten(record)]
+            )
+        return len(records)
+
+    def refresh(self, manifest=None):
+        """
+        Bring the mirror up to date with the bulk download index
+
+        Partitions whose ETag is unchanged are skipped, partitions no longer
+        listed are dropped.
+
+        Returns:
+            Dict with the number of partitions loaded, skipped and removed
+        """
+        manifest = manifest or http_pool.get_json(DOWNLOAD_INDEX_URL, timeout=60)
+        category, name = self.endpoint.split("/")
+        entry = manifest["results"][category][name]
+        conn = self._connect()
+        known = dict(conn.execute("SELECT file, etag FROM partitions").fetchall())
+        summary = {"loaded": 0, "skipped": 0, "removed": 0}
+
+        for partition in entry["partitions"]:
+            file = partition["file"]
+            etag = self._download_and_load(file, known.get(file))
+            if etag is None:
+                summary["skipped"] += 1
+                continue
+            summary["loaded"] += 1
+
+        listed = {partition["file"] for partition in entry["partitions"]}
+        for file in set(known) - listed:
+            with conn:
+                conn.execute("DELETE FROM fields WHERE doc_id IN (SELECT id FROM docs WHERE partition = ?)", (file,))
+                conn.execute("DELETE FROM docs WHERE partition = ?", (file,))
+                conn.execute("DELETE FROM partitions WHERE file = ?", (file,))
+            summary["removed"] += 1
+
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO state(key, value) VALUES ('export_date', ?)",
+                (json.dumps(entry.get("export_date")),)
+            )
+        logger.info(f"Refreshed {self.endpoint} mirror: {summary}")
+        return summary
+
+    def _download_and_load(self, file, etag):
+        """Download a partition unless its ETag matches; returns the new ETag or None if unchanged"""
+        headers = {"If-None-Match": etag} if etag else None
+        with http_pool.stream("GET", file, headers=headers, timeout=DOWNLOAD_TIMEOUT) as response:
+            if response.status == 304:
+                return None
+            new_etag = response.headers.get("etag", "")
+            # zipfile needs a seekable file, so spool the archive to local disk
+            with tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(self.path))) as spool:
+                while True:
+                    chunk = response.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    spool.write(chunk)
+                spool.seek(0)
+                with zipfile.ZipFile(spool) as archive:
+                    member = next(n for n in archive.namelist() if n.endswith(".json"))
+                    with archive.open(member) as body:
+                        records = self._load_partition(file, body.read)
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO partitions(file, etag, records, loaded_at) VALUES (?, ?, ?, ?)",
+                (file, new_etag, records, time.time())
+            )
+        logger.info(f"Loaded {records} records from {file}")
+        return new_etag
+
+
+class MirrorSet:
+    """Read-only mirrors found in a directory, opened on first use"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._mirrors = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, endpoint):
+        return os.path.join(self.directory, endpoint.replace("/", "-") + ".db")
+
+    def get(self, endpoint_path):
+        """Return the mirror for an endpoint path, or None if it has not been ingested"""
+        endpoint = endpoint_name(endpoint_path)
+        with self._lock:
+            if endpoint not in self._mirrors:
+                path = self.path_for(endpoint)
+                self._mirrors[endpoint] = BulkMirror(path, endpoint, readonly=True) if os.path.exists(path) else None
+            return self._mirrors[endpoint]
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 3:
+        sys.exit("usage: bulk_mirror.py MIRROR_DIR ENDPOINT [ENDPOINT ...]")
+    directory = sys.argv[1]
+    os.makedirs(directory, exist_ok=True)
+    index = http_pool.get_json(DOWNLOAD_INDEX_URL, timeout=60)
+    for endpoint in sys.argv[2:]:
+        mirror = BulkMirror(MirrorSet(directory).path_for(endpoint), endpoint)
+        mirror.refresh(index)
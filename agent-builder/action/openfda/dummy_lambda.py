@@ -1,8 +1,21 @@
 import json
 import os
 import urllib.parse
-import urllib.request
 import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import http_pool
+from bulk_mirror import MirrorSet, UnsupportedQuery
+from http_pool import HTTPStatusError
+from kb_manifest import ManifestReader
+from response_cache import MISS, TieredCache
+from projection import GenericProjection, Projection
+from singleflight import SingleFlight
+from rate_governor import RateGovernor, RateLimitExceeded, SharedTokenBucket, TokenBucket
+from search_syntax import SearchNormalizer, SearchSyntaxError
+from response_packer import pack
+from streaming_json import parse_page
 
 # Configure logging
 logger = logging.getLogger()
@@ -17,6 +30,162 @@ API_KEY = os.environ.get("OPENFDA_API_KEY", "")
 # Maximum response size in bytes (set to 20KB to provide some buffer)
 MAX_RESPONSE_SIZE = 20 * 1024
 
+# Per-request timeout for OpenFDA calls in seconds
+REQUEST_TIMEOUT = float(os.environ.get("OPENFDA_TIMEOUT", "10"))
+
+# Request pacing; OpenFDA allows 240 requests per minute per API key
+RATE_LIMIT_PER_SECOND = float(os.environ.get("OPENFDA_RATE_PER_SECOND", "4"))
+RATE_LIMIT_BURST = int(os.environ.get("OPENFDA_RATE_BURST", "8"))
+
+# Optional lock file through which co-located workers share one request budget
+RATE_LIMIT_STORE = os.environ.get("OPENFDA_RATE_STORE", "")
+
+if RATE_LIMIT_STORE:
+    rate_bucket = SharedTokenBucket(RATE_LIMIT_STORE, RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+else:
+    rate_bucket = TokenBucket(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+rate_governor = RateGovernor(rate_bucket)
+
+# Parse response bodies incrementally instead of decoding them in full
+STREAMING_ENABLED = os.environ.get("OPENFDA_STREAMING", "true").lower() == "true"
+
+# Cache TTLs per endpoint as (fresh seconds, extra stale-while-revalidate seconds).
+# Reference data such as labels and classifications changes far less often
+# than the adverse event and enforcement feeds.
+CACHE_TTLS = {
+    "/drug/event": (3600, 6 * 3600),
+    "/drug/label": (7 * 24 * 3600, 7 * 24 * 3600),
+    "/drug/ndc": (24 * 3600, 7 * 24 * 3600),
+    "/drug/enforcement": (6 * 3600, 24 * 3600),
+    "/drug/drugsfda": (24 * 3600, 7 * 24 * 3600),
+    "/drug/shortages": (3600, 6 * 3600),
+    "/device/event": (3600, 6 * 3600),
+    "/device/classification": (7 * 24 * 3600, 7 * 24 * 3600),
+    "/device/510k": (24 * 3600, 7 * 24 * 3600),
+    "/device/enforcement": (6 * 3600, 24 * 3600),
+    "/device/pma": (24 * 3600, 7 * 24 * 3600),
+    "/device/registrationlisting": (24 * 3600, 7 * 24 * 3600),
+    "/device/recall": (6 * 3600, 24 * 3600),
+}
+DEFAULT_CACHE_TTL = (3600, 6 * 3600)
+
+# Response cache shared across warm invocations (memory LRU + /tmp)
+response_cache = TieredCache("openfda")
+
+# Concurrent requests for the same URL (fan-out workers, background refreshes)
+# share one upstream call
+in_flight = SingleFlight("openfda")
+
+# Searches are rewritten to one canonical form so equivalent spellings share
+# a cache entry (and an in-flight call)
+search_normalizer = SearchNormalizer()
+
+# Directory of bulk-data mirrors built with bulk_mirror.py (e.g. on EFS);
+# unset to always query the live API
+MIRROR_DIR = os.environ.get("OPENFDA_MIRROR_DIR", "")
+
+# Endpoints answered from the local mirror when it has been ingested
+MIRRORED_ENDPOINTS = {
+    "/drug/label.json",
+    "/drug/ndc.json",
+    "/device/classification.json",
+    "/device/510k.json"
+}
+
+mirrors = MirrorSet(MIRROR_DIR) if MIRROR_DIR else None
+
+# Index of the product summaries that exist in the KB bucket, built with
+# kb_manifest.py; without it every product_id gets a (possibly dead) link
+KB_MANIFEST_PATH = os.environ.get(
+    "KB_MANIFEST_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "kb-manifest.idx")
+)
+kb_manifest = ManifestReader(KB_MANIFEST_PATH)
+
+# Number of results returned to the agent per call
+RESULTS_PER_RESPONSE = 3
+
+# Map API paths to OpenFDA endpoint paths and types
+ENDPOINT_MAPPING = {
+    # Drug endpoints
+    "/drug/event": ("/drug/event.json", "drug_event"),
+    "/drug/label": ("/drug/label.json", None),
+    "/drug/ndc": ("/drug/ndc.json", None),
+    "/drug/enforcement": ("/drug/enforcement.json", None),
+    "/drug/drugsfda": ("/drug/drugsfda.json", None),
+    "/drug/shortages": ("/drug/shortages.json", None),
+
+    # Device endpoints
+    "/device/event": ("/device/event.json", "device_event"),
+    "/device/classification": ("/device/classification.json", "classification"),
+    "/device/510k": ("/device/510k.json", None),
+    "/device/enforcement": ("/device/enforcement.json", None),
+    "/device/pma": ("/device/pma.json", None),
+    "/device/registrationlisting": ("/device/registrationlisting.json", None),
+    "/device/recall": ("/device/recall.json", None)
+}
+
+# Aggregation paths answered with OpenFDA's count= parameter, mapped to
+# the endpoint they count over
+COUNT_ENDPOINTS = {
+    "/drug/event/count": "/drug/event.json",
+    "/device/event/count": "/device/event.json"
+}
+
+# Number of ranked terms returned by count paths by default and at most
+DEFAULT_COUNT_LIMIT = 10
+MAX_COUNT_LIMIT = 1000
+
+# Datasets queried concurrently by the umbrella search paths
+SEARCH_FANOUT = {
+    "/drug/search": ["event", "label", "ndc", "enforcement"],
+    "/device/search": ["event", "classification", "510k", "enforcement"]
+}
+
+# Bounded worker pool and per-call deadline (seconds) for search fan-out
+FANOUT_MAX_WORKERS = int(os.environ.get("OPENFDA_FANOUT_WORKERS", "8"))
+FANOUT_DEADLINE = float(os.environ.get("OPENFDA_FANOUT_DEADLINE", "8"))
+
+# Time (seconds) kept back from the Lambda deadline to build the response
+DEADLINE_MARGIN = 1.0
+
+# Worker pool shared across warm invocations
+fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS, thread_name_prefix="openfda-fanout")
+
+# Fields each endpoint type keeps, compiled once into single-pass projectors
+PROJECTIONS = {
+    "drug_event": Projection(
+        [
+            "receivedate", "safetyreportid", "serious", "seriousnessdeath",
+            "patient.*",
+            "patient.drug[:2].medicinalproduct",
+            "patient.drug[:2].drugindication",
+            "patient.drug[:2].drugcharacterization",
+            "patient.reaction[:3]"
+        ],
+        counts={
+            "patient.drug": "drug_count_original",
+            "patient.reaction": "reaction_count_original"
+        }
+    ),
+    "device_event": Projection(
+        [
+            "report_number", "date_received", "event_type",
+            "device[:2].brand_name",
+            "device[:2].generic_name",
+            "device[:2].device_event_type",
+            "device[:2].device_report_product_code"
+        ],
+        counts={"device": "device_count_original"}
+    ),
+    "classification": Projection([
+        "device_name", "device_class", "medical_specialty_description",
+        "regulation_number", "product_code"
+    ]),
+}
+
+# Everything else keeps its 8 smallest top-level fields with nested values capped
+GENERIC_PROJECTION = GenericProjection(max_fields=8, max_nested_keys=5, max_list_items=3)
+
 def build_url(path, params=None):
     """Build the OpenFDA API URL"""
     url = f"{OPENFDA_BASE_URL}{path}"
@@ -35,22 +204,76 @@ def build_url(path, params=None):
         
     return url
 
+def cache_key(url):
+    """Normalize a URL from build_url into a cache key without the API key"""
+    parsed = urllib.parse.urlsplit(url)
+    query = [(k, v) for k, v in urllib.parse.parse_qsl(parsed.query, keep_blank_values=True) if k != "api_key"]
+    query.sort()
+    return f"{parsed.path}?{urllib.parse.urlencode(query)}"
+
+def get_cache_ttl(endpoint_path):
+    """Look up the (ttl, stale_ttl) pair for an endpoint path"""
+    return CACHE_TTLS.get(endpoint_path.replace(".json", ""), DEFAULT_CACHE_TTL)
+
+def is_cacheable(response_data):
+    """Only cache successful upstream responses"""
+    return "error" not in response_data.get("meta", {}) and "error" not in response_data
+
+def coalesced(url, fetch):
+    """Wrap fetch so concurrent calls for the same URL share one upstream request"""
+    return lambda: in_flight.do(cache_key(url), fetch)[0]
+
+def error_response(e):
+    """Build an OpenFDA-shaped error body for a failed request"""
+    status = 500
+    message = f"Error: {str(e)}"
+    if isinstance(e, HTTPStatusError):
+        # Keep the upstream status and message (e.g. 404 "No matches found!")
+        status = e.status
+        try:
+            message = json.loads(e.body)["error"]["message"]
+        except (ValueError, KeyError, TypeError):
+            pass
+    elif isinstance(e, RateLimitExceeded):
+        status = 429
+    return {
+        "meta": {
+            "status": status,
+            "error": {"message": message}
+        },
+        "results": []
+    }
+
 def make_request(url):
     """Make a request to the OpenFDA API"""
     try:
         logger.info(f"Making request to: {url}")
-        with urllib.request.urlopen(url) as response:
-            data = response.read().decode("utf-8")
-            return json.loads(data)
+        # Pooled keep-alive connection, paced and retried by the rate governor
+        return rate_governor.call(lambda: http_pool.get_json(url, timeout=REQUEST_TIMEOUT))
     except Exception as e:
         logger.error(f"Error making request: {str(e)}")
-        return {
-            "meta": {
-                "status": 500,
-                "error": {"message": f"Error: {str(e)}"}
-            },
-            "results": []
-        }
+        return error_response(e)
+
+def make_streaming_request(url, item_shape=None, max_results=None):
+    """
+    Make a request to the OpenFDA API, parsing the body as it arrives
+
+    Results are projected to item_shape while parsing and reading stops once
+    max_results results (and the meta object) have been collected.
+    """
+    try:
+        logger.info(f"Streaming request to: {url}")
+        
+        def fetch():
+            with http_pool.stream("GET", url, timeout=REQUEST_TIMEOUT) as response:
+                return parse_page(response.read, item_shape, max_results)
+        
+        page, parser = rate_governor.call(fetch)
+        logger.info(f"Parsed {parser.results_seen} results from {parser.bytes_read} bytes (complete={parser.complete})")
+        return page
+    except Exception as e:
+        logger.error(f"Error making request: {str(e)}")
+        return error_response(e)
 
 def limit_response_size(response_data, max_results=3, endpoint_type=None):
     """
@@ -64,125 +287,25 @@ def limit_response_size(response_data, max_results=3, endpoint_type=None):
     Returns:
         Limited response data
     """
-    # Get a copy of the original data
+    # Build a fresh response; the original data is left untouched
     limited_data = {
-        "meta": response_data.get("meta", {}),
+        "meta": dict(response_data.get("meta", {})),
         "results": []
     }
     
     # Add summary of total results
     if "results" in response_data:
-        total_results = len(response_data["results"])
+        # Report the true number of matches, not just the size of the fetched page
+        total_results = limited_data["meta"].get("results", {}).get("total", len(response_data["results"]))
         limited_data["meta"]["total_results"] = total_results
-        limited_data["meta"]["results_shown"] = min(max_results, total_results)
+        limited_data["meta"]["results_shown"] = min(max_results, len(response_data["results"]))
         
-        # Only include the specified number of results
-        limited_data["results"] = response_data["results"][:max_results]
-        
-        # Apply endpoint-specific limiting
-        if endpoint_type == "drug_event":
-            limit_drug_event_results(limited_data, response_data)
-        elif endpoint_type == "device_event":
-            limit_device_event_results(limited_data, response_data)
-        elif endpoint_type == "classification":
-            limit_classification_results(limited_data)
-        else:
-            # Generic field limiting - keep only top-level fields and first-level child objects
-            limit_generic_results(limited_data)
+        # Project the specified number of results with the endpoint's projection
+        projection = PROJECTIONS.get(endpoint_type, GENERIC_PROJECTION)
+        limited_data["results"] = projection.many(response_data["results"], max_results)
     
     return limited_data
 
-def limit_drug_event_results(limited_data, original_data):
-    """Limit fields for drug event results"""
-    for i, result in enumerate(limited_data["results"]):
-        # Keep only essential fields
-        keys_to_keep = ["receivedate", "safetyreportid", "serious", "seriousnessdeath", "patient"]
-        for key in list(result.keys()):
-            if key not in keys_to_keep:
-                result.pop(key, None)
-        
-        # Limit patient data
-        if "patient" in result:
-            patient = result["patient"]
-            
-            # Limit drug information
-            if "drug" in patient:
-                # Keep only first 2 drugs
-                if isinstance(patient["drug"], list) and len(patient["drug"]) > 2:
-                    patient["drug"] = patient["drug"][:2]
-                    if i < len(original_data["results"]) and "patient" in original_data["results"][i]:
-                        patient["drug_count_original"] = len(original_data["results"][i]["patient"]["drug"])
-                
-                # For each drug, keep only essential fields
-                for drug in patient["drug"] if isinstance(patient["drug"], list) else [patient["drug"]]:
-                    keys_to_keep = ["medicinalproduct", "drugindication", "drugcharacterization"]
-                    for key in list(drug.keys()):
-                        if key not in keys_to_keep:
-                            drug.pop(key, None)
-            
-            # Limit reaction information
-            if "reaction" in patient:
-                # Keep only first 3 reactions
-                if isinstance(patient["reaction"], list) and len(patient["reaction"]) > 3:
-                    patient["reaction"] = patient["reaction"][:3]
-                    if i < len(original_data["results"]) and "patient" in original_data["results"][i]:
-                        patient["reaction_count_original"] = len(original_data["results"][i]["patient"]["reaction"])
-
-def limit_device_event_results(limited_data, original_data):
-    """Limit fields for device event results"""
-    for i, result in enumerate(limited_data["results"]):
-        # Keep only essential fields
-        keys_to_keep = ["report_number", "date_received", "event_type", "device"]
-        for key in list(result.keys()):
-            if key not in keys_to_keep:
-                result.pop(key, None)
-        
-        # Limit device information
-        if "device" in result:
-            # Keep only first 2 devices
-            if isinstance(result["device"], list) and len(result["device"]) > 2:
-                result["device"] = result["device"][:2]
-                if i < len(original_data["results"]):
-                    result["device_count_original"] = len(original_data["results"][i]["device"])
-            
-            # For each device, keep only essential fields
-            for device in result["device"] if isinstance(result["device"], list) else [result["device"]]:
-                keys_to_keep = ["brand_name", "generic_name", "device_event_type", "device_report_product_code"]
-                for key in list(device.keys()):
-                    if key not in keys_to_keep:
-                        device.pop(key, None)
-
-def limit_classification_results(limited_data):
-    """Limit fields for device classification results"""
-    for result in limited_data["results"]:
-        # Keep only essential fields
-        keys_to_keep = ["device_name", "device_class", "medical_specialty_description", "regulation_number", "product_code"]
-        for key in list(result.keys()):
-            if key not in keys_to_keep:
-                result.pop(key, None)
-
-def limit_generic_results(limited_data):
-    """Generic field limiting for all other endpoints"""
-    for result in limited_data["results"]:
-        # Keep a maximum of 8 top-level keys per result
-        if len(result) > 8:
-            # Sort keys by length (shorter keys are likely more important metadata)
-            sorted_keys = sorted(result.keys(), key=lambda k: len(str(result[k])))
-            # Keep only first 8 keys
-            keys_to_remove = sorted_keys[8:]
-            for key in keys_to_remove:
-                result.pop(key, None)
-        
-        # Limit nested objects
-        for key, value in result.items():
-            if isinstance(value, dict) and len(value) > 5:
-                # Keep only first 5 keys in nested dictionaries
-                nested_keys = list(value.keys())[:5]
-                result[key] = {k: value[k] for k in nested_keys}
-            elif isinstance(value, list) and len(value) > 3:
-                # Keep only first 3 items in nested lists
-                result[key] = value[:3]
-
 def extract_parameters(parameters):
     """Extract search, limit, and skip parameters from the parameters list"""
     search = None
@@ -205,6 +328,190 @@ def extract_parameters(parameters):
     
     return search, limit, skip
 
+def plan_fetch(endpoint_type, search, limit, skip):
+    """
+    Shape the upstream request to what the response limiting will keep
+
+    limit_response_size only returns RESULTS_PER_RESPONSE results, so asking
+    OpenFDA for the agent's limit (10 by default, up to 1000) transfers and
+    parses records that are thrown away. The true match count is still
+    available from meta.results.total.
+
+    Args:
+        endpoint_type: Type of endpoint for specialized handling
+        search: OpenFDA search expression or None
+        limit: Number of records requested by the agent
+        skip: Number of records to skip
+
+    Returns:
+        Dict with the upstream query params, the number of results to keep
+        and the fields the endpoint type keeps
+    """
+    records = max(1, min(limit, RESULTS_PER_RESPONSE))
+    projection = PROJECTIONS.get(endpoint_type, GENERIC_PROJECTION)
+
+    params = {}
+    if search:
+        params["search"] = search
+    params["limit"] = records
+    if skip > 0:
+        params["skip"] = skip
+
+    return {
+        "params": params,
+        "max_results": records,
+        "fields": projection.fields,
+        "stream_shape": projection.shape,
+        "requested_limit": limit
+    }
+
+def extract_count_parameters(parameters):
+    """Extract search, count, and limit parameters for a count path"""
+    search = None
+    count_field = None
+    limit = DEFAULT_COUNT_LIMIT
+    
+    for param in parameters:
+        if param["name"] == "search":
+            search = param["value"]
+        elif param["name"] == "count":
+            count_field = param["value"]
+        elif param["name"] == "limit":
+            try:
+                limit = int(param["value"])
+            except (ValueError, TypeError):
+                limit = DEFAULT_COUNT_LIMIT
+    
+    return search, count_field, max(1, min(limit, MAX_COUNT_LIMIT))
+
+def handle_count_endpoint(endpoint_path, parameters):
+    """
+    Answer a frequency question with a server-side OpenFDA aggregation
+    
+    A single count= request returns the ranked term/count table for the
+    whole result set, replacing many record fetches.
+    
+    Args:
+        endpoint_path: The endpoint to count over (e.g., /drug/event.json)
+        parameters: List of parameters from the Bedrock agent
+        
+    Returns:
+        Compact ranked term/count table
+    """
+    raw_search, count_field, limit = extract_count_parameters(parameters)
+    search = search_normalizer.normalize(raw_search)
+    if not count_field:
+        return {
+            "error": "The count parameter is required (e.g., patient.reaction.reactionmeddrapt.exact)"
+        }
+    
+    params = {}
+    if search:
+        params["search"] = search
+    params["count"] = count_field
+    params["limit"] = limit
+    url = build_url(endpoint_path, params)
+    
+    # Count tables are cached like any other response
+    ttl, stale_ttl = get_cache_ttl(endpoint_path)
+    response_data, cache_status = response_cache.get_or_fetch(
+        cache_key(url), coalesced(url, lambda: make_request(url)), ttl, stale_ttl, cacheable=is_cacheable
+    )
+    search_normalizer.record_lookup(search != raw_search, cache_status != MISS)
+    
+    upstream_meta = response_data.get("meta", {})
+    results = [
+        {"term": item.get("term"), "count": item.get("count")}
+        for item in response_data.get("results", [])
+    ]
+    meta = {
+        "count_field": count_field,
+        "search": search,
+        "terms_returned": len(results),
+        "last_updated": upstream_meta.get("last_updated"),
+        "cache": dict(response_cache.stats(), status=cache_status)
+    }
+    if "error" in upstream_meta:
+        meta["error"] = upstream_meta["error"]
+    
+    return {"meta": meta, "results": results}
+
+def extract_request_body(event):
+    """Extract the properties of a Bedrock POST request body as parameters"""
+    content = event.get("requestBody", {}).get("content", {})
+    return content.get("application/json", {}).get("properties", [])
+
+def handle_search_fanout(api_path, parameters, context=None):
+    """
+    Run an umbrella search across several datasets concurrently
+    
+    Args:
+        api_path: /drug/search or /device/search
+        parameters: Parameters and request body properties from the Bedrock agent
+        context: Lambda context, used to keep the fan-out inside the remaining time
+        
+    Returns:
+        Merged results keyed by dataset, listing sub-queries that timed out
+    """
+    values = {param["name"]: param["value"] for param in parameters}
+    category = api_path.strip("/").split("/")[0]
+    
+    endpoints = SEARCH_FANOUT[api_path]
+    if values.get("endpoint"):
+        if f"/{category}/{values['endpoint']}" not in ENDPOINT_MAPPING:
+            return {"error": f"Unsupported {category} endpoint: {values['endpoint']}"}
+        endpoints = [values["endpoint"]]
+    
+    # The umbrella paths take "query"; the dataset handlers take "search"
+    sub_parameters = []
+    query = values.get("query") or values.get("search")
+    if query:
+        sub_parameters.append({"name": "search", "value": query})
+    if values.get("limit") is not None:
+        sub_parameters.append({"name": "limit", "value": values["limit"]})
+    
+    deadline = FANOUT_DEADLINE
+    if context is not None:
+        deadline = min(deadline, context.get_remaining_time_in_millis() / 1000 - DEADLINE_MARGIN)
+    
+    futures = {}
+    for endpoint in endpoints:
+        endpoint_path, endpoint_type = ENDPOINT_MAPPING[f"/{category}/{endpoint}"]
+        future = fanout_executor.submit(handle_endpoint, endpoint_path, sub_parameters, endpoint_type)
+        futures[future] = endpoint
+    
+    # Sub-queries not finished at the deadline are reported as timed out and
+    # their results dropped. Lambda freezes the process once the handler
+    # returns, so they cannot be counted on to finish in the background:
+    # queued ones are cancelled, running ones are left to the pool.
+    done, not_done = wait(futures, timeout=max(0.0, deadline))
+    for future in not_done:
+        future.cancel()
+
+    results = {}
+    timed_out = []
+    errors = {}
+    for future, endpoint in futures.items():
+        if future not in done:
+            timed_out.append(endpoint)
+            continue
+        try:
+            results[endpoint] = future.result()
+        except Exception as e:
+            logger.error(f"Error in {category} {endpoint} search: {str(e)}")
+            errors[endpoint] = str(e)
+    
+    meta = {
+        "query": query,
+        "endpoints": endpoints,
+        "timed_out": timed_out
+    }
+    if errors:
+        meta["errors"] = errors
+    logger.info(f"Fan-out {api_path}: {len(results)} completed, timed out: {timed_out}")
+    
+    return {"meta": meta, "results": results}
+
 def get_kb_s3_url(product_id: str) -> str:
     """Generate S3 URL for knowledge base content"""
     # Replace with your actual S3 bucket and prefix
@@ -212,41 +519,131 @@ def get_kb_s3_url(product_id: str) -> str:
     prefix = "product-summaries"
     return f"https://{bucket}.s3.amazonaws.com/{prefix}/{product_id}.json"
 
+def get_kb_object_url(s3_key: str) -> str:
+    """Generate S3 URL for a knowledge base object listed in the manifest"""
+    bucket = "your-kb-bucket"
+    return f"https://{bucket}.s3.amazonaws.com/{s3_key}"
+
+def kb_aliases(result: dict):
+    """Yield the (kind, value) pairs a result can be found under in the KB manifest"""
+    openfda = result.get("openfda") if isinstance(result.get("openfda"), dict) else {}
+    candidates = [
+        ("id", result.get("product_id")),
+        ("ndc", result.get("product_ndc")),
+        ("ndc", openfda.get("product_ndc")),
+        ("brand", result.get("brand_name")),
+        ("brand", openfda.get("brand_name"))
+    ]
+    for kind, values in candidates:
+        for value in values if isinstance(values, list) else [values]:
+            if isinstance(value, str) and value:
+                yield kind, value
+
 def add_kb_metadata(response_data: dict) -> dict:
     """Add knowledge base metadata to response data"""
     if not isinstance(response_data, dict):
         return response_data
+    
+    index = kb_manifest.get()
         
     # Add metadata for each result
     if "results" in response_data:
         for result in response_data["results"]:
-            # Check if this result has knowledge base content
-            if "product_id" in result:
+            if index is None:
+                # No manifest: assume a summary exists for every product
+                if "product_id" in result:
+                    result["kb_metadata"] = {
+                        "url": get_kb_s3_url(result["product_id"]),
+                        "type": "product_summary",
+                        "source": "knowledge_base"
+                    }
+                continue
+            
+            # Only link summaries the manifest lists, best match first
+            matches = []
+            for kind, value in kb_aliases(result):
+                for summary in index.lookup(kind, value):
+                    if summary not in matches:
+                        matches.append(summary)
+            if matches:
+                summary = matches[0]
                 result["kb_metadata"] = {
-                    "url": get_kb_s3_url(result["product_id"]),
+                    "url": get_kb_object_url(summary["s3_key"]),
                     "type": "product_summary",
-                    "source": "knowledge_base"
+                    "source": "knowledge_base",
+                    "product_id": summary["product_id"],
+                    "size": summary["size"],
+                    "last_modified": summary["last_modified"],
+                    "other_summaries": len(matches) - 1
                 }
     
     return response_data
 
+def search_mirror(endpoint_path, plan):
+    """
+    Answer a planned fetch from the local bulk-data mirror
+
+    Returns:
+        Response in the shape of make_request, or None if the endpoint is not
+        mirrored or the search cannot be answered locally
+    """
+    if mirrors is None or endpoint_path not in MIRRORED_ENDPOINTS:
+        return None
+    mirror = mirrors.get(endpoint_path)
+    if mirror is None:
+        return None
+    
+    params = plan["params"]
+    try:
+        response_data = mirror.search(params.get("search"), params["limit"], params.get("skip", 0))
+    except (SearchSyntaxError, UnsupportedQuery, sqlite3.Error) as e:
+        logger.warning(f"Mirror cannot answer {params}, using the live API: {str(e)}")
+        return None
+    
+    if response_data["meta"]["results"]["total"] == 0:
+        # Same body the live API produces for its 404
+        return {
+            "meta": {
+                "status": 404,
+                "error": {"message": "No matches found!"}
+            },
+            "results": []
+        }
+    return response_data
+
 def handle_endpoint(endpoint_path, parameters, endpoint_type=None):
     """Handle different OpenFDA API endpoints"""
     # Extract parameters
-    search, limit, skip = extract_parameters(parameters)
+    raw_search, limit, skip = extract_parameters(parameters)
+    search = search_normalizer.normalize(raw_search)
     
-    # Build URL
-    url = build_url(endpoint_path, {
-        "search": search,
-        "limit": limit,
-        "skip": skip
-    })
+    # Only fetch the records that will be returned
+    plan = plan_fetch(endpoint_type, search, limit, skip)
+    logger.info(f"Fetch plan: {plan['params']} fields={plan['fields']}")
     
-    # Make request
-    response_data = make_request(url)
+    # Answer from the local bulk-data mirror when possible
+    response_data = search_mirror(endpoint_path, plan)
+    if response_data is not None:
+        cache_status = "mirror"
+    else:
+        # Build URL
+        url = build_url(endpoint_path, plan["params"])
+        
+        # Serve from the response cache, falling back to the API
+        ttl, stale_ttl = get_cache_ttl(endpoint_path)
+        if STREAMING_ENABLED:
+            fetch = lambda: make_streaming_request(url, plan["stream_shape"], plan["max_results"])
+        else:
+            fetch = lambda: make_request(url)
+        response_data, cache_status = response_cache.get_or_fetch(
+            cache_key(url), coalesced(url, fetch), ttl, stale_ttl, cacheable=is_cacheable
+        )
+        search_normalizer.record_lookup(search != raw_search, cache_status != MISS)
     
     # Limit response size
-    limited_data = limit_response_size(response_data, max_results=3, endpoint_type=endpoint_type)
+    limited_data = limit_response_size(response_data, max_results=plan["max_results"], endpoint_type=endpoint_type)
+    limited_data["meta"]["limit_requested"] = plan["requested_limit"]
+    limited_data["meta"]["cache"] = dict(response_cache.stats(), status=cache_status)
     
     # Add knowledge base metadata
     limited_data = add_kb_metadata(limited_data)
@@ -261,20 +658,32 @@ def lambda_handler(event, context):
         action_group = event['actionGroup']
         api_path = event['apiPath']
         http_method = event['httpMethod']
-        parameters = event.get('parameters', [])
+        parameters = event.get('parameters', []) + extract_request_body(event)
         message_version = event.get('messageVersion', '1.0')
         
+        # Keep throttling waits and retries inside the invocation's time
+        rate_governor.set_deadline(context.get_remaining_time_in_millis() if context else None)
+        
         # Handle different endpoints
-        if api_path.startswith('/drug'):
-            result = handle_endpoint(api_path, parameters, endpoint_type="drug")
-        elif api_path.startswith('/device'):
-            result = handle_endpoint(api_path, parameters, endpoint_type="device")
+        clean_api_path = api_path.replace(".json", "")
+        if clean_api_path in SEARCH_FANOUT:
+            result = handle_search_fanout(clean_api_path, parameters, context)
+        elif clean_api_path in COUNT_ENDPOINTS:
+            result = handle_count_endpoint(COUNT_ENDPOINTS[clean_api_path], parameters)
+        elif clean_api_path in ENDPOINT_MAPPING:
+            endpoint_path, endpoint_type = ENDPOINT_MAPPING[clean_api_path]
+            result = handle_endpoint(endpoint_path, parameters, endpoint_type=endpoint_type)
         else:
             result = handle_endpoint(api_path, parameters)
         
+        # Fit the body into the size budget in a single serialization pass
+        body, truncation = pack(result, MAX_RESPONSE_SIZE)
+        if truncation:
+            logger.info(f"Response truncated to fit {MAX_RESPONSE_SIZE} bytes: {truncation}")
+        
         response_body = {
             'application/json': {
-                'body': result
+                'body': body
             }
         }
         
@@ -292,6 +701,10 @@ def lambda_handler(event, context):
         }
         
         logger.info(f"Response prepared")
+        logger.info(f"HTTP pool stats: {json.dumps(http_pool.pool_stats())}")
+        logger.info(f"Rate governor stats: {json.dumps(rate_governor.stats())}")
+        logger.info(f"Single-flight stats: {json.dumps(in_flight.stats())}")
+        logger.info(f"Search normalizer stats: {json.dumps(search_normalizer.stats())}")
         return response
         
     except Exception as e:
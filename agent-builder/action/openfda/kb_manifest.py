@@ -0,0 +1,256 @@
+"""
+Memory-mapped index of the product summaries available in the knowledge base.
+
+The index maps product IDs and their aliases (product NDCs, brand names) to
+the summary objects that actually exist in the KB bucket, so enrichment can
+link only to summaries that are there, with their size and last-modified
+time, without a network call.
+
+File layout (little endian):
+    header   8s magic, uint32 entry count, uint64 offset of the offset table
+    entries  key \\t product_id \\t s3_key \\t size \\t last_modified \\n,
+             sorted by key; keys are "id:<product_id>", "ndc:<ndc>" and
+             "brand:<brand name>", lower-cased
+    table    uint64 offset of each entry, in key order
+
+Lookups binary-search the offset table over the mmap, touching O(log n)
+pages. The index is rebuilt from an S3 listing dump with:
+
+    aws s3api list-objects-v2 --bucket your-kb-bucket --prefix product-summaries/ > listing.json
+    python kb_manifest.py kb-manifest.idx listing.json [--aliases aliases.jsonl] [--ndc-mirror drug-ndc.db]
+
+A rebuild always writes a complete new index and swaps it in atomically; the
+listing is compared with the existing index only to report what was added,
+changed or removed, and to leave the file untouched when nothing changed.
+"""
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+
+logger = logging.getLogger()
+
+MAGIC = b"KBIDX001"
+_HEADER = struct.Struct("<8sIQ")
+_OFFSET = struct.Struct("<Q")
+
+SUMMARY_SUFFIX = ".json"
+
+
+def make_key(kind, value):
+    return f"{kind}:{str(value).strip().lower()}".encode("utf-8")
+
+
+class ManifestIndex:
+    """Read-only view of an index file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self._table = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a KB manifest index")
+        self.mtime = os.fstat(self._file.fileno()).st_mtime
+
+    def _offset(self, index):
+        return _OFFSET.unpack_from(self._mm, self._table + index * _OFFSET.size)[0]
+
+    def _key_at(self, index):
+        offset = self._offset(index)
+        return self._mm[offset:self._mm.find(b"\t", offset)]
+
+    def _entry_at(self, index):
+        offset = self._offset(index)
+        line = self._mm[offset:self._mm.find(b"\n", offset)].decode("utf-8")
+        _, product_id, s3_key, size, last_modified = line.split("\t")
+        return {
+            "product_id": product_id,
+            "s3_key": s3_key,
+            "size": int(size),
+            "last_modified": last_modified
+        }
+
+    def lookup(self, kind, value):
+        """Return the summaries indexed under kind:value (kind is id, ndc or brand)"""
+        key = make_key(kind, value)
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if self._key_at(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        matches = []
+        while low < self.count and self._key_at(low) == key:
+            matches.append(self._entry_at(low))
+            low += 1
+        return matches
+
+    def entries(self):
+        """Yield (key, entry) pairs in key order"""
+        for index in range(self.count):
+            yield self._key_at(index).decode("utf-8"), self._entry_at(index)
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+class ManifestReader:
+    """Opens the index on first use and reopens it after a rebuild"""
+
+    def __init__(self, path):
+        self.path = path
+        self._index = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the current ManifestIndex, or None if there is no index file"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return None
+        with self._lock:
+            if self._index is None or self._index.mtime != mtime:
+                # Other threads may still be reading the previous index, so it
+                # is not closed here; its mmap is released once it is unreferenced
+                self._index = ManifestIndex(self.path)
+                logger.info(f"Opened KB manifest index {self.path} with {self._index.count} entries")
+            return self._index
+
+
+def write_index(path, rows):
+    """
+    Write an index file atomically
+
+    Args:
+        path: Destination path
+        rows: Iterable of (key bytes, product_id, s3_key, size, last_modified)
+    """
+    rows = sorted(set(rows))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, 0, 0))
+        offsets = []
+        for key, product_id, s3_key, size, last_modified in rows:
+            offsets.append(f.tell())
+            fields = [product_id, s3_key, str(size), last_modified]
+            f.write(key + b"\t" + "\t".join(fields).encode("utf-8") + b"\n")
+        table = f.tell()
+        for offset in offsets:
+            f.write(_OFFSET.pack(offset))
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, len(offsets), table))
+    os.replace(tmp_path, path)
+
+
+def read_listing(path):
+    """Read summaries from an `aws s3api list-objects-v2` dump as {product_id: (s3_key, size, last_modified)}"""
+    with open(path) as f:
+        listing = json.load(f)
+    summaries = {}
+    for obj in listing.get("Contents", []):
+        key = obj["Key"]
+        if not key.endswith(SUMMARY_SUFFIX):
+            continue
+        product_id = os.path.basename(key)[:-len(SUMMARY_SUFFIX)]
+        summaries[product_id] = (key, int(obj.get("Size", 0)), obj.get("LastModified", ""))
+    return summaries
+
+
+def read_aliases(aliases_path=None, ndc_mirror_path=None):
+    """
+    Collect product NDC and brand aliases as {product_id: set of (kind, value)}
+
+    Aliases come from a JSON lines file ({"product_id", "product_ndc", "brand_name"},
+    values may be lists) and/or the drug/ndc bulk mirror database.
+    """
+    aliases = {}
+
+    def add(product_id, kind, values):
+        if isinstance(values, str):
+            values = [values]
+        for value in values or []:
+            if value:
+                aliases.setdefault(product_id, set()).add((kind, value))
+
+    if aliases_path:
+        with open(aliases_path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    add(record["product_id"], "ndc", record.get("product_ndc"))
+                    add(record["product_id"], "brand", record.get("brand_name"))
+
+    if ndc_mirror_path:
+        conn = sqlite3.connect(f"file:{ndc_mirror_path}?mode=ro", uri=True)
+        try:
+            for (doc,) in conn.execute("SELECT doc FROM docs"):
+                record = json.loads(doc)
+                product_id = record.get("product_id")
+                if product_id:
+                    add(product_id, "ndc", record.get("product_ndc"))
+                    add(product_id, "brand", record.get("brand_name"))
+        finally:
+            conn.close()
+    return aliases
+
+
+def rebuild(index_path, listing_path, aliases_path=None, ndc_mirror_path=None):
+    """
+    Write a complete new index from an S3 listing dump, skipping the write if nothing changed
+
+    Returns:
+        Dict with the number of summaries added, changed, removed and unchanged
+    """
+    summaries = read_listing(listing_path)
+    aliases = read_aliases(aliases_path, ndc_mirror_path)
+
+    rows = set()
+    for product_id, (s3_key, size, last_modified) in summaries.items():
+        rows.add((make_key("id", product_id), product_id, s3_key, size, last_modified))
+        for kind, value in aliases.get(product_id, ()):
+            rows.add((make_key(kind, value), product_id, s3_key, size, last_modified))
+
+    previous = {}
+    previous_rows = set()
+    if os.path.exists(index_path):
+        index = ManifestIndex(index_path)
+        try:
+            for key, entry in index.entries():
+                previous_rows.add((key.encode("utf-8"), entry["product_id"], entry["s3_key"], entry["size"], entry["last_modified"]))
+                if key.startswith("id:"):
+                    previous[entry["product_id"]] = (entry["s3_key"], entry["size"], entry["last_modified"])
+        finally:
+            index.close()
+
+    summary = {
+        "added": len(summaries.keys() - previous.keys()),
+        "removed": len(previous.keys() - summaries.keys()),
+        "changed": sum(1 for p in summaries.keys() & previous.keys() if summaries[p] != previous[p]),
+    }
+    summary["unchanged"] = len(summaries) - summary["added"] - summary["changed"]
+
+    if rows != previous_rows:
+        write_index(index_path, rows)
+        logger.info(f"Wrote KB manifest index {index_path} with {len(rows)} entries: {summary}")
+    else:
+        logger.info(f"KB manifest index {index_path} is up to date")
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the KB manifest index from an S3 listing dump")
+    parser.add_argument("index", help="index file to create or update")
+    parser.add_argument("listing", help="output of aws s3api list-objects-v2")
+    parser.add_argument("--aliases", help="JSON lines file with product_id, product_ndc and brand_name")
+    parser.add_argument("--ndc-mirror", help="drug/ndc bulk mirror database to take aliases from")
+    args = parser.parse_args()
+    print(json.dumps(rebuild(args.index, args.listing, args.aliases, args.ndc_mirror)))
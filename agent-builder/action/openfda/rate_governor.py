@@ -0,0 +1,222 @@
+"""
+Client-side rate governor for OpenFDA requests.
+
+OpenFDA enforces per-key quotas (240 requests per minute with a key). With many
+warm Lambda containers issuing requests at once, bursts run into 429s. The
+governor paces requests through a token bucket and retries throttled or
+transiently failing calls with jittered exponential backoff, honoring
+Retry-After, without ever sleeping past the invocation's deadline.
+
+The bucket is either in-process or, when a shared store path is configured
+(e.g. a file on a mounted volume), coordinated through a lock file so every
+worker on the host draws from one budget.
+"""
+import email.utils
+import fcntl
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from http_pool import HTTPStatusError
+
+logger = logging.getLogger()
+
+# Statuses worth retrying: throttling and transient upstream failures
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class RateLimitExceeded(Exception):
+    """Raised when no request slot is available before the deadline"""
+
+
+class TokenBucket:
+    """In-process token bucket"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Take a token if available; otherwise return seconds until one is"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def pause(self, seconds):
+        """Hold every caller back, e.g. after the server asked to retry later"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+class SharedTokenBucket:
+    """Token bucket stored in a lock-protected file shared by co-located workers"""
+
+    def __init__(self, path, rate, burst):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def _update(self, change):
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except ValueError:
+                    state = {}
+                now = time.time()
+                tokens = state.get("tokens", float(self.burst))
+                updated = state.get("updated", now)
+                state["tokens"] = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+                state["updated"] = now
+                state.setdefault("paused_until", 0.0)
+                result = change(state, now)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def try_acquire(self):
+        def take(state, now):
+            if now < state["paused_until"]:
+                return state["paused_until"] - now
+            if state["tokens"] >= 1:
+                state["tokens"] -= 1
+                return 0.0
+            return (1 - state["tokens"]) / self.rate
+        return self._update(take)
+
+    def pause(self, seconds):
+        def hold(state, now):
+            state["paused_until"] = max(state["paused_until"], now + seconds)
+            state["tokens"] = 0.0
+        self._update(hold)
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (seconds or HTTP date) into seconds"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RateGovernor:
+    """Paces calls through a token bucket and retries throttled ones"""
+
+    def __init__(self, bucket, max_retries=4, base_delay=0.5, max_delay=8.0, deadline_margin=1.0):
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline_margin = deadline_margin
+        self._deadline = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "calls": 0,
+            "throttled": 0,
+            "retried": 0,
+            "gave_up": 0,
+            "paced": 0,
+            "paced_ms": 0.0,
+        }
+
+    def set_deadline(self, remaining_ms):
+        """Bound waits and retries by the remaining invocation time"""
+        if remaining_ms is None:
+            self._deadline = None
+        else:
+            self._deadline = time.monotonic() + remaining_ms / 1000 - self.deadline_margin
+
+    def time_left(self):
+        if self._deadline is None:
+            return float("inf")
+        return self._deadline - time.monotonic()
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _acquire(self):
+        waited = 0.0
+        while True:
+            wait = self.bucket.try_acquire()
+            if wait <= 0:
+                break
+            if wait > self.time_left():
+                raise RateLimitExceeded("No request slot available before the Lambda deadline")
+            time.sleep(wait)
+            waited += wait
+        if waited:
+            self._count("paced")
+            self._count("paced_ms", waited * 1000)
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, fn):
+        """
+        Call fn() once a request slot is available, retrying throttled calls
+
+        Raises:
+            HTTPStatusError: When retries are exhausted or not worthwhile
+            RateLimitExceeded: When no slot frees up before the deadline
+        """
+        self._count("calls")
+        attempt = 0
+        while True:
+            self._acquire()
+            try:
+                return fn()
+            except HTTPStatusError as e:
+                if e.status not in RETRY_STATUSES:
+                    raise
+                retry_after = parse_retry_after(e.headers.get("retry-after"))
+                if e.status == 429:
+                    self._count("throttled")
+                delay = retry_after if retry_after is not None else self.backoff(attempt)
+                if attempt >= self.max_retries or delay > self.time_left():
+                    self._count("gave_up")
+                    raise
+                logger.warning(f"OpenFDA returned {e.status}, retrying in {delay:.2f}s (attempt {attempt + 1})")
+                if e.status == 429:
+                    # Hold back every worker sharing the bucket, not just this
+                    # call; the next _acquire waits the pause out
+                    self.bucket.pause(delay)
+                else:
+                    time.sleep(delay)
+                self._count("retried")
+                attempt += 1
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot["paced_ms"] = round(snapshot["paced_ms"], 1)
+        return snapshot
@@ -0,0 +1,392 @@
+"""
+Parser for the OpenFDA `search` query syntax.
+
+Supported forms (see https://open.fda.gov/apis/query-syntax/):
+    field:term                  openfda.brand_name:lipitor
+    field:"a phrase"            patient.reaction.reactionmeddrapt:"heart attack"
+    field.exact:"Exact Value"   openfda.brand_name.exact:"LIPITOR"
+    field:term*                 prefix wildcard
+    field:[low TO high]         receivedate:[20040101 TO 20081231]
+    field:(a b)                 grouped terms on one field
+    _exists_:field, _missing_:field
+    a AND b, a OR b, NOT a, -a, (grouping)
+
+Terms separated only by whitespace are OR'ed, as in OpenFDA. Agents usually
+write the URL form, so a "+" between terms is read as a space; "+" at the end
+of a value (C++) or inside a quoted phrase is kept.
+"""
+import re
+import threading
+
+
+class SearchSyntaxError(ValueError):
+    """Raised for search strings the parser does not understand"""
+
+
+class Term:
+    """field:value; field is None for a term searched across all fields"""
+
+    __slots__ = ("field", "value", "phrase", "prefix")
+
+    def __init__(self, field, value, phrase=False, prefix=False):
+        self.field = field
+        self.value = value
+        self.phrase = phrase
+        self.prefix = prefix
+
+    @property
+    def exact(self):
+        return self.field is not None and self.field.endswith(".exact")
+
+    @property
+    def base_field(self):
+        """Field name without the .exact suffix"""
+        return self.field[:-len(".exact")] if self.exact else self.field
+
+
+class Range:
+    """field:[low TO high]; an open bound ("*") is None"""
+
+    __slots__ = ("field", "low", "high")
+
+    def __init__(self, field, low, high):
+        self.field = field
+        self.low = low
+        self.high = high
+
+
+class Exists:
+    """_exists_:field, or _missing_:field when missing is True"""
+
+    __slots__ = ("field", "missing")
+
+    def __init__(self, field, missing=False):
+        self.field = field
+        self.missing = missing
+
+
+class Not:
+    __slots__ = ("child",)
+
+    def __init__(self, child):
+        self.child = child
+
+
+class And:
+    """children AND'ed; grouped is True if the expression was written in parentheses"""
+
+    __slots__ = ("children", "grouped")
+
+    def __init__(self, children, grouped=False):
+        self.children = children
+        self.grouped = grouped
+
+
+class Or:
+    """children OR'ed; grouped is True if the expression was written in parentheses"""
+
+    __slots__ = ("children", "grouped")
+
+    def __init__(self, children, grouped=False):
+        self.children = children
+        self.grouped = grouped
+
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<lparen>\() |
+        (?P<rparen>\)) |
+        (?P<op>AND|OR|NOT)(?=[\s()]|$) |
+        (?P<neg>-)(?=[^\s-]) |
+        (?P<field>[A-Za-z0-9_@][A-Za-z0-9_.@-]*):(?=\S) |
+        "(?P<phrase>(?:[^"\\]|\\.)*)" |
+        \[(?P<range>[^\]]*)\] |
+        (?P<word>[^\s()"\[\]]+)
+    )""", re.VERBOSE)
+
+_RANGE = re.compile(r"^\s*(\S+)\s+TO\s+(\S+)\s*$")
+
+
+def _plus_to_space(search):
+    """Replace runs of "+" that separate terms with a space, outside quoted phrases"""
+    out = []
+    in_phrase = False
+    pos = 0
+    while pos < len(search):
+        char = search[pos]
+        if char == '"' and (pos == 0 or search[pos - 1] != "\\"):
+            in_phrase = not in_phrase
+        if char != "+" or in_phrase:
+            out.append(char)
+            pos += 1
+            continue
+        end = pos
+        while end < len(search) and search[end] == "+":
+            end += 1
+        following = search[end] if end < len(search) else ""
+        # A run followed by more of the query separates terms; one that ends a
+        # value ("C++", "C++)") belongs to it
+        if following and not following.isspace() and following not in ")]":
+            out.append(" ")
+        else:
+            out.append(search[pos:end])
+        pos = end
+    return "".join(out)
+
+
+def _tokenize(search):
+    text = _plus_to_space(search)
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        if not text[pos:].strip():
+            break
+        match = _TOKEN.match(text, pos)
+        if not match or match.end() == pos:
+            raise SearchSyntaxError(f"Unexpected input at {pos} in {search!r}")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """Recursive descent: or_expr := and_expr+ ; and_expr := unary (AND unary)*"""
+
+    def __init__(self, search):
+        self.search = search
+        self.tokens = _tokenize(search)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self):
+        node = self.or_expr(None)
+        if self.pos != len(self.tokens):
+            raise SearchSyntaxError(f"Unexpected {self.peek()[1]!r} in {self.search!r}")
+        return node
+
+    def or_expr(self, field):
+        children = []
+        while True:
+            kind, value = self.peek()
+            if kind is None or kind == "rparen":
+                break
+            if kind == "op" and value == "OR":
+                self.take()
+                continue
+            children.append(self.and_expr(field))
+        if not children:
+            raise SearchSyntaxError(f"Empty expression in {self.search!r}")
+        return children[0] if len(children) == 1 else Or(children)
+
+    def and_expr(self, field):
+        children = [self.unary(field)]
+        while self.peek() == ("op", "AND"):
+            self.take()
+            children.append(self.unary(field))
+        return children[0] if len(children) == 1 else And(children)
+
+    def unary(self, field):
+        kind, value = self.peek()
+        if kind == "neg" or (kind == "op" and value == "NOT"):
+            self.take()
+            return Not(self.unary(field))
+        return self.clause(field)
+
+    def clause(self, field):
+        kind, value = self.take()
+        if kind == "lparen":
+            node = self.or_expr(field)
+            if self.take()[0] != "rparen":
+                raise SearchSyntaxError(f"Unbalanced parentheses in {self.search!r}")
+            if isinstance(node, (And, Or)):
+                node.grouped = True
+            return node
+        if kind == "field":
+            if value in ("_exists_", "_missing_"):
+                target_kind, target = self.take()
+                if target_kind not in ("word", "phrase"):
+                    raise SearchSyntaxError(f"{value} needs a field name in {self.search!r}")
+                return Exists(target, missing=value == "_missing_")
+            if self.peek()[0] in ("field", "op", "rparen", None):
+                raise SearchSyntaxError(f"Missing value for {value!r} in {self.search!r}")
+            return self.clause(value)
+        if kind == "range":
+            match = _RANGE.match(value)
+            if not match or field is None:
+                raise SearchSyntaxError(f"Invalid range [{value}] in {self.search!r}")
+            low, high = match.groups()
+            return Range(field, None if low == "*" else low, None if high == "*" else high)
+        if kind == "phrase":
+            return Term(field, re.sub(r"\\(.)", r"\1", value), phrase=True)
+        if kind == "word":
+            if value.endswith("*") and len(value) > 1:
+                return Term(field, value[:-1], prefix=True)
+            return Term(field, value)
+        raise SearchSyntaxError(f"Unexpected {value!r} in {self.search!r}")
+
+
+def parse(search):
+    """
+    Parse an OpenFDA search string into an AST
+
+    Raises:
+        SearchSyntaxError: If the string cannot be parsed
+    """
+    return _Parser(search).parse()
+
+
+_PLAIN_WORD = re.compile(r"^\w+$")
+_NEEDS_QUOTES = re.compile(r'[\s():"\[\]\\+]|^-|^(AND|OR|NOT)$')
+_ISO_DATE = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
+
+
+def _quote(value):
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _format_value(term):
+    if term.prefix:
+        value = term.value if term.exact else term.value.lower()
+        return value + "*"
+    if term.exact:
+        # .exact values are case sensitive and always quoted
+        return _quote(term.value)
+    value = term.value.lower()
+    if term.phrase and not _PLAIN_WORD.match(value):
+        return _quote(value)
+    return _quote(value) if _NEEDS_QUOTES.search(value) else value
+
+
+def _format_bound(bound):
+    return "*" if bound is None else _ISO_DATE.sub(r"\1\2\3", bound)
+
+
+def _flatten(node_type, children):
+    flat = []
+    for child in children:
+        if isinstance(child, node_type):
+            flat.extend(_flatten(node_type, child.children))
+        else:
+            flat.append(child)
+    return flat
+
+
+def _is_mixed_child(node_type, child):
+    return isinstance(child, (And, Or)) and not isinstance(child, node_type)
+
+
+def canonical(node, keep_order=False):
+    """
+    Print an AST in canonical form
+
+    Commutative AND/OR clauses are flattened, deduplicated and sorted,
+    values of analyzed (non-.exact) fields are lower-cased, single-word
+    phrases are unquoted, other phrases and .exact values are quoted, and
+    ISO range bounds are written as YYYYMMDD.
+
+    Parenthesized AND/OR groups are printed in parentheses. Expressions
+    mixing AND and OR without parentheses ("a OR b AND c") keep their
+    clauses in the original order, since OpenFDA's Lucene parser does not
+    give AND precedence over OR and reordering would change the result.
+    """
+    if isinstance(node, Term):
+        value = _format_value(node)
+        return value if node.field is None else f"{node.field}:{value}"
+    if isinstance(node, Range):
+        return f"{node.field}:[{_format_bound(node.low)} TO {_format_bound(node.high)}]"
+    if isinstance(node, Exists):
+        return f"{'_missing_' if node.missing else '_exists_'}:{node.field}"
+    if isinstance(node, Not):
+        inner = canonical(node.child)
+        return f"NOT ({inner})" if isinstance(node.child, (And, Or)) else f"NOT {inner}"
+    if isinstance(node, (And, Or)):
+        node_type = type(node)
+        children = _flatten(node_type, node.children)
+        mixed = any(_is_mixed_child(node_type, child) and not child.grouped for child in children)
+        parts = []
+        for child in children:
+            if _is_mixed_child(node_type, child) and child.grouped:
+                parts.append(f"({canonical(child)})")
+            else:
+                parts.append(canonical(child, keep_order=mixed))
+        if not (mixed or keep_order):
+            parts = sorted(set(parts))
+        return parts[0] if len(parts) == 1 else f" {node_type.__name__.upper()} ".join(parts)
+    raise SearchSyntaxError(f"Cannot print {type(node).__name__}")
+
+
+def normalize(search):
+    """Canonical form of a search string (raises SearchSyntaxError)"""
+    return canonical(parse(search))
+
+
+class SearchNormalizer:
+    """
+    Normalizes search strings and measures what normalization does for caching
+
+    Besides the number of rewritten searches, it tracks how many distinct raw
+    and canonical searches were seen (key_reduction is the share of cache keys
+    saved) and how many cache hits went to rewritten searches, i.e. lookups
+    whose raw key would have been a different cache entry.
+    """
+
+    # Distinct searches remembered per container for the key reduction estimate
+    MAX_TRACKED = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._raw = set()
+        self._canonical = set()
+        self._stats = {
+            "searches": 0,
+            "rewritten": 0,
+            "unparsable": 0,
+            "lookups": 0,
+            "hits": 0,
+            "rewritten_hits": 0,
+        }
+
+    def normalize(self, search):
+        """Return the canonical form of search, or search unchanged if it cannot be parsed"""
+        if not search:
+            return search
+        try:
+            result = normalize(search)
+        except SearchSyntaxError:
+            result = search
+            unparsable = True
+        else:
+            unparsable = False
+        with self._lock:
+            self._stats["searches"] += 1
+            self._stats["unparsable"] += unparsable
+            self._stats["rewritten"] += result != search
+            if len(self._raw) < self.MAX_TRACKED:
+                self._raw.add(search)
+                self._canonical.add(result)
+        return result
+
+    def record_lookup(self, rewritten, hit):
+        """Record a cache lookup made with a normalized search"""
+        with self._lock:
+            self._stats["lookups"] += 1
+            self._stats["hits"] += hit
+            self._stats["rewritten_hits"] += rewritten and hit
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            raw, canonical_count = len(self._raw), len(self._canonical)
+        snapshot["distinct_raw"] = raw
+        snapshot["distinct_canonical"] = canonical_count
+        snapshot["key_reduction"] = round(1 - canonical_count / raw, 3) if raw else 0.0
+        snapshot["hit_rate"] = round(snapshot["hits"] / snapshot["lookups"], 3) if snapshot["lookups"] else 0.0
+        return snapshot
@@ -0,0 +1,271 @@
+"""
+Incremental parser for OpenFDA result pages.
+
+OpenFDA responses have the form {"meta": {...}, "results": [...]}. Instead of
+decoding the whole body with json.loads, the parser reads the HTTP body in
+chunks, yields results[i] one at a time already projected to a Shape (see
+projection.py), skips the subtrees the projection drops without building
+Python objects for them, and stops reading once enough results have been
+collected.
+
+Scanning is done with precompiled byte patterns; only the values that are kept
+are decoded, using json.loads on their byte span.
+"""
+import json
+import re
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+_STRING_BODY = re.compile(rb'(?:[^"\\]|\\.)*"', re.DOTALL)
+_STRUCTURAL = re.compile(rb'["{}\[\]]')
+_SCALAR = re.compile(rb"[^,:\]}\s]+")
+
+
+class StreamParser:
+    """Pull parser over a file-like object's read(size) method"""
+
+    def __init__(self, read, chunk_size=CHUNK_SIZE):
+        self._read = read
+        self._chunk_size = chunk_size
+        self._buf = b""
+        self._pos = 0
+        self._mark = None
+        self._eof = False
+        self.bytes_read = 0
+        self.meta = None
+        self.results_seen = 0
+        self.complete = False
+
+    # ----- buffer management -----
+
+    def _fill(self):
+        """Read the next chunk, discarding consumed bytes not covered by a mark"""
+        if self._eof:
+            return False
+        chunk = self._read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self.bytes_read += len(chunk)
+        keep_from = self._pos if self._mark is None else min(self._pos, self._mark)
+        if keep_from:
+            self._buf = self._buf[keep_from:]
+            self._pos -= keep_from
+            if self._mark is not None:
+                self._mark -= keep_from
+        self._buf += chunk
+        return True
+
+    def _skip_ws(self):
+        """Skip whitespace and return the next byte, or None at end of input"""
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return None
+
+    def _expect(self, char):
+        if self._skip_ws() != char:
+            raise ValueError(f"Expected {chr(char)!r} at offset {self.bytes_read - len(self._buf) + self._pos}")
+        self._pos += 1
+
+    # ----- scanning without allocation -----
+
+    def _skip_string(self):
+        """Advance past a string whose opening quote is at the current position"""
+        start = self._pos + 1
+        while True:
+            match = _STRING_BODY.match(self._buf, start)
+            if match:
+                self._pos = match.end()
+                return
+            # The closing quote is in a later chunk; rescan once it arrives
+            offset = start - self._pos
+            if not self._fill():
+                raise ValueError("Unterminated string")
+            start = self._pos + offset
+
+    def _skip_container(self):
+        """Advance past an object or array starting at the current position"""
+        depth = 0
+        while True:
+            match = _STRUCTURAL.search(self._buf, self._pos)
+            if match is None:
+                self._pos = len(self._buf)
+                if not self._fill():
+                    raise ValueError("Unterminated container")
+                continue
+            char = self._buf[match.start()]
+            self._pos = match.start()
+            if char == 0x22:  # "
+                self._skip_string()
+                continue
+            self._pos += 1
+            if char in (0x7B, 0x5B):  # { [
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def _skip_scalar(self):
+        while True:
+            match = _SCALAR.match(self._buf, self._pos)
+            end = match.end() if match else self._pos
+            if end < len(self._buf) or self._eof:
+                self._pos = end
+                return
+            # The token may continue in the next chunk
+            if not self._fill():
+                self._pos = len(self._buf)
+                return
+
+    def skip_value(self):
+        """Advance past the next value without decoding it"""
+        char = self._skip_ws()
+        if char is None:
+            raise ValueError("Unexpected end of input")
+        if char == 0x22:
+            self._skip_string()
+        elif char in (0x7B, 0x5B):
+            self._skip_container()
+        else:
+            self._skip_scalar()
+
+    # ----- decoding -----
+
+    def parse_value(self):
+        """Decode the next value in full"""
+        self._skip_ws()
+        self._mark = self._pos
+        try:
+            self.skip_value()
+            return json.loads(self._buf[self._mark:self._pos])
+        finally:
+            self._mark = None
+
+    def _parse_key(self):
+        self._skip_ws()
+        self._mark = self._pos
+        try:
+            self._skip_string()
+            raw = self._buf[self._mark + 1:self._pos - 1]
+        finally:
+            self._mark = None
+        if b"\\" in raw:
+            return json.loads(b'"' + raw + b'"')
+        return raw.decode("utf-8")
+
+    def _iter_object(self):
+        """Yield the keys of an object, leaving the position at each value"""
+        self._expect(0x7B)
+        if self._skip_ws() == 0x7D:
+            self._pos += 1
+            return
+        while True:
+            key = self._parse_key()
+            self._expect(0x3A)  # :
+            yield key
+            char = self._skip_ws()
+            self._pos += 1
+            if char == 0x7D:  # }
+                return
+            if char != 0x2C:  # ,
+                raise ValueError("Expected ',' or '}' in object")
+
+    def _iter_array(self):
+        """Yield once per array element, leaving the position at each element"""
+        self._expect(0x5B)
+        if self._skip_ws() == 0x5D:
+            self._pos += 1
+            return
+        while True:
+            yield
+            char = self._skip_ws()
+            self._pos += 1
+            if char == 0x5D:  # ]
+                return
+            if char != 0x2C:
+                raise ValueError("Expected ',' or ']' in array")
+
+    def parse_shaped(self, shape, parent=None):
+        """Decode the next value projected to a Shape"""
+        if shape is None:
+            return self.parse_value()
+
+        char = self._skip_ws()
+        if char == 0x5B:
+            items = []
+            count = 0
+            for _ in self._iter_array():
+                if shape.cap is None or count < shape.cap:
+                    items.append(self._parse_shaped_item(shape))
+                else:
+                    self.skip_value()
+                count += 1
+            if shape.cap is not None and count > shape.cap and shape.count_key and parent is not None:
+                parent[shape.count_key] = count
+            return items
+
+        return self._parse_shaped_item(shape)
+
+    def _parse_shaped_item(self, shape):
+        if shape.fields is None or self._skip_ws() != 0x7B:
+            return self.parse_value()
+        result = {}
+        for key in self._iter_object():
+            if key in shape.fields:
+                result[key] = self.parse_shaped(shape.fields[key], parent=result)
+            elif shape.keep_rest:
+                result[key] = self.parse_value()
+            else:
+                self.skip_value()
+        return result
+
+    # ----- OpenFDA page -----
+
+    def iter_results(self, item_shape=None, max_results=None):
+        """
+        Yield projected results[i] items from an OpenFDA page
+
+        The `meta` object is stored on the parser as soon as it is seen. Once
+        max_results items have been yielded and meta is known, reading stops;
+        if meta comes after the results, the remaining results are skipped
+        without decoding.
+        """
+        for key in self._iter_object():
+            if key == "meta":
+                self.meta = self.parse_value()
+            elif key == "results" and self._skip_ws() == 0x5B:
+                for _ in self._iter_array():
+                    if max_results is None or self.results_seen < max_results:
+                        self.results_seen += 1
+                        yield self.parse_shaped(item_shape)
+                        if max_results is not None and self.results_seen >= max_results and self.meta is not None:
+                            return
+                    else:
+                        self.skip_value()
+            else:
+                self.skip_value()
+        self.complete = True
+
+
+def parse_page(read, item_shape=None, max_results=None, chunk_size=CHUNK_SIZE):
+    """
+    Parse an OpenFDA page from a file-like read(size) method
+
+    Args:
+        read: Callable returning up to size bytes, or b"" at end of input
+        item_shape: Shape applied to each result, or None to keep results whole
+        max_results: Stop after this many results
+        chunk_size: Number of bytes requested per read
+
+    Returns:
+        Tuple of ({"meta": ..., "results": [...]}, parser) where the parser
+        exposes bytes_read and whether the body was read to the end
+    """
+    parser = StreamParser(read, chunk_size)
+    results = list(parser.iter_results(item_shape, max_results))
+    return {"meta": parser.meta or {}, "results": results}, parser
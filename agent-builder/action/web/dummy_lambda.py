@@ -7,7 +7,9 @@ import os
 import urllib.parse
 import urllib.request
 
-import boto3
+from response_packer import fit
+from secret_provider import SecretProvider
+from singleflight import SingleFlight
 
 log_level = os.environ.get("LOG_LEVEL", "INFO").strip().upper()
 logging.basicConfig(format="[%(asctime)s] p%(process)s {%(filename)s:%(lineno)d} %(levelname)s - %(message)s")
@@ -17,31 +19,20 @@ logger.setLevel(log_level)
 AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
 ACTION_GROUP_NAME = os.environ.get("ACTION_GROUP", "action_group_quick_start_laegh")
 FUNCTION_NAMES = ["tavily-ai-search"]
+# Maximum size of the response text in bytes (Bedrock rejects responses over 25KB)
+MAX_RESPONSE_SIZE = int(os.environ.get("MAX_RESPONSE_SIZE", str(20 * 1024)))
 
 
-def is_env_var_set(env_var: str) -> bool:
-    return env_var in os.environ and os.environ[env_var] not in ("", "0", "false", "False")
+# Secrets are fetched on first use and cached across warm invocations, so
+# cold starts do not wait on boto3 and Secrets Manager before the handler runs
+secrets = SecretProvider(region=AWS_REGION)
 
 
 def get_from_secretstore_or_env(key: str) -> str:
-    if is_env_var_set(key):
-        logger.warning(f"getting value for {key} from environment var; recommended to use AWS Secrets Manager instead")
-        return os.environ[key]
-
-    session = boto3.session.Session()
-    secrets_manager = session.client(service_name="secretsmanager", region_name=AWS_REGION)
-    try:
-        secret_value = secrets_manager.get_secret_value(SecretId=key)
-    except Exception as e:
-        logger.error(f"could not get secret {key} from secrets manager: {e}")
-        raise e
-
-    secret: str = secret_value["SecretString"]
-
-    return secret
+    return secrets.get(key)
 
-
-TAVILY_API_KEY = get_from_secretstore_or_env("TAVILY_API_KEY")
+# Identical concurrent searches share one Tavily call
+in_flight = SingleFlight("web")
 
 
 def extract_search_params(action_group, function, parameters):
@@ -74,7 +65,6 @@ def tavily_ai_search(search_query: str, target_website: str = "") -> str:
     base_url = "https://api.tavily.com/search"
     headers = {"Content-Type": "application/json", "Accept": "application/json"}
     payload = {
-        "api_key": TAVILY_API_KEY,
         "query": search_query,
         "search_depth": "advanced",
         "include_images": False,
@@ -85,12 +75,16 @@ def tavily_ai_search(search_query: str, target_website: str = "") -> str:
         "exclude_domains": [],
     }
 
-    data = json.dumps(payload).encode("utf-8")
-    request = urllib.request.Request(base_url, data=data, headers=headers)  # nosec: B310 fixed url we want to open
+    def fetch():
+        data = json.dumps(dict(payload, api_key=get_from_secretstore_or_env("TAVILY_API_KEY"))).encode("utf-8")
+        request = urllib.request.Request(base_url, data=data, headers=headers)  # nosec: B310 fixed url we want to open
+        response = urllib.request.urlopen(request)  # nosec: B310 fixed url we want to open
+        return json.loads(response.read().decode("utf-8"))
 
     try:
-        response = urllib.request.urlopen(request)  # nosec: B310 fixed url we want to open
-        response_data = json.loads(response.read().decode("utf-8"))
+        response_data, shared = in_flight.do((search_query, target_website), fetch)
+        if shared:
+            logger.info(f"reused in-flight Tavily response for {search_query=}")
         logger.debug(f"response from Tavily AI search {response_data=}")
         
         # Format results with URLs and metadata
@@ -147,13 +141,12 @@ def lambda_handler(event, _):  # type: ignore
     for i, url in enumerate(search_data['metadata']['reference_urls'], 1):
         brief_title += f"{i}. {url}\n"
 
-    # Prepare the response with URLs in brief_title
-    function_response_body = {
-        "TEXT": {
-            "body": formatted_content,
-            "brief_title": brief_title
-        }
-    }
+    # Prepare the response with URLs in brief_title, cutting the search
+    # content (not the reference URLs) if it does not fit the size budget
+    text_body, truncation = fit({"body": formatted_content, "brief_title": brief_title}, MAX_RESPONSE_SIZE, report_key=None)
+    if truncation:
+        logger.info(f"response truncated to fit {MAX_RESPONSE_SIZE} bytes: {truncation=}")
+    function_response_body = {"TEXT": text_body}
 
     action_response = {
         "actionGroup": action_group,
@@ -164,5 +157,7 @@ def lambda_handler(event, _):  # type: ignore
     response = {"response": action_response, "messageVersion": event["messageVersion"]}
 
     logger.debug(f"lambda_handler: {response=}")
+    logger.info(f"single-flight stats: {in_flight.stats()}")
+    logger.info(f"secret cache stats: {secrets.stats()}")
 
     return response
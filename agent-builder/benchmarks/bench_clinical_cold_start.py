@@ -0,0 +1,138 @@
+"""
+Benchmark: cold start of the clinical Lambda transport, requests layer vs. stdlib.
+
+Each run starts a fresh Python process (as a Lambda cold start would) and
+measures, inside it:
+  - import:  importing the HTTP client
+               requests: `import requests` from the extracted requests-layer.zip
+               stdlib:   `import http_pool` (http.client + gzip, no layer)
+  - first:   the first GET, including connection setup
+  - warm:    a second GET to the same host (session / pooled connection reused)
+
+against a local HTTP server returning a gzip-encoded studies page, or any URL
+given with --url (e.g. a real ClinicalTrials.gov query).
+
+Usage:
+    python agent-builder/benchmarks/bench_clinical_cold_start.py [--runs 15]
+    python agent-builder/benchmarks/bench_clinical_cold_start.py --url "https://clinicaltrials.gov/api/v2/studies?pageSize=10&format=json"
+"""
+import argparse
+import gzip
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMON_DIR = os.path.join(ROOT, "action", "common")
+LAYER_ZIP = os.path.join(ROOT, "action", "clinical", "requests-layer.zip")
+
+# Runs in the child process; prints {"import", "first", "warm"} in milliseconds
+CHILD = r"""
+import json, sys, time
+option, url = sys.argv[1], sys.argv[2]
+start = time.perf_counter()
+if option == "requests":
+    import requests
+    session = requests.Session()
+    get = lambda: session.get(url, timeout=10).json()
+else:
+    import http_pool
+    get = lambda: http_pool.get_json(url, timeout=10)
+imported = time.perf_counter()
+get()
+first = time.perf_counter()
+get()
+warm = time.perf_counter()
+print(json.dumps({
+    "import": (imported - start) * 1000,
+    "first": (first - imported) * 1000,
+    "warm": (warm - first) * 1000,
+}))
+"""
+
+
+def studies_page(num_studies=10):
+    studies = [
+        {"protocolSection": {"identificationModule": {"nctId": f"NCT{i:08d}", "briefTitle": f"Study {i} of lung cancer"}}}
+        for i in range(num_studies)
+    ]
+    return gzip.compress(json.dumps({"studies": studies, "nextPageToken": "abc"}).encode("utf-8"))
+
+
+def start_server(body):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; avoid delayed-ACK stalls on keep-alive
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/api/v2/studies?format=json&pageSize=10"
+
+
+def run_child(option, url, path):
+    env = dict(os.environ, PYTHONPATH=path, PYTHONDONTWRITEBYTECODE="1")
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, option, url], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=15)
+    parser.add_argument("--url", help="URL to fetch instead of the local server")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if not url:
+        server, url = start_server(studies_page())
+
+    with tempfile.TemporaryDirectory() as layer_dir:
+        with zipfile.ZipFile(LAYER_ZIP) as layer:
+            layer.extractall(layer_dir)
+        paths = {
+            "requests": os.path.join(layer_dir, "python"),
+            "stdlib": COMMON_DIR,
+        }
+
+        # One untimed run each so both start from a warm page cache
+        for option, path in paths.items():
+            run_child(option, url, path)
+
+        results = {option: [] for option in paths}
+        for _ in range(args.runs):
+            for option, path in paths.items():
+                results[option].append(run_child(option, url, path))
+
+    if server:
+        server.shutdown()
+
+    print(f"{args.runs} cold starts per option against {url}")
+    print(f"{'option':<10}{'import ms':>12}{'first GET ms':>15}{'warm GET ms':>14}{'total ms':>11}")
+    for option, runs in results.items():
+        medians = {key: statistics.median(run[key] for run in runs) for key in ("import", "first", "warm")}
+        total = medians["import"] + medians["first"]
+        print(f"{option:<10}{medians['import']:>12.1f}{medians['first']:>15.1f}{medians['warm']:>14.1f}{total:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Microbenchmark: ranking trial sites by distance for /closest_trials.
+
+Compares a brute-force haversine over every site against geo.rank_closest
+(grid index + batched haversine over the candidate cells) on synthetic sites
+spread over the continental US.
+
+Usage:
+    python agent-builder/benchmarks/bench_closest_trials.py [--trials 500] [--sites 20] [--radius 300]
+"""
+import argparse
+import math
+import random
+import statistics
+import sys
+import os
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "action", "clinical"))
+
+import geo  # noqa: E402
+
+
+def brute_force(sites, lat, lon, radius_km):
+    closest = {}
+    for group, site, site_lat, site_lon in sites:
+        lat1, lat2 = math.radians(lat), math.radians(site_lat)
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(math.radians(site_lon - lon) / 2) ** 2
+        distance = 2 * geo.EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+        if distance <= radius_km and (group not in closest or distance < closest[group][2]):
+            closest[group] = (group, site, distance)
+    return sorted(closest.values(), key=lambda item: item[2])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=500)
+    parser.add_argument("--sites", type=int, default=20, help="sites per trial")
+    parser.add_argument("--radius", type=float, default=300, help="search radius in km")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    sites = [
+        (f"NCT{trial:08d}", {"facility": f"Site {site}"}, rng.uniform(25, 49), rng.uniform(-124, -67))
+        for trial in range(args.trials) for site in range(args.sites)
+    ]
+    origin = (41.88, -87.63)
+
+    expected = [(group, round(distance, 6)) for group, _, distance in brute_force(sites, *origin, args.radius)]
+    actual = [(group, round(distance, 6)) for group, _, distance in geo.rank_closest(sites, *origin, args.radius)]
+    assert expected == actual, "grid ranking differs from brute force"
+
+    print(f"{len(sites)} sites, {len(expected)} trials within {args.radius:g} km (numpy: {geo.np is not None})")
+    for name, fn in (("brute", brute_force), ("grid", geo.rank_closest)):
+        times = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            fn(sites, *origin, args.radius)
+            times.append((time.perf_counter() - start) * 1000)
+        print(f"{name:<6} median {statistics.median(times):7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
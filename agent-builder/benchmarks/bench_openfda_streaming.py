@@ -0,0 +1,179 @@
+"""
+Benchmark: streaming OpenFDA page parsing vs. full json.loads.
+
+Serves a synthetic /drug/event.json page (deeply nested patient.drug arrays,
+gzip encoded) from a local HTTP server and compares:
+  - reference: urllib.urlopen + json.loads + limit_response_size
+    (action-examples/openfda, the original path)
+  - pooled:    pooled keep-alive transport + json.loads + limit_response_size
+  - streaming: pooled transport + incremental projected parsing
+
+Reports median wall time and peak traced memory per request.
+
+Usage:
+    python agent-builder/benchmarks/bench_openfda_streaming.py [--results 100] [--drugs 25] [--runs 20]
+    python agent-builder/benchmarks/bench_openfda_streaming.py --payload recorded_page.json
+"""
+import argparse
+import gzip
+import importlib.util
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "action", "common"))
+sys.path.insert(0, os.path.join(ROOT, "action", "openfda"))
+
+import dummy_lambda as openfda  # noqa: E402
+
+reference_spec = importlib.util.spec_from_file_location(
+    "openfda_reference", os.path.join(ROOT, "action-examples", "openfda", "dummy_lambda.py")
+)
+reference = importlib.util.module_from_spec(reference_spec)
+reference_spec.loader.exec_module(reference)
+
+
+def synthetic_drug_event_page(num_results, num_drugs, seed=7):
+    """Build a page shaped like /drug/event.json with heavy patient.drug arrays"""
+    rng = random.Random(seed)
+    words = ["tablet", "oral", "hypertension", "ibuprofen", "acetaminophen", "nausea", "headache", "rash"]
+
+    def text(n):
+        return " ".join(rng.choice(words) for _ in range(n))
+
+    results = []
+    for i in range(num_results):
+        drugs = []
+        for _ in range(num_drugs):
+            drugs.append({
+                "medicinalproduct": text(2).upper(),
+                "drugindication": text(3),
+                "drugcharacterization": str(rng.randint(1, 3)),
+                "drugdosagetext": text(12),
+                "drugadministrationroute": str(rng.randint(1, 80)),
+                "openfda": {
+                    "brand_name": [text(2) for _ in range(4)],
+                    "generic_name": [text(2) for _ in range(4)],
+                    "manufacturer_name": [text(3) for _ in range(3)],
+                    "spl_set_id": [f"{rng.getrandbits(64):x}" for _ in range(6)],
+                    "pharm_class_epc": [text(4) for _ in range(3)],
+                },
+            })
+        results.append({
+            "safetyreportid": str(10000000 + i),
+            "receivedate": "20240101",
+            "serious": "1",
+            "seriousnessdeath": "1" if i % 7 == 0 else None,
+            "primarysource": {"qualification": "1", "reportercountry": "US"},
+            "sender": {"senderorganization": "FDA-Public Use"},
+            "patient": {
+                "patientonsetage": str(rng.randint(18, 90)),
+                "patientsex": str(rng.randint(1, 2)),
+                "reaction": [{"reactionmeddrapt": text(2), "reactionoutcome": "1"} for _ in range(12)],
+                "drug": drugs,
+            },
+        })
+    return {
+        "meta": {
+            "disclaimer": "Do not rely on openFDA to make decisions regarding medical care.",
+            "results": {"skip": 0, "limit": num_results, "total": 123456},
+        },
+        "results": results,
+    }
+
+
+def serve(body):
+    """Serve a gzip-encoded body on a local keep-alive server"""
+    compressed = gzip.compress(body)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            payload = compressed if "gzip" in self.headers.get("Accept-Encoding", "") else body
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            if payload is compressed:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            try:
+                self.wfile.write(payload)
+            except (BrokenPipeError, ConnectionResetError):
+                # The streaming client stops reading once it has enough results
+                pass
+
+    class Server(ThreadingHTTPServer):
+        def handle_error(self, request, client_address):
+            pass
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def measure(name, fn, runs):
+    fn()  # warm up (opens the pooled connection)
+    times = []
+    peaks = []
+    for _ in range(runs):
+        tracemalloc.start()
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    print(f"{name:<10} median {statistics.median(times):8.2f} ms   peak memory {statistics.median(peaks) / 1024:9.1f} KiB")
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--results", type=int, default=100, help="results per synthetic page")
+    parser.add_argument("--drugs", type=int, default=25, help="patient.drug entries per result")
+    parser.add_argument("--keep", type=int, default=3, help="results returned to the agent")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--payload", help="recorded /drug/event.json page to serve instead of synthetic data")
+    args = parser.parse_args()
+
+    if args.payload:
+        with open(args.payload, "rb") as f:
+            body = f.read()
+    else:
+        body = json.dumps(synthetic_drug_event_page(args.results, args.drugs)).encode("utf-8")
+
+    server = serve(body)
+    url = f"http://127.0.0.1:{server.server_port}/drug/event.json?limit={args.results}"
+    shape = openfda.PROJECTIONS["drug_event"].shape
+    print(f"Page: {len(body) / 1024:.1f} KiB decoded, keeping {args.keep} results\n")
+
+    def run_reference():
+        return reference.limit_response_size(reference.make_request(url), args.keep, "drug_event")
+
+    def run_pooled():
+        return openfda.limit_response_size(openfda.make_request(url), args.keep, "drug_event")
+
+    def run_streaming():
+        return openfda.limit_response_size(openfda.make_streaming_request(url, shape, args.keep), args.keep, "drug_event")
+
+    assert run_pooled()["results"] == run_streaming()["results"], "streaming output differs from full parse"
+
+    baseline = measure("reference", run_reference, args.runs)
+    measure("pooled", run_pooled, args.runs)
+    streaming = measure("streaming", run_streaming, args.runs)
+    print(f"\nstreaming speedup vs reference: {baseline / streaming:.1f}x")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
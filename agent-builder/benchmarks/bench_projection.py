@@ -0,0 +1,133 @@
+"""
+Microbenchmark: compiled projections vs. the original limit_*_results functions.
+
+The original functions (action-examples/openfda) trim results in place, so each
+run gets its own freshly decoded copy of the page; the compiled projections
+never mutate their input. Decoding time is excluded from both measurements.
+
+Recorded pages can be captured with, for example:
+    curl -s 'https://api.fda.gov/drug/event.json?search=patient.drug.medicinalproduct:ibuprofen&limit=100' > drug_event.json
+    curl -s 'https://api.fda.gov/device/event.json?limit=100' > device_event.json
+    curl -s 'https://api.fda.gov/device/classification.json?limit=100' > classification.json
+    curl -s 'https://api.fda.gov/drug/label.json?limit=100' > generic.json
+
+Usage:
+    python agent-builder/benchmarks/bench_projection.py --payload-dir recorded/ [--runs 200]
+
+Without --payload-dir, synthetic pages with the same structure are used.
+"""
+import argparse
+import copy
+import importlib.util
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "action", "common"))
+sys.path.insert(0, os.path.join(ROOT, "action", "openfda"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dummy_lambda as openfda  # noqa: E402
+from bench_openfda_streaming import synthetic_drug_event_page  # noqa: E402
+
+reference_spec = importlib.util.spec_from_file_location(
+    "openfda_reference", os.path.join(ROOT, "action-examples", "openfda", "dummy_lambda.py")
+)
+reference = importlib.util.module_from_spec(reference_spec)
+reference_spec.loader.exec_module(reference)
+
+ENDPOINT_TYPES = ["drug_event", "device_event", "classification", "generic"]
+
+
+def synthetic_page(endpoint_type, num_results, seed=11):
+    rng = random.Random(seed)
+    if endpoint_type == "drug_event":
+        return synthetic_drug_event_page(num_results, 25, seed)
+    if endpoint_type == "device_event":
+        results = [{
+            "report_number": str(rng.getrandbits(32)),
+            "date_received": "20240102",
+            "event_type": "Malfunction",
+            "mdr_text": [{"text": "x" * 800, "text_type_code": "Description of Event"} for _ in range(4)],
+            "patient": [{"sequence_number_outcome": ["Other"]}],
+            "device": [{
+                "brand_name": "PUMP",
+                "generic_name": "INFUSION PUMP",
+                "device_event_type": "Malfunction",
+                "device_report_product_code": "FRN",
+                "openfda": {"device_name": "Pump", "regulation_number": ["880.5725"]},
+                "manufacturer_d_address_1": "1 MAIN ST",
+            } for _ in range(5)],
+        } for _ in range(num_results)]
+    elif endpoint_type == "classification":
+        results = [{
+            "device_name": "Catheter",
+            "device_class": "2",
+            "medical_specialty_description": "General Hospital",
+            "regulation_number": "880.5200",
+            "product_code": "FOZ",
+            "definition": "y" * 600,
+            "openfda": {"k_number": [f"K{rng.randint(100000, 999999)}" for _ in range(40)]},
+        } for _ in range(num_results)]
+    else:
+        results = [{
+            "id": str(rng.getrandbits(64)),
+            "set_id": str(rng.getrandbits(64)),
+            "effective_time": "20230101",
+            "version": "3",
+            "indications_and_usage": ["z" * 2000],
+            "warnings": ["w" * 4000],
+            "dosage_and_administration": ["d" * 1500],
+            "adverse_reactions": ["a" * 5000],
+            "openfda": {f"field_{i}": [str(i)] * 5 for i in range(20)},
+            "spl_product_data_elements": ["p" * 300],
+            "package_label_principal_display_panel": ["q" * 700],
+        } for _ in range(num_results)]
+    return {"meta": {"results": {"total": 1000}}, "results": results}
+
+
+def load_page(payload_dir, endpoint_type, num_results):
+    if payload_dir:
+        path = os.path.join(payload_dir, f"{endpoint_type}.json")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return f.read(), "recorded"
+    return json.dumps(synthetic_page(endpoint_type, num_results)).encode("utf-8"), "synthetic"
+
+
+def time_runs(fn, inputs):
+    times = []
+    for value in inputs:
+        start = time.perf_counter()
+        fn(value)
+        times.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payload-dir", help="directory with recorded <endpoint_type>.json pages")
+    parser.add_argument("--results", type=int, default=100, help="results per synthetic page")
+    parser.add_argument("--keep", type=int, default=3, help="results kept per response")
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'endpoint':<15}{'source':<11}{'original us':>12}{'compiled us':>13}{'speedup':>9}")
+    for endpoint_type in ENDPOINT_TYPES:
+        raw, source = load_page(args.payload_dir, endpoint_type, args.results)
+        page = json.loads(raw)
+        # The original functions mutate their input, so give every run its own copy
+        copies = [copy.deepcopy(page) for _ in range(args.runs)]
+        legacy_type = None if endpoint_type == "generic" else endpoint_type
+
+        original = time_runs(lambda p: reference.limit_response_size(p, args.keep, legacy_type), copies)
+        compiled = time_runs(lambda p: openfda.limit_response_size(p, args.keep, legacy_type), [page] * args.runs)
+        print(f"{endpoint_type:<15}{source:<11}{original:12.1f}{compiled:13.1f}{original / compiled:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Benchmark: cold start of the web Lambda's secret loading, eager vs. lazy.
+
+Each run starts a fresh Python process (as a Lambda cold start would) against
+a local Secrets Manager stand-in (a small HTTP server speaking the
+GetSecretValue JSON protocol, with --latency ms added per call) and measures:
+  - init:   module import time, before the handler can run
+               eager:      boto3 imported, session and client built and
+                           SERPER_API_KEY + TAVILY_API_KEY fetched one after
+                           the other, as the lambdas did at import time
+               lazy:       secret_provider.SecretProvider created
+  - first:  first use of TAVILY_API_KEY in the handler
+               lazy:       boto3 imported, client built, one secret fetched
+  - warm:   the next use of the secret (cached)
+
+Requires boto3 on the PYTHONPATH.
+
+Usage:
+    python agent-builder/benchmarks/bench_web_secrets.py [--runs 10] [--latency 30]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMON_DIR = os.path.join(ROOT, "action", "common")
+
+SECRETS = {"SERPER_API_KEY": "serper-test-key", "TAVILY_API_KEY": "tvly-test-key"}
+
+# Runs in the child process; prints {"init", "first", "warm"} in milliseconds
+CHILD = r"""
+import json, os, sys, time
+option = sys.argv[1]
+start = time.perf_counter()
+if option == "eager":
+    import boto3
+    def get_from_secretstore_or_env(key):
+        session = boto3.session.Session()
+        secrets_manager = session.client(
+            service_name="secretsmanager", region_name="us-east-1",
+            endpoint_url=os.environ["SECRETS_MANAGER_ENDPOINT"])
+        return secrets_manager.get_secret_value(SecretId=key)["SecretString"]
+    SERPER_API_KEY = get_from_secretstore_or_env("SERPER_API_KEY")
+    TAVILY_API_KEY = get_from_secretstore_or_env("TAVILY_API_KEY")
+    get = lambda: TAVILY_API_KEY
+    first_use = get
+else:
+    from secret_provider import SecretProvider
+    secrets = SecretProvider()
+    get = lambda: secrets.get("TAVILY_API_KEY")
+    first_use = get
+init = time.perf_counter()
+assert first_use() == "tvly-test-key"
+first = time.perf_counter()
+get()
+warm = time.perf_counter()
+print(json.dumps({
+    "init": (init - start) * 1000,
+    "first": (first - init) * 1000,
+    "warm": (warm - first) * 1000,
+}))
+"""
+
+
+def start_server(latency):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            time.sleep(latency / 1000)
+            name = request.get("SecretId")
+            if self.headers.get("X-Amz-Target") == "secretsmanager.GetSecretValue" and name in SECRETS:
+                status = 200
+                body = {"ARN": f"arn:aws:secretsmanager:us-east-1:000000000000:secret:{name}", "Name": name,
+                        "SecretString": SECRETS[name], "VersionId": "1", "VersionStages": ["AWSCURRENT"]}
+            else:
+                status = 400
+                body = {"__type": "ResourceNotFoundException", "Message": f"Secret {name} not found"}
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/x-amz-json-1.1")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def run_child(option, endpoint):
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(filter(None, [COMMON_DIR, os.environ.get("PYTHONPATH")])),
+        PYTHONDONTWRITEBYTECODE="1",
+        SECRETS_MANAGER_ENDPOINT=endpoint,
+        AWS_REGION="us-east-1",
+        AWS_ACCESS_KEY_ID="testing",
+        AWS_SECRET_ACCESS_KEY="testing",
+    )
+    for key in SECRETS:
+        env.pop(key, None)
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, option], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=30, help="added latency per Secrets Manager call in ms")
+    args = parser.parse_args()
+
+    server, endpoint = start_server(args.latency)
+    options = ("eager", "lazy")
+
+    # One untimed run each so all start from a warm page cache
+    for option in options:
+        run_child(option, endpoint)
+
+    results = {option: [] for option in options}
+    for _ in range(args.runs):
+        for option in options:
+            results[option].append(run_child(option, endpoint))
+    server.shutdown()
+
+    print(f"{args.runs} cold starts per option, {args.latency:g} ms per Secrets Manager call")
+    print(f"{'option':<11}{'init ms':>10}{'first use ms':>15}{'warm ms':>10}{'total ms':>11}")
+    for option, runs in results.items():
+        medians = {key: statistics.median(run[key] for run in runs) for key in ("init", "first", "warm")}
+        total = medians["init"] + medians["first"]
+        print(f"{option:<11}{medians['init']:>10.1f}{medians['first']:>15.1f}{medians['warm']:>10.2f}{total:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Shared setup for the action group tests.
+
+The Lambdas import their helpers as top-level modules (the common layer is
+mounted on the path), so the action directories are put on sys.path the same
+way. Each action's dummy_lambda.py is loaded under its own module name with
+load_lambda(), since they share a file name.
+"""
+import importlib.util
+import os
+import sys
+import tempfile
+
+ACTION_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "action")
+
+# Keep the response caches of the modules under test out of /tmp/response-cache
+os.environ.setdefault("RESPONSE_CACHE_DIR", tempfile.mkdtemp(prefix="response-cache-tests-"))
+
+for name in ("common", "clinical", "openfda"):
+    path = os.path.join(ACTION_DIR, name)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def load_lambda(action):
+    """Import action/<action>/dummy_lambda.py as <action>_lambda"""
+    module_name = f"{action}_lambda"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(ACTION_DIR, action, "dummy_lambda.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,169 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from conftest import load_lambda
+
+clinical = load_lambda("clinical")
+
+
+def invoke(api_path, **parameters):
+    event = {
+        "actionGroup": "clinical",
+        "apiPath": api_path,
+        "httpMethod": "GET",
+        "parameters": [{"name": name, "value": value} for name, value in parameters.items()],
+    }
+    response = clinical.lambda_handler(event, None)["response"]
+    return response["httpStatusCode"], json.loads(response["responseBody"]["application/json"]["body"])
+
+
+@pytest.mark.parametrize("api_path", ["/trial_details", "/inclusion_criteria", "/exclusion_criteria"])
+def test_missing_nct_id_is_not_found(monkeypatch, api_path):
+    def fetch_studies(params):
+        raise AssertionError("no request expected")
+
+    monkeypatch.setattr(clinical.study_cache, "fetch_studies", fetch_studies)
+    status, body = invoke(api_path)
+    assert status == 200
+    assert body == {"error": "Trial with NCT ID None not found"}
+
+
+def make_study(nct_id, condition="Asthma"):
+    return {"protocolSection": {
+        "identificationModule": {"nctId": nct_id, "briefTitle": f"{condition} study {nct_id}"},
+        "statusModule": {"overallStatus": "RECRUITING", "lastUpdatePostDateStruct": {"date": "2024-01-01"}},
+        "conditionsModule": {"conditions": [condition]},
+    }}
+
+
+class FakeAPI:
+    def __init__(self, studies):
+        self.studies = {study_id(s): s for s in studies}
+        self.requests = []
+
+    def __call__(self, params):
+        self.requests.append(params)
+        ids = params["filter.ids"].split(",")
+        return {"studies": [self.studies[i] for i in ids if i in self.studies]}
+
+
+def study_id(study):
+    return study["protocolSection"]["identificationModule"]["nctId"]
+
+
+@pytest.fixture
+def local_mirror(tmp_path, monkeypatch):
+    from trials_mirror import TrialsMirror
+
+    local = TrialsMirror(str(tmp_path / "trials.db"))
+    local.upsert([make_study(f"NCT0000000{i}") for i in range(1, 6)])
+    monkeypatch.setattr(clinical.mirror, "get", lambda: local)
+    return local
+
+
+def test_ids_missing_from_mirror_come_from_api(local_mirror, monkeypatch):
+    api = FakeAPI([make_study("NCT00000001"), make_study("NCT00000009")])
+    monkeypatch.setattr(clinical, "fetch_studies_from_api", api)
+    data = clinical.fetch_studies({"format": "json", "filter.ids": "NCT00000001,NCT00000009,NCT00000008"})
+    assert sorted(study_id(s) for s in data["studies"]) == ["NCT00000001", "NCT00000009"]
+    assert [r["filter.ids"] for r in api.requests] == ["NCT00000009,NCT00000008"]
+
+    # Searches are answered by the mirror alone
+    clinical.fetch_studies({"format": "json", "query.cond": "asthma", "filter.ids": "NCT00000009"})
+    assert len(api.requests) == 1
+
+
+def test_mirror_page_tokens_stay_local(local_mirror, monkeypatch):
+    data = clinical.fetch_studies({"format": "json", "query.cond": "asthma", "pageSize": 2})
+    token = data["nextPageToken"]
+    assert token.startswith("mirror:")
+
+    second = clinical.fetch_studies({"format": "json", "query.cond": "asthma", "pageSize": 2, "pageToken": token})
+    assert [study_id(s) for s in second["studies"]] == ["NCT00000003", "NCT00000004"]
+
+    # Without the mirror the token must not be sent upstream
+    monkeypatch.setattr(clinical.mirror, "get", lambda: None)
+    monkeypatch.setattr(clinical, "fetch_studies_from_api", FakeAPI([]))
+    with pytest.raises(clinical.ContinuationError):
+        clinical.fetch_studies({"format": "json", "query.cond": "asthma", "pageSize": 2, "pageToken": token})
+
+
+class Context:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+@pytest.fixture
+def trickle_server():
+    """Studies API stand-in that sends its body a few bytes at a time"""
+    stop = threading.Event()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", "100000")
+            self.end_headers()
+            try:
+                while not stop.is_set():
+                    self.wfile.write(b" " * 16)
+                    self.wfile.flush()
+                    time.sleep(0.02)
+            except OSError:
+                pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/api/v2/studies"
+    stop.set()
+    server.shutdown()
+
+
+def search_results(params):
+    return {"studies": [
+        {"protocolSection": {"identificationModule": {"nctId": f"NCT9900000{i}", "briefTitle": f"Trial {i}"}}}
+        for i in range(3)
+    ]}
+
+
+def test_slow_prefetch_is_capped(trickle_server, monkeypatch):
+    monkeypatch.setattr(clinical, "BASE_URL", trickle_server)
+    monkeypatch.setattr(clinical, "fetch_studies", search_results)
+    monkeypatch.setattr(clinical.mirror, "get", lambda: None)
+    monkeypatch.setattr(clinical, "PREFETCH_TIMEOUT", 0.3)
+    errors = clinical.study_cache.stats()["prefetch_errors"]
+
+    started = time.monotonic()
+    result = clinical.search_trials(disease_area="asthma", context=Context(60_000))
+    elapsed = time.monotonic() - started
+
+    assert len(result["trials"]) == 3
+    assert elapsed < 0.3 + 0.25
+    assert clinical.study_cache.stats()["prefetch_errors"] == errors + 1
+
+
+def test_prefetch_is_skipped_after_a_slow_search(monkeypatch):
+    def slow_search(params):
+        time.sleep(0.1)
+        return search_results(params)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("prefetch not expected")
+
+    monkeypatch.setattr(clinical, "fetch_studies", slow_search)
+    monkeypatch.setattr(clinical.study_cache, "prefetch", fail)
+    monkeypatch.setattr(clinical, "DEADLINE_MARGIN", 0)
+    result = clinical.search_trials(disease_area="copd", context=Context(150))
+    assert len(result["trials"]) == 3
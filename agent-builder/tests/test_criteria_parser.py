@@ -0,0 +1,101 @@
+import pytest
+
+import criteria_parser
+from criteria_parser import EXCLUSION, INCLUSION, has_section, parse, render, texts
+
+
+def test_plain_sections():
+    tree = parse("Inclusion Criteria:\n\n* Age >= 18\n* ECOG 0-1\n\nExclusion Criteria:\n\n* Pregnancy\n* Prior therapy 1")
+    assert tree == [
+        [INCLUSION, None, [[0, "Age >= 18"], [0, "ECOG 0-1"]]],
+        [EXCLUSION, None, [[0, "Pregnancy"], [0, "Prior therapy 1"]]],
+    ]
+    assert render(tree, EXCLUSION) == ["1. Pregnancy", "2. Prior therapy 1"]
+
+
+def test_nested_bullets_titles_and_repeated_sections():
+    tree = parse(
+        "Key Inclusion Criteria:\n\n"
+        "1. Adults aged 18 to 75\n"
+        "2. Confirmed diagnosis of:\n"
+        "   * NSCLC\n"
+        "   * SCLC\n"
+        "      * extensive stage\n"
+        "3. Adequate organ function\n\n"
+        "Key Exclusion Criteria:\n\n"
+        "* Active infection\n"
+        "* Exclusion of pregnancy testing is not allowed\n\n"
+        "INCLUSION CRITERIA FOR COHORT B:\n\n"
+        "* Prior PD-1\n"
+    )
+    assert [(kind, title) for kind, title, _ in tree] == [
+        (INCLUSION, "Key Inclusion Criteria"),
+        (EXCLUSION, "Key Exclusion Criteria"),
+        (INCLUSION, "INCLUSION CRITERIA FOR COHORT B"),
+    ]
+    assert render(tree, INCLUSION) == [
+        "1. Adults aged 18 to 75",
+        "2. Confirmed diagnosis of:",
+        "2.1. NSCLC",
+        "2.2. SCLC",
+        "2.2.1. extensive stage",
+        "3. Adequate organ function",
+        "INCLUSION CRITERIA FOR COHORT B",
+        "4. Prior PD-1",
+    ]
+    # A criterion starting with "Exclusion of" is not a header
+    assert texts(tree, EXCLUSION) == ["Active infection", "Exclusion of pregnancy testing is not allowed"]
+    assert len(texts(tree, INCLUSION)) == len(render(tree, INCLUSION))
+
+
+def test_text_without_headers_is_inclusion():
+    tree = parse("Patients must be over 18.\nNo prior chemotherapy.\nLife expectancy > 3 months")
+    assert render(tree, INCLUSION) == [
+        "1. Patients must be over 18.", "2. No prior chemotherapy.", "3. Life expectancy > 3 months"
+    ]
+    assert not has_section(tree, EXCLUSION)
+    assert render(tree, EXCLUSION) == []
+
+
+def test_emphasis_and_wrapped_lines():
+    tree = parse(
+        "**Inclusion Criteria:**\n\n"
+        "- Histologically confirmed disease\n  spanning two lines\n"
+        "- Measurable disease per RECIST 1.1\n\n"
+        "**Exclusion Criteria:**\n"
+        "- Known brain metastases\n- Creatinine > 1.5 x ULN"
+    )
+    assert texts(tree, INCLUSION) == ["Histologically confirmed disease spanning two lines", "Measurable disease per RECIST 1.1"]
+    assert texts(tree, EXCLUSION) == ["Known brain metastases", "Creatinine > 1.5 x ULN"]
+
+
+def test_colon_lines_and_alpha_roman_markers():
+    tree = parse(
+        "Eligibility Criteria:\n"
+        "DISEASE CHARACTERISTICS:\n* Stage IV\n* Measurable\n"
+        "PATIENT CHARACTERISTICS:\n* Age 18+\n"
+        "Exclusion: none of the above\n a) HIV\n b) HBV\n   i. active\n   ii. chronic\n c) HCV"
+    )
+    assert render(tree, INCLUSION) == [
+        "1. DISEASE CHARACTERISTICS:", "1.1. Stage IV", "1.2. Measurable", "2. PATIENT CHARACTERISTICS:", "2.1. Age 18+"
+    ]
+    assert render(tree, EXCLUSION) == [
+        "1. none of the above", "2. HIV", "3. HBV", "3.1. active", "3.2. chronic", "4. HCV"
+    ]
+
+
+@pytest.mark.parametrize("text, inclusion, exclusion", [
+    ("Inclusion Criteria: Age 18-65, healthy\nExclusion Criteria: Smokers", ["Age 18-65, healthy"], ["Smokers"]),
+    ("Inclusion Criteria:\r\n\r\n* Adults\r\n\r\nExclusion Criteria:\r\n\r\n* Minors", ["Adults"], ["Minors"]),
+    ("", [], []),
+    (None, [], []),
+])
+def test_inline_and_edge_cases(text, inclusion, exclusion):
+    tree = parse(text)
+    assert texts(tree, INCLUSION) == inclusion
+    assert texts(tree, EXCLUSION) == exclusion
+
+
+def test_entries_label_nested_items():
+    tree = [[INCLUSION, None, [[0, "a"], [1, "b"], [1, "c"], [0, "d"], [1, "e"]]]]
+    assert [label for label, _, _ in criteria_parser.entries(tree, INCLUSION)] == ["1.", "1.1.", "1.2.", "2.", "2.1."]
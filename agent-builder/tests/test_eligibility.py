@@ -0,0 +1,65 @@
+from eligibility import LIKELY, POSSIBLE, UNLIKELY, CandidateColumns, compile_predicates, rank
+
+
+def predicates(conditions, inclusion=(), exclusion=(), min_age="18 Years", max_age=None, sex="ALL",
+               healthy_volunteers=False):
+    return compile_predicates(
+        {"minimumAge": min_age, "maximumAge": max_age, "sex": sex, "healthyVolunteers": healthy_volunteers},
+        {"conditions": list(conditions)},
+        list(inclusion),
+        list(exclusion),
+    )
+
+
+TRIALS = [
+    ("NCT-LUNG", predicates(["Non-small Cell Lung Cancer"], inclusion=["Histologically confirmed NSCLC"])),
+    ("NCT-BREAST", predicates(["Breast Cancer"])),
+    ("NCT-LUNG-EXCL", predicates(["Lung Cancer"], exclusion=["Prior pembrolizumab"])),
+    ("NCT-ELDERLY", predicates(["Lung Cancer"], min_age="65 Years")),
+    ("NCT-MEN", predicates(["Lung Cancer"], sex="MALE")),
+    ("NCT-HEALTHY", predicates(["Healthy"], healthy_volunteers=True)),
+]
+
+
+def by_id(results):
+    return {result["nct_id"]: result for result in results}
+
+
+def test_unrelated_conditions_are_not_likely():
+    results = by_id(CandidateColumns(TRIALS).match(age=50, sex="F", conditions=["diabetes"]))
+    assert results["NCT-LUNG"]["likelihood"] == UNLIKELY
+    assert results["NCT-BREAST"]["likelihood"] == UNLIKELY
+    assert results["NCT-LUNG"]["score"] == 0.0
+
+
+def test_condition_match_is_likely_unless_excluded_or_ineligible():
+    results = by_id(CandidateColumns(TRIALS).match(
+        age=50, sex="F", conditions=["lung cancer"], therapies=["pembrolizumab"]
+    ))
+    assert results["NCT-LUNG"]["likelihood"] == LIKELY
+    assert results["NCT-LUNG"]["matched_conditions"] == ["lung cancer"]
+    assert results["NCT-LUNG-EXCL"]["likelihood"] == POSSIBLE
+    assert results["NCT-LUNG-EXCL"]["exclusion_matches"] == [0]
+    assert results["NCT-ELDERLY"]["likelihood"] == UNLIKELY
+    assert results["NCT-ELDERLY"]["age_ok"] is False
+    assert results["NCT-MEN"]["likelihood"] == UNLIKELY
+    assert results["NCT-BREAST"]["likelihood"] == UNLIKELY
+
+
+def test_inclusion_evidence_without_condition_match_is_possible():
+    results = by_id(CandidateColumns(TRIALS).match(age=50, conditions=["NSCLC"]))
+    assert results["NCT-LUNG"]["likelihood"] == POSSIBLE
+    assert results["NCT-LUNG"]["inclusion_matches"] == [0]
+
+
+def test_patient_without_conditions_fits_healthy_volunteer_trials():
+    results = by_id(CandidateColumns(TRIALS).match(age=30))
+    assert results["NCT-HEALTHY"]["likelihood"] == LIKELY
+    assert results["NCT-LUNG"]["likelihood"] == POSSIBLE
+
+
+def test_rank_orders_by_likelihood_then_score():
+    ranked = rank(CandidateColumns(TRIALS).match(age=50, sex="F", conditions=["lung cancer"]))
+    assert [r["nct_id"] for r in ranked][:2] == ["NCT-LUNG", "NCT-LUNG-EXCL"]
+    order = {LIKELY: 0, POSSIBLE: 1, UNLIKELY: 2}
+    assert [order[r["likelihood"]] for r in ranked] == sorted(order[r["likelihood"]] for r in ranked)
@@ -0,0 +1,31 @@
+import pytest
+
+from geo import GridIndex, normalize_lon, rank_closest
+
+
+@pytest.mark.parametrize("lon, expected", [(180, -180), (-180, -180), (190, -170), (-190, 170), (179.5, 179.5)])
+def test_normalize_lon(lon, expected):
+    assert normalize_lon(lon) == pytest.approx(expected)
+
+
+SITES = [
+    ("NCT-EAST", "Fiji, east of the antimeridian", -17.7, 179.9),
+    ("NCT-EDGE", "On the antimeridian", -17.7, 180.0),
+    ("NCT-WEST", "Fiji, west of the antimeridian", -17.7, -179.9),
+    ("NCT-FAR", "Sydney", -33.9, 151.2),
+]
+
+
+@pytest.mark.parametrize("origin_lon", [179.95, -179.95, 180.0, -180.0])
+def test_sites_across_the_antimeridian_are_found_from_either_side(origin_lon):
+    ranked = rank_closest(SITES, -17.7, origin_lon, max_distance_km=100)
+    assert sorted(group for group, _, _ in ranked) == ["NCT-EAST", "NCT-EDGE", "NCT-WEST"]
+    assert all(distance < 20 for _, _, distance in ranked)
+
+
+def test_add_and_extend_use_the_same_cells():
+    single, batch = GridIndex(), GridIndex()
+    for _, _, lat, lon in SITES:
+        single.add(lat, lon)
+    batch.extend([site[2] for site in SITES], [site[3] for site in SITES])
+    assert single.cells == batch.cells
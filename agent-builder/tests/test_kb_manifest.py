@@ -0,0 +1,27 @@
+import os
+
+from kb_manifest import ManifestReader, make_key, write_index
+
+
+def write(path, product_ids, mtime):
+    write_index(str(path), [
+        (make_key("id", product_id), product_id, f"product-summaries/{product_id}.json", 100, "2024-01-01")
+        for product_id in product_ids
+    ])
+    os.utime(path, (mtime, mtime))
+
+
+def test_reader_reopens_without_closing_index_in_use(tmp_path):
+    path = tmp_path / "kb-manifest.idx"
+    write(path, ["p1"], 1_000_000)
+    reader = ManifestReader(str(path))
+    old = reader.get()
+    assert [e["product_id"] for e in old.lookup("id", "p1")] == ["p1"]
+
+    write(path, ["p1", "p2"], 2_000_000)
+    new = reader.get()
+    assert new is not old
+    assert [e["product_id"] for e in new.lookup("id", "p2")] == ["p2"]
+    # A thread still holding the previous index can keep reading it
+    assert [e["product_id"] for e in old.lookup("id", "p1")] == ["p1"]
+    assert reader.get() is new
@@ -0,0 +1,52 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import load_lambda
+
+openfda = load_lambda("openfda")
+
+
+def test_fanout_reports_unfinished_queries(monkeypatch):
+    release = threading.Event()
+    calls = []
+
+    def handle_endpoint(endpoint_path, parameters, endpoint_type):
+        calls.append(endpoint_path)
+        if "label" in endpoint_path:
+            release.wait(5)
+        return {"results": [endpoint_path]}
+
+    monkeypatch.setattr(openfda, "handle_endpoint", handle_endpoint)
+    monkeypatch.setattr(openfda, "FANOUT_DEADLINE", 0.5)
+    try:
+        response = openfda.handle_search_fanout(
+            "/drug/search", [{"name": "query", "value": "aspirin"}]
+        )
+    finally:
+        release.set()
+
+    assert response["meta"]["timed_out"] == ["label"]
+    assert sorted(response["results"]) == ["enforcement", "event", "ndc"]
+
+
+def test_fanout_cancels_queued_queries(monkeypatch):
+    release = threading.Event()
+    calls = []
+
+    def handle_endpoint(endpoint_path, parameters, endpoint_type):
+        calls.append(endpoint_path)
+        release.wait(5)
+        return {}
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(openfda, "handle_endpoint", handle_endpoint)
+    monkeypatch.setattr(openfda, "fanout_executor", executor)
+    monkeypatch.setattr(openfda, "FANOUT_DEADLINE", 0.2)
+    try:
+        response = openfda.handle_search_fanout("/drug/search", [{"name": "query", "value": "aspirin"}])
+    finally:
+        release.set()
+        executor.shutdown(wait=True)
+
+    assert response["meta"]["timed_out"] == ["event", "label", "ndc", "enforcement"]
+    assert len(calls) == 1
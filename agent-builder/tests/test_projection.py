@@ -0,0 +1,68 @@
+import copy
+
+import pytest
+
+from projection import Projection
+
+RECORD = {
+    "id": "r1",
+    "patient": {
+        "age": 40,
+        "sex": "F",
+        "drug": [{"name": f"d{i}", "dose": i, "route": "oral"} for i in range(5)],
+        "reaction": ["nausea", "headache", "rash", "fever"],
+    },
+    "extra": {"a": 1},
+}
+
+
+@pytest.mark.parametrize("paths", [
+    ["patient.drug[:2].name", "patient"],
+    ["patient", "patient.drug[:2].name"],
+])
+def test_whole_field_covers_paths_below_it(paths):
+    assert Projection(paths)(RECORD) == {"patient": RECORD["patient"]}
+
+
+@pytest.mark.parametrize("paths", [
+    ["patient.drug[:2].name", "patient.drug[:3].dose"],
+    ["patient.drug[:3].dose", "patient.drug[:2].name"],
+])
+def test_array_caps_and_fields_are_merged(paths):
+    projected = Projection(paths)(RECORD)
+    assert projected == {"patient": {"drug": [{"name": f"d{i}", "dose": i} for i in range(3)]}}
+
+
+def test_whole_array_elements_cover_field_paths():
+    projected = Projection(["patient.drug[:2].name", "patient.drug[:3]"])(RECORD)
+    assert projected["patient"]["drug"] == RECORD["patient"]["drug"][:3]
+    # Whole elements of every drug is the narrowest shape holding both paths
+    projected = Projection(["patient.drug[:2]", "patient.drug.name"])(RECORD)
+    assert projected["patient"]["drug"] == RECORD["patient"]["drug"]
+
+
+def test_rest_and_counts():
+    projection = Projection(
+        ["id", "patient.*", "patient.drug[:2].name", "patient.reaction[:3]"],
+        counts={"patient.drug": "drug_count_original", "patient.reaction": "reaction_count_original"},
+    )
+    original = copy.deepcopy(RECORD)
+    projected = projection(RECORD)
+    assert RECORD == original
+    assert projected == {
+        "id": "r1",
+        "patient": {
+            "age": 40,
+            "sex": "F",
+            "drug": [{"name": "d0"}, {"name": "d1"}],
+            "drug_count_original": 5,
+            "reaction": ["nausea", "headache", "rash"],
+            "reaction_count_original": 4,
+        },
+    }
+
+
+@pytest.mark.parametrize("path", ["patient.*.drug", "patient.drug[2]", "patient..drug"])
+def test_invalid_paths_are_rejected(path):
+    with pytest.raises(ValueError):
+        Projection([path])
@@ -0,0 +1,102 @@
+import types
+
+import pytest
+
+import rate_governor
+from http_pool import HTTPStatusError
+from rate_governor import RateGovernor, RateLimitExceeded, SharedTokenBucket, TokenBucket
+
+
+class Clock:
+    """Stands in for the time module; sleep() advances the clock"""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_governor, "time", types.SimpleNamespace(
+        time=clock.time, monotonic=clock.monotonic, sleep=clock.sleep
+    ))
+    return clock
+
+
+@pytest.fixture(params=["memory", "shared"])
+def make_bucket(request, tmp_path, clock):
+    def make(rate, burst):
+        if request.param == "memory":
+            return TokenBucket(rate, burst)
+        return SharedTokenBucket(str(tmp_path / "openfda-bucket.json"), rate, burst)
+    return make
+
+
+def test_tokens_refill_at_the_configured_rate(make_bucket, clock):
+    bucket = make_bucket(rate=4, burst=2)
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == pytest.approx(0.25)
+
+    clock.now += 0.25
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == pytest.approx(0.25)
+
+    # Refill stops at the burst size
+    clock.now += 10
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, pytest.approx(0.25)]
+
+
+def test_acquire_waits_for_a_token_then_fails_at_the_deadline(make_bucket, clock):
+    governor = RateGovernor(make_bucket(rate=2, burst=1), deadline_margin=0)
+    assert governor.call(lambda: "first") == "first"
+    assert governor.call(lambda: "second") == "second"
+    assert clock.slept == [pytest.approx(0.5)]
+    assert governor.stats()["paced"] == 1
+
+    governor.set_deadline(200)
+    with pytest.raises(RateLimitExceeded):
+        governor.call(lambda: "third")
+
+
+def test_governors_on_one_file_share_the_budget(tmp_path, clock):
+    path = str(tmp_path / "shared" / "openfda-bucket.json")
+    first = SharedTokenBucket(path, rate=1, burst=3)
+    second = SharedTokenBucket(path, rate=1, burst=3)
+    assert [first.try_acquire(), second.try_acquire(), first.try_acquire()] == [0.0, 0.0, 0.0]
+    assert second.try_acquire() == pytest.approx(1.0)
+    assert first.try_acquire() == pytest.approx(1.0)
+
+
+def test_throttling_pauses_every_governor_on_the_file(tmp_path, clock):
+    path = str(tmp_path / "openfda-bucket.json")
+    first = RateGovernor(SharedTokenBucket(path, rate=10, burst=10))
+    second = SharedTokenBucket(path, rate=10, burst=10)
+    seen_by_second = []
+
+    def fn():
+        if not seen_by_second:
+            seen_by_second.append(None)
+            raise HTTPStatusError(429, "Too Many Requests", {"retry-after": "3"}, b"")
+        return "ok"
+
+    def sleep(seconds):
+        # While the first governor waits out the pause, the other worker is held back too
+        seen_by_second.append(second.try_acquire())
+        clock.now += seconds
+
+    rate_governor.time.sleep = sleep
+    assert first.call(fn) == "ok"
+    assert seen_by_second[1] == pytest.approx(3.0)
+    assert first.stats()["throttled"] == 1
@@ -0,0 +1,55 @@
+import os
+
+import response_cache
+from response_cache import FRESH, TieredCache
+
+
+def disk_usage(cache):
+    return sum(os.path.getsize(os.path.join(cache.disk_dir, name)) for name in os.listdir(cache.disk_dir))
+
+
+def make_cache(tmp_path, disk_max_bytes):
+    return TieredCache("test", memory_max_bytes=0, disk_max_bytes=disk_max_bytes, disk_dir=str(tmp_path))
+
+
+def test_disk_tier_stays_within_budget_and_scans_rarely(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, 100_000)
+    scans = []
+    real_scandir = os.scandir
+    monkeypatch.setattr(response_cache.os, "scandir", lambda path: scans.append(path) or real_scandir(path))
+
+    for i in range(500):
+        cache.set(f"key-{i}", "x" * 400, 60)
+        assert disk_usage(cache) <= 100_000
+
+    # One scan on the first write, then only when the running total goes over budget
+    assert len(scans) < 25
+    assert cache.stats()["disk_evictions"] > 0
+    assert cache.get("key-499") == ("x" * 400, FRESH)
+
+
+def test_overwrites_are_not_counted_twice(tmp_path):
+    cache = make_cache(tmp_path, 10_000)
+    for _ in range(100):
+        cache.set("key", "x" * 400, 60)
+    assert cache._disk_bytes == disk_usage(cache)
+    assert cache.stats()["disk_evictions"] == 0
+
+
+def test_trim_continues_past_files_it_cannot_remove(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, 10_000)
+    for i in range(20):
+        cache.set(f"key-{i}", "x" * 400, 60)
+    stuck = cache._disk_path("key-0")
+    real_remove = os.remove
+
+    def remove(path):
+        if path == stuck:
+            raise PermissionError(path)
+        real_remove(path)
+
+    monkeypatch.setattr(response_cache.os, "remove", remove)
+    for i in range(20, 40):
+        cache.set(f"key-{i}", "x" * 400, 60)
+    assert os.path.exists(stuck)
+    assert disk_usage(cache) <= 10_000
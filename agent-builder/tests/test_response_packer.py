@@ -0,0 +1,74 @@
+import json
+import random
+
+import pytest
+
+from response_packer import MIN_ITEM_BYTES, TRUNCATION_MARKER, fit, pack
+
+
+def make_results(count, text_size, seed=0):
+    rng = random.Random(seed)
+    alphabet = "abc def \"quoted\" \\ back\nnew é ü 漢字 \t"
+    return [
+        {
+            "id": f"r{i}",
+            "date": "20240101",
+            "tags": [f"t{j}" for j in range(rng.randint(0, 30))],
+            "text": "".join(rng.choice(alphabet) for _ in range(rng.randint(0, text_size))),
+            "nested": {"score": rng.random(), "notes": ["x" * rng.randint(0, 500) for _ in range(3)]},
+        }
+        for i in range(count)
+    ]
+
+
+def test_small_payload_is_unchanged():
+    payload = {"meta": {"total": 1}, "results": make_results(2, 50)}
+    text, report = pack(payload)
+    assert report is None
+    assert json.loads(text) == payload
+
+
+@pytest.mark.parametrize("budget", [1024, 4096, 20 * 1024])
+@pytest.mark.parametrize("seed", range(5))
+def test_output_fits_budget_and_is_valid_json(budget, seed):
+    payload = {"meta": {"total": 500, "query": "aspirin"}, "results": make_results(60, 3000, seed)}
+    text, report = pack(payload, budget)
+    assert len(text.encode("utf-8")) <= budget
+    packed = json.loads(text)
+    assert packed["truncation"] == report
+    assert report["packed_bytes"] <= budget
+    assert report["original_bytes"] == len(json.dumps(payload, separators=(",", ":")))
+    assert report["truncated_count"] >= len(report["truncated"]) > 0
+
+
+def test_small_fields_are_kept_whole_and_large_ones_cut():
+    payload = {"id": "NCT00000001", "status": "RECRUITING", "summary": "word " * 2000}
+    packed, report = fit(payload, 2048)
+    assert packed["id"] == "NCT00000001"
+    assert packed["status"] == "RECRUITING"
+    assert packed["summary"].endswith(TRUNCATION_MARKER)
+    assert report["truncated"] == ["summary"]
+
+
+def test_arrays_keep_a_prefix_and_report_the_rest():
+    payload = {"results": [{"id": i, "text": "x" * 1000} for i in range(50)]}
+    packed, report = fit(payload, 8192)
+    ids = [result["id"] for result in packed["results"]]
+    assert ids == list(range(len(ids)))
+    assert 0 < len(ids) <= 8192 // MIN_ITEM_BYTES
+    assert f"results[{len(ids)}:50]" in report["truncated"]
+
+
+def test_cut_never_splits_an_escape():
+    for length in range(100, 140):
+        payload = {"text": "é\n\"" * 200}
+        text, _ = pack(payload, length + 640)
+        assert json.loads(text)["text"].endswith(TRUNCATION_MARKER)
+
+
+def test_list_payload_returns_report_separately():
+    payload = make_results(40, 2000)
+    text, report = pack(payload, 4096)
+    assert len(text) <= 4096
+    assert isinstance(json.loads(text), list)
+    assert report["truncated_count"] > 0
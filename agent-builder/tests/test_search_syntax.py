@@ -0,0 +1,43 @@
+import pytest
+
+from search_syntax import SearchSyntaxError, normalize
+
+
+@pytest.mark.parametrize("search, expected", [
+    # Unparenthesized AND/OR mixes keep their order (Lucene has no AND precedence)
+    ("z:1 OR x:1 AND y:1", "z:1 OR x:1 AND y:1"),
+    ("x:1 AND y:1 OR z:1", "x:1 AND y:1 OR z:1"),
+    # Parenthesized groups stay parenthesized and may be sorted
+    ("(y:1 AND x:1) OR z:1", "(x:1 AND y:1) OR z:1"),
+    ("z:1 AND (y:1 OR x:1)", "(x:1 OR y:1) AND z:1"),
+    ("NOT (b:1 OR a:1)", "NOT (a:1 OR b:1)"),
+    # Pure AND / OR is commutative
+    ("b:1 OR a:1 OR b:1", "a:1 OR b:1"),
+    ("b:1 AND a:1", "a:1 AND b:1"),
+])
+def test_mixed_and_or_keeps_meaning(search, expected):
+    assert normalize(search) == expected
+    assert normalize(expected) == expected
+
+
+@pytest.mark.parametrize("search, expected", [
+    ("openfda.brand_name:lipitor+AND+openfda.generic_name:atorvastatin",
+     "openfda.brand_name:lipitor AND openfda.generic_name:atorvastatin"),
+    ("receivedate:[2004-01-01+TO+2008-12-31]", "receivedate:[20040101 TO 20081231]"),
+    # "+" that belongs to a value or a phrase is kept
+    ("brand_name:C++", 'brand_name:"c++"'),
+    ("brand_name:C++ AND route:oral", 'brand_name:"c++" AND route:oral'),
+    ('reaction:"a+b"', 'reaction:"a+b"'),
+])
+def test_plus_separates_terms_only(search, expected):
+    assert normalize(search) == expected
+    assert normalize(expected) == expected
+
+
+def test_equivalent_spellings_share_a_form():
+    assert normalize('openfda.brand_name:"LIPITOR"') == normalize("openfda.brand_name:lipitor")
+
+
+def test_unbalanced_parentheses_are_rejected():
+    with pytest.raises(SearchSyntaxError):
+        normalize("(a:1 OR b:1")
@@ -0,0 +1,113 @@
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+import secret_provider
+from secret_provider import SecretProvider
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class StubClient:
+    """secretsmanager client stand-in returning "<key>-v<n>" on the n-th fetch of a key"""
+
+    def __init__(self, block=None):
+        self.calls = []
+        self.block = block
+        self.lock = threading.Lock()
+
+    def get_secret_value(self, SecretId):
+        with self.lock:
+            self.calls.append(SecretId)
+            version = self.calls.count(SecretId)
+        if self.block is not None:
+            self.block.wait(5)
+        return {"SecretString": f"{SecretId}-v{version}"}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(secret_provider, "time", types.SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+def test_env_var_is_returned_without_boto3(monkeypatch):
+    monkeypatch.setenv("TEST_API_KEY", "from-env")
+    monkeypatch.delitem(sys.modules, "boto3", raising=False)
+    provider = SecretProvider()
+    assert provider.get("TEST_API_KEY") == "from-env"
+    assert provider.get("TEST_API_KEY") == "from-env"
+    assert "boto3" not in sys.modules
+    assert provider._client is None
+    assert provider.stats()["env"] == 2
+
+
+def test_fresh_hit_is_served_from_memory(clock):
+    client = StubClient()
+    provider = SecretProvider(ttl=60, stale_ttl=60, client=client)
+    assert provider.get("KEY") == "KEY-v1"
+    clock.now += 59
+    assert provider.get("KEY") == "KEY-v1"
+    assert client.calls == ["KEY"]
+    stats = provider.stats()
+    assert (stats["fetches"], stats["hits"]) == (1, 1)
+
+
+def test_stale_value_is_served_while_one_refresh_runs(clock):
+    client = StubClient()
+    provider = SecretProvider(ttl=60, stale_ttl=60, client=client)
+    provider.get("KEY")
+
+    client.block = threading.Event()
+    clock.now += 90
+    assert [provider.get("KEY") for _ in range(5)] == ["KEY-v1"] * 5
+    assert provider.stats()["refreshes"] == 1
+
+    client.block.set()
+    deadline = time.monotonic() + 5
+    while provider._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client.calls == ["KEY", "KEY"]
+    assert provider.get("KEY") == "KEY-v2"
+
+
+def test_expired_value_is_fetched_in_the_foreground(clock):
+    client = StubClient()
+    provider = SecretProvider(ttl=60, stale_ttl=60, client=client)
+    provider.get("KEY")
+    clock.now += 121
+    assert provider.get("KEY") == "KEY-v2"
+    assert provider.stats()["refreshes"] == 0
+
+
+def test_concurrent_first_use_fetches_once(clock):
+    client = StubClient(block=threading.Event())
+    provider = SecretProvider(client=client)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(provider.get("KEY"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    client.block.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["KEY-v1"] * 8
+    assert client.calls == ["KEY"]
+
+
+def test_fetch_errors_propagate(clock):
+    class FailingClient:
+        def get_secret_value(self, SecretId):
+            raise RuntimeError("denied")
+
+    with pytest.raises(RuntimeError):
+        SecretProvider(client=FailingClient()).get("KEY")
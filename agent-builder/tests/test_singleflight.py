@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+CALLERS = 8
+
+
+def run_concurrently(flight, key, fn):
+    """Call flight.do(key, fn) from CALLERS threads; returns (results, errors)"""
+    results, errors = [], []
+    lock = threading.Lock()
+
+    def caller():
+        try:
+            result = flight.do(key, fn)
+        except Exception as e:
+            with lock:
+                errors.append(e)
+        else:
+            with lock:
+                results.append(result)
+
+    threads = [threading.Thread(target=caller) for _ in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+def blocking_fn(flight, outcome):
+    """fn that waits until every caller has joined the flight, then returns or raises outcome"""
+    calls = []
+
+    def fn():
+        calls.append(1)
+        deadline = time.monotonic() + 5
+        while flight.stats()["calls"] < CALLERS and time.monotonic() < deadline:
+            time.sleep(0.005)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return fn, calls
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight("test")
+    value = {"answer": 42}
+    fn, calls = blocking_fn(flight, value)
+    results, errors = run_concurrently(flight, "key", fn)
+
+    assert len(calls) == 1
+    assert errors == []
+    assert all(result is value for result, _ in results)
+    assert sorted(shared for _, shared in results) == [False] + [True] * (CALLERS - 1)
+    stats = flight.stats()
+    assert (stats["leaders"], stats["coalesced"], stats["in_flight"]) == (1, CALLERS - 1, 0)
+
+
+def test_error_reaches_every_waiter():
+    flight = SingleFlight("test")
+    error = ValueError("upstream failed")
+    fn, calls = blocking_fn(flight, error)
+    results, errors = run_concurrently(flight, "key", fn)
+
+    assert len(calls) == 1
+    assert results == []
+    assert len(errors) == CALLERS
+    assert all(e is error for e in errors)
+    assert flight.stats()["shared_errors"] == CALLERS - 1
+
+
+def test_key_is_released_after_completion():
+    flight = SingleFlight("test")
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return len(calls)
+
+    assert flight.do("key", fn) == (1, False)
+    assert flight.do("key", fn) == (2, False)
+    with pytest.raises(KeyError):
+        flight.do("key", lambda: {}["missing"])
+    assert flight.do("key", fn) == (3, False)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_waiter_calls_directly_after_timeout():
+    flight = SingleFlight("test", wait_timeout=0.05)
+    release = threading.Event()
+    leader = threading.Thread(target=lambda: flight.do("key", lambda: release.wait(5) and "slow"))
+    leader.start()
+    while flight.stats()["in_flight"] == 0:
+        time.sleep(0.001)
+    try:
+        assert flight.do("key", lambda: "direct") == ("direct", False)
+        assert flight.stats()["wait_timeouts"] == 1
+    finally:
+        release.set()
+        leader.join(5)
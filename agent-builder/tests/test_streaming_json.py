@@ -0,0 +1,127 @@
+import json
+
+import pytest
+
+from projection import Projection
+from streaming_json import parse_page
+
+RESULTS = [
+    {
+        "safetyreportid": "10003",
+        "serious": 1,
+        "receivedate": "20240101",
+        "patient": {
+            "patientonsetage": -12.5e-3,
+            "patientsex": None,
+            "drug": [
+                {"medicinalproduct": "ASPIRIN \"BAYER\"", "drugindication": "pain\\fever\n", "dose": 81},
+                {"medicinalproduct": "café 💊", "drugindication": "☃ snow", "dose": 1.5e2},
+                {"medicinalproduct": "TYLENOL", "drugindication": "[not {a} bracket]", "dose": 500},
+            ],
+            "reaction": [{"reactionmeddrapt": "NAUSEA"}, {"reactionmeddrapt": "RASH"}, {"reactionmeddrapt": "HEADACHE"},
+                         {"reactionmeddrapt": "FEVER"}],
+            "summary": {"narrativeincludeclinical": "a,b:c]}\"\\/"},
+        },
+        "flags": [True, False, None, 0, -0.0, 12345678901234567890],
+    },
+    {"safetyreportid": "10004", "serious": 2, "patient": {"drug": [], "reaction": []}, "flags": []},
+]
+META = {"disclaimer": "Do not rely on openFDA", "results": {"skip": 0, "limit": 2, "total": 2}}
+
+PROJECTION = Projection(
+    [
+        "receivedate", "safetyreportid", "serious",
+        "patient.*",
+        "patient.drug[:2].medicinalproduct",
+        "patient.drug[:2].drugindication",
+        "patient.reaction[:3]",
+    ],
+    counts={"patient.drug": "drug_count_original", "patient.reaction": "reaction_count_original"},
+)
+
+
+def encode(meta_first=True, ensure_ascii=True, separators=(", ", ": ")):
+    page = {"meta": META, "results": RESULTS} if meta_first else {"results": RESULTS, "meta": META}
+    return json.dumps(page, ensure_ascii=ensure_ascii, separators=separators).encode("utf-8")
+
+
+def split_reader(body, *cuts):
+    """read(size) returning body in pieces ending at the given offsets, whatever size is asked"""
+    bounds = [0, *cuts, len(body)]
+    pieces = [body[a:b] for a, b in zip(bounds, bounds[1:])]
+
+    def read(size):
+        return pieces.pop(0) if pieces else b""
+    return read
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+@pytest.mark.parametrize("meta_first", [True, False])
+def test_every_two_way_split_matches_json_loads(meta_first, ensure_ascii):
+    body = encode(meta_first, ensure_ascii)
+    expected = json.loads(body)
+    for cut in range(1, len(body)):
+        page, parser = parse_page(split_reader(body, cut))
+        assert page == expected, f"cut at {cut}: {body[max(0, cut - 10):cut]!r}|{body[cut:cut + 10]!r}"
+        assert parser.complete
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 64])
+def test_small_chunks_with_capped_projection(chunk_size):
+    body = encode(separators=(",", ":"))
+    expected = {"meta": META, "results": [PROJECTION(result) for result in json.loads(body)["results"]]}
+    offset = 0
+
+    def read(size):
+        nonlocal offset
+        chunk = body[offset:offset + size]
+        offset += len(chunk)
+        return chunk
+
+    page, _ = parse_page(read, PROJECTION.shape, chunk_size=chunk_size)
+    assert page == expected
+    assert page["results"][0]["patient"]["drug_count_original"] == 3
+    assert page["results"][0]["patient"]["reaction_count_original"] == 4
+    assert len(page["results"][0]["patient"]["drug"]) == 2
+
+
+def test_projection_at_every_split():
+    body = encode()
+    expected = [PROJECTION(result) for result in RESULTS]
+    for cut in range(1, len(body)):
+        page, _ = parse_page(split_reader(body, cut), PROJECTION.shape)
+        assert page["results"] == expected, f"cut at {cut}"
+
+
+@pytest.mark.parametrize("token", [
+    b"\\ud83d\\udc8a",  # surrogate pair
+    b"\\u00e9",
+    b'\\"BAYER\\"',
+    b"\\\\fever\\n",
+    b"12345678901234567890",
+    b"-0.0125",
+    b"150.0",
+    b"null",
+    b"true",
+    b"false",
+])
+def test_cuts_inside_tokens(token):
+    body = encode()
+    start = body.index(token)
+    expected = json.loads(body)
+    for cut in range(start + 1, start + len(token)):
+        assert parse_page(split_reader(body, cut - 1, cut, cut + 1))[0] == expected
+
+
+def test_stops_early_once_enough_results_are_read():
+    body = encode(separators=(",", ":"))
+    page, parser = parse_page(split_reader(body, *range(16, len(body), 16)), max_results=1)
+    assert page == {"meta": META, "results": [RESULTS[0]]}
+    assert not parser.complete
+    assert parser.bytes_read < len(body)
+
+
+def test_truncated_body_raises():
+    body = encode()
+    with pytest.raises(ValueError):
+        parse_page(split_reader(body[:len(body) // 2]))
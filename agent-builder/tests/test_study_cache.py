@@ -0,0 +1,96 @@
+import pytest
+
+from response_cache import TieredCache
+from study_cache import StudyCache
+
+
+def make_study(nct_id, version="2024-01-01"):
+    return {"protocolSection": {
+        "identificationModule": {"nctId": nct_id, "briefTitle": f"Study {nct_id}"},
+        "statusModule": {"lastUpdatePostDateStruct": {"date": version}},
+    }}
+
+
+class FakeRegistry:
+    def __init__(self, nct_ids):
+        self.studies = {nct_id: make_study(nct_id) for nct_id in nct_ids}
+        self.requests = []
+
+    def fetch_studies(self, params):
+        self.requests.append(params)
+        ids = params["filter.ids"].split(",")
+        return {"studies": [self.studies[i] for i in ids if i in self.studies]}
+
+
+@pytest.fixture
+def registry():
+    return FakeRegistry(["NCT00000001", "NCT00000002", "NCT00000003"])
+
+
+@pytest.fixture
+def cache(registry):
+    return StudyCache(
+        registry.fetch_studies,
+        lambda study: {"title": study["protocolSection"]["identificationModule"]["briefTitle"]},
+        fields=["protocolSection.identificationModule.briefTitle"],
+        cache=TieredCache("test-studies", disk_dir=None),
+    )
+
+
+def test_get_many_batches_and_marks_missing(cache, registry):
+    records = cache.get_many(["nct00000001", "NCT00000002", "NCT99999999"])
+    assert sorted(records) == ["NCT00000001", "NCT00000002"]
+    assert len(registry.requests) == 1
+    assert cache.get("NCT00000001")["title"] == "Study NCT00000001"
+    assert len(registry.requests) == 1
+
+
+def test_prefetch_is_synchronous_and_counts_hits(cache, registry):
+    assert cache.prefetch(["NCT00000001", "NCT00000002"]) == 2
+    assert len(registry.requests) == 1
+    # The membership check does not count as cache lookups
+    assert cache.cache.stats()["misses"] == 0
+
+    assert cache.get("NCT00000001") is not None
+    assert len(registry.requests) == 1
+    stats = cache.stats()
+    assert stats["prefetched"] == 2
+    assert stats["prefetch_hits"] == 1
+    assert stats["prefetch_pending"] == 1
+
+    # Already cached studies are not fetched again
+    assert cache.prefetch(["NCT00000001"]) == 0
+    assert len(registry.requests) == 1
+
+
+def test_unused_prefetch_counts_as_wasted(cache):
+    cache.ttl = 0
+    cache.prefetch(["NCT00000003"])
+    stats = cache.stats()
+    assert stats["prefetch_wasted"] == 1
+    assert stats["prefetch_hit_rate"] == 0.0
+
+
+def test_prefetch_failure_is_counted_not_raised(cache):
+    def failing(params):
+        raise TimeoutError("budget exceeded")
+
+    assert cache.prefetch(["NCT00000001"], fetch_studies=failing) == 0
+    assert cache.stats()["prefetch_errors"] == 1
+
+
+def test_tiered_cache_contains_does_not_count():
+    tiered = TieredCache("test-contains", disk_dir=None)
+    tiered.set("a", {"x": 1}, ttl=60)
+    assert tiered.contains("a")
+    assert not tiered.contains("b")
+    stats = tiered.stats()
+    assert stats["hits"] == 0 and stats["misses"] == 0
+
+
+def test_empty_ids_are_skipped(cache, registry):
+    assert cache.get(None) is None
+    assert cache.get("") is None
+    records = cache.get_many([None, "", "nct00000001"])
+    assert list(records) == ["NCT00000001"]
+    assert [r["filter.ids"] for r in registry.requests] == ["NCT00000001"]
@@ -0,0 +1,43 @@
+import pytest
+
+from study_pages import ContinuationError, collect, query_fingerprint
+
+
+def fake_registry(count):
+    studies = [{"id": i} for i in range(count)]
+    requests = []
+
+    def fetch_studies(params):
+        requests.append(params)
+        start = int(params.get("pageToken") or 0)
+        end = start + params["pageSize"]
+        data = {"studies": studies[start:end]}
+        if end < count:
+            data["nextPageToken"] = str(end)
+        return data
+
+    return fetch_studies, requests
+
+
+PARAMS = {"format": "json", "query.cond": "asthma", "fields": "NCTId,BriefTitle"}
+
+
+def test_fingerprint_ignores_field_projection():
+    assert query_fingerprint(PARAMS) == query_fingerprint(dict(PARAMS, fields="NCTId,BriefTitle,BriefSummary"))
+    assert query_fingerprint(PARAMS) != query_fingerprint(dict(PARAMS, **{"query.cond": "copd"}))
+    assert query_fingerprint(PARAMS, ["phase"]) != query_fingerprint(PARAMS, ["date"])
+
+
+def test_continuation_survives_a_change_of_fields():
+    fetch_studies, requests = fake_registry(25)
+    first, token, _ = collect(fetch_studies, PARAMS, limit=7, page_size=10)
+    assert [s["id"] for s in first] == list(range(7))
+
+    # e.g. the next page is requested with include_summary toggled
+    summary_params = dict(PARAMS, fields="NCTId,BriefTitle,BriefSummary")
+    second, token, _ = collect(fetch_studies, summary_params, limit=7, page_size=10, continuation=token)
+    assert [s["id"] for s in second] == list(range(7, 14))
+    assert requests[-1]["fields"] == "NCTId,BriefTitle,BriefSummary"
+
+    with pytest.raises(ContinuationError):
+        collect(fetch_studies, dict(PARAMS, **{"query.cond": "copd"}), limit=7, page_size=10, continuation=token)
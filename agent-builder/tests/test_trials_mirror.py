@@ -0,0 +1,51 @@
+from trials_mirror import TrialsMirror
+
+
+def make_study(nct_id, conditions, title, status="RECRUITING"):
+    return {"protocolSection": {
+        "identificationModule": {"nctId": nct_id, "briefTitle": title},
+        "statusModule": {"overallStatus": status, "lastUpdatePostDateStruct": {"date": "2024-01-01"}},
+        "conditionsModule": {"conditions": conditions},
+    }}
+
+
+def nct_ids(data):
+    return [s["protocolSection"]["identificationModule"]["nctId"] for s in data["studies"]]
+
+
+def make_mirror(tmp_path):
+    mirror = TrialsMirror(str(tmp_path / "trials.db"))
+    mirror.upsert([
+        # Older registration, asthma only mentioned in passing
+        make_study("NCT00000001", ["COPD", "Emphysema", "Chronic Bronchitis"],
+                   "Inhaler technique in COPD, emphysema and chronic bronchitis patients, excluding asthma"),
+        make_study("NCT00000002", ["Diabetes"], "Insulin pump study"),
+        make_study("NCT00000003", ["Asthma"], "Asthma control in severe asthma", status="COMPLETED"),
+        make_study("NCT00000004", ["Asthma", "Allergic Asthma"], "Biologic therapy for asthma"),
+    ])
+    return mirror
+
+
+def test_text_search_ranks_strong_matches_first(tmp_path):
+    data = make_mirror(tmp_path).studies({"query.cond": "asthma", "countTotal": "true"})
+    ids = nct_ids(data)
+    assert ids.index("NCT00000004") < ids.index("NCT00000001")
+    assert ids.index("NCT00000003") < ids.index("NCT00000001")
+    assert ids[-1] == "NCT00000001"
+    assert data["totalCount"] == 3
+
+
+def test_ranked_pages_do_not_overlap(tmp_path):
+    mirror = make_mirror(tmp_path)
+    first = mirror.studies({"query.cond": "asthma", "pageSize": 2})
+    second = mirror.studies({"query.cond": "asthma", "pageSize": 2, "pageToken": first["nextPageToken"]})
+    assert nct_ids(first) + nct_ids(second) == nct_ids(mirror.studies({"query.cond": "asthma"}))
+    assert "nextPageToken" not in second
+
+
+def test_lookups_without_text_are_in_nct_id_order(tmp_path):
+    mirror = make_mirror(tmp_path)
+    data = mirror.studies({"filter.ids": "NCT00000004,NCT00000001,NCT00000003"})
+    assert nct_ids(data) == ["NCT00000001", "NCT00000003", "NCT00000004"]
+    data = mirror.studies({"query.cond": "asthma", "filter.overallStatus": "RECRUITING"})
+    assert set(nct_ids(data)) == {"NCT00000001", "NCT00000004"}